@@ -0,0 +1,3 @@
+"""Offline benchmarks for collect. Run a module with python -m from the
+repository root, e.g. python -m benchmarks.tree, or the whole suite with
+make bench."""
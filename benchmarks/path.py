@@ -0,0 +1,64 @@
+"""Time Path construction and common operations, and measure the memory
+held by each Path instance."""
+import argparse
+import gc
+import timeit
+import tracemalloc
+
+from collect.path import Path
+
+
+def instance_size(n_paths, touch=False):
+    """Return the average number of bytes allocated per Path over n_paths
+    distinct instances. If touch, parts and hash are computed first."""
+    names = ['image%d.jpg' % n_path for n_path in range(n_paths)]
+    parent = Path('/home/user/.cache/collect')
+    gc.collect()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    paths = [parent.join(name) for name in names]
+
+    if touch:
+        for path in paths:
+            path.parts
+            hash(path)
+
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (after - before) / len(paths)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--number', type=int, default=100000)
+    args = parser.parse_args(argv)
+
+    namespace = {
+        'Path': Path,
+        'parent': Path('/home/user/.cache/collect'),
+        'child': Path('/home/user/.cache/collect/image.jpg'),
+    }
+    statements = [
+        ('Path(str)', "Path('/home/user/.cache/collect/image.jpg')"),
+        ('Path(Path)', 'Path(child)'),
+        ('join', "parent.join('image.jpg')"),
+        ('/', "parent / 'image.jpg'"),
+        ('parent', 'child.parent'),
+        ('abspath', 'child.abspath()'),
+        ('hash', 'hash(child)'),
+        ('basename', 'child.basename'),
+        ('in', 'child in parent'),
+    ]
+
+    for name, statement in statements:
+        seconds = min(timeit.repeat(
+            statement, globals=namespace, number=args.number, repeat=3))
+        print('%-12s %8.0f ns' % (name, seconds / args.number * 1e9))
+
+    print('%-12s %8.0f bytes' % ('instance', instance_size(args.number)))
+    print('%-12s %8.0f bytes' % (
+        'with parts', instance_size(args.number, touch=True)))
+
+
+if __name__ == '__main__':
+    main()
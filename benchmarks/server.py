@@ -0,0 +1,239 @@
+"""Local stand-in for the Reddit listing API and the image hosts it links
+to, for running collect without a network connection.
+
+Listings are served at any path ending in .json. Every page holds the same
+number of link posts and names the next page until the last one. Images
+are served at /img/<page>-<n>.jpg (or .gif), with a body that starts with
+the right magic bytes, with an ETag and support for Range requests.
+Responses can be delayed, a share of them can fail with 503 Service
+Unavailable, and a share of images can break off halfway."""
+import argparse
+import hashlib
+import http.server
+import json
+import random
+import sys
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+__all__ = ['FakeReddit']
+
+_MAGIC = {
+    'jpg': b'\xff\xd8\xff\xe0',
+    'gif': b'GIF89a',
+}
+
+_CONTENT_TYPES = {
+    'jpg': 'image/jpeg',
+    'gif': 'image/gif',
+}
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, status, content_type, body, headers=(), cut=False):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+
+        for header in headers:
+            self.send_header(*header)
+
+        self.end_headers()
+
+        if cut:
+            # Break the connection halfway through the body.
+            self.wfile.write(body[:len(body) // 2])
+            self.close_connection = True
+        else:
+            self.wfile.write(body)
+
+    def send_image(self, name):
+        server = self.server.fake
+        ext = name.rpartition('.')[2]
+        body = server.image(name)
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+        headers = [('ETag', etag), ('Accept-Ranges', 'bytes')]
+        status = 200
+        byte_range = self.headers.get('Range', '')
+        if_range = self.headers.get('If-Range', etag)
+
+        if byte_range.startswith('bytes=') and if_range == etag:
+            start = int(byte_range[len('bytes='):].partition('-')[0])
+
+            if start >= len(body):
+                self.send_body(416, 'text/plain', b'Range Not Satisfiable',
+                               [('Content-Range', 'bytes */%d' % len(body))])
+                return
+
+            headers.append(('Content-Range', 'bytes %d-%d/%d'
+                            % (start, len(body) - 1, len(body))))
+            status = 206
+            body = body[start:]
+
+        cut = bool(server.cut_rate) and server.random() < server.cut_rate
+        self.send_body(status, _CONTENT_TYPES.get(ext, 'text/plain'), body,
+                       headers, cut)
+
+    def do_GET(self):
+        server = self.server.fake
+        server.count_request()
+
+        if server.latency:
+            time.sleep(server.latency)
+
+        if server.error_rate and server.random() < server.error_rate:
+            self.send_body(503, 'text/plain', b'Service Unavailable')
+            return
+
+        parts = urlsplit(self.path)
+
+        if parts.path.endswith('.json'):
+            after = parse_qs(parts.query).get('after', [None])[0]
+            body = json.dumps(server.listing(after)).encode()
+            self.send_body(200, 'application/json', body)
+        elif parts.path.startswith('/img/'):
+            self.send_image(parts.path[len('/img/'):])
+        else:
+            self.send_body(404, 'text/plain', b'Not Found')
+
+
+class _Server(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # collect drops connections when it cancels downloads.
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class FakeReddit:
+    """Fake Reddit listing and image server on a free local port.
+
+    Each page has per_page posts and there are pages of them. gif_ratio is
+    the share of posts that link to a gif, which collect rejects. Images
+    are image_size bytes, or a size drawn from an (min, max) range. Every
+    response is delayed by latency seconds, error_rate is the share of them
+    answered with 503, and cut_rate is the share of image responses whose
+    connection is closed halfway through the body. The content only depends
+    on seed."""
+
+    def __init__(self, per_page=25, pages=4, gif_ratio=0.1,
+                 image_size=(200 * 1024, 2 * 1024 * 1024), latency=0,
+                 error_rate=0, cut_rate=0, seed=0):
+        self.per_page = per_page
+        self.pages = pages
+        self.gif_ratio = gif_ratio
+        self.image_size = image_size
+        self.latency = latency
+        self.error_rate = error_rate
+        self.cut_rate = cut_rate
+        self.seed = seed
+        self.n_requests = 0
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._server = _Server(('127.0.0.1', 0), _Handler)
+        self._server.fake = self
+        self._thread = None
+
+    @property
+    def url(self):
+        """The base URL to use as config.REDDIT_API."""
+        return 'http://%s:%d/' % self._server.server_address
+
+    def random(self):
+        with self._lock:
+            return self._random.random()
+
+    def count_request(self):
+        with self._lock:
+            self.n_requests += 1
+
+    def listing(self, after=None):
+        """Return the decoded listing page that follows the post named
+        after."""
+        page = 0 if after is None else int(after.rpartition('_')[2]) + 1
+        page_random = random.Random('%s-%d' % (self.seed, page))
+        children = []
+
+        for n_post in range(self.per_page):
+            ext = 'gif' if page_random.random() < self.gif_ratio else 'jpg'
+            children.append({
+                'kind': 't3',
+                'data': {
+                    'url': '%simg/%d-%d.%s' % (self.url, page, n_post, ext),
+                    'title': 'Post %d on page %d' % (n_post, page),
+                    'permalink': '/r/fake/comments/%d_%d/' % (page, n_post),
+                },
+            })
+
+        return {
+            'kind': 'Listing',
+            'data': {
+                'after': 't3_%d' % page if page + 1 < self.pages else None,
+                'children': children,
+            },
+        }
+
+    def image(self, name):
+        """Return the body of the image file name."""
+        ext = name.rpartition('.')[2]
+        image_random = random.Random('%s-%s' % (self.seed, name))
+
+        if isinstance(self.image_size, int):
+            size = self.image_size
+        else:
+            size = image_random.randint(*self.image_size)
+
+        magic = _MAGIC.get(ext, b'')
+        return magic + image_random.randbytes(max(size - len(magic), 0))
+
+    def start(self):
+        """Serve in a background thread and return self."""
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--per-page', type=int, default=25)
+    parser.add_argument('--pages', type=int, default=4)
+    parser.add_argument('--gif-ratio', type=float, default=0.1)
+    parser.add_argument('--image-size', type=int, default=512 * 1024)
+    parser.add_argument('--latency', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0)
+    parser.add_argument('--cut-rate', type=float, default=0)
+    args = parser.parse_args(argv)
+
+    with FakeReddit(
+        per_page=args.per_page, pages=args.pages, gif_ratio=args.gif_ratio,
+        image_size=args.image_size, latency=args.latency,
+        error_rate=args.error_rate, cut_rate=args.cut_rate,
+    ) as server:
+        print('Serving on %s' % server.url, flush=True)
+
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Check the startup cost of the offline subcommands, and of reddit when
+collect prefetch has an image ready. Each one is run with python -X
+importtime against a scratch directory. A subcommand fails the
+check if it imports the network stack or if importing collect takes longer
+than the budget. The exit status is the number of failed subcommands."""
+import argparse
+import subprocess
+import sys
+import tempfile
+import time
+
+from collect.index import Index
+
+NETWORK_MODULES = frozenset({
+    'praw', 'prawcore', 'requests', 'urllib3', 'http.client', 'ssl',
+})
+
+
+def run_importtime(argv):
+    """Run python -X importtime -m collect argv. Return the wall time, the
+    cumulative microseconds spent importing the collect package, and the set
+    of imported module names."""
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-m', 'collect'] + argv,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        universal_newlines=True)
+    wall_time = time.perf_counter() - start
+    collect_us = 0
+    modules = set()
+
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+
+        _, cumulative, name = line.split('|')
+        name = name.strip()
+        modules.add(name)
+
+        if name == 'collect':
+            collect_us = int(cumulative)
+
+    return wall_time, collect_us, modules
+
+
+def spool_image(directory, listing):
+    """Put an image in directory and spool it as collect prefetch would."""
+    fname = 'spooled.jpg'
+
+    with open('%s/%s' % (directory, fname), 'wb') as file:
+        file.write(b'\xff\xd8\xff\xe0' + bytes(1024))
+
+    index = Index.open(directory)
+    index.add(fname, url='https://i.redd.it/spooled.jpg', listing=listing)
+    index.spool(fname, listing, 'Spooled', '/r/spooled/')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--budget', type=float, default=50,
+        help='Milliseconds allowed for importing collect. Default 50')
+    args = parser.parse_args(argv)
+    n_failed = 0
+
+    with tempfile.TemporaryDirectory() as directory:
+        spool_image(directory, 'r/spooled')
+
+        for subcommand in [['reddit', '--url', 'r/spooled'], ['random'],
+                           ['clear']]:
+            wall_time, collect_us, modules = run_importtime(
+                ['--dir', directory, '--no-daemon'] + subcommand)
+            network = sorted(modules & NETWORK_MODULES)
+            failed = network or collect_us / 1000 > args.budget
+            n_failed += bool(failed)
+            print('%-8s %s wall %6.1f ms  import collect %6.1f ms  network %s'
+                  % (subcommand[0], 'FAIL' if failed else 'ok  ',
+                     wall_time * 1000, collect_us / 1000,
+                     ', '.join(network) or 'none'))
+
+    return n_failed
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,305 @@
+"""Run the offline benchmark suite and write the results as JSON, or compare
+two result files.
+
+Every case runs against a local FakeReddit server or synthetic collection
+folders in a scratch directory, so nothing touches the network or the real
+collection. Each result is the best of --repeat runs, in seconds per
+operation, so lower is better everywhere. Save the results of two commits
+with --output and compare them with --compare OLD NEW, which exits with
+status 1 if any case got slower by more than --threshold."""
+import argparse
+import asyncio
+import fnmatch
+import functools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+from collect import config
+from collect.aio import AsyncCollect
+from collect.collect import Collect
+from collect.logger import Logger
+from collect.path import Path
+
+from .server import FakeReddit
+from .tree import best_of, make_tree
+
+__all__ = ['CASES', 'compare', 'run']
+
+
+def _scratch(root, name):
+    path = tempfile.mkdtemp(prefix=name.replace('/', '-') + '-', dir=root)
+    return Collect(path)
+
+
+def _bench_listing(args, root, name, collect_images):
+    server = FakeReddit(
+        per_page=25, pages=-(-args.images * 2 // 25),
+        gif_ratio=args.gif_ratio, image_size=args.image_size,
+        latency=args.latency, error_rate=args.error_rate)
+    old_api = config.REDDIT_API
+    n_bytes = []
+
+    def run_once():
+        directory = _scratch(root, name)
+        images = collect_images(
+            directory, cache=directory.listing_cache(ttl=0, stale=0))
+        n_bytes.append(sum(os.path.getsize(image) for image in images))
+
+    with server:
+        config.REDDIT_API = server.url
+
+        try:
+            seconds = best_of(args.repeat, run_once)
+        finally:
+            config.REDDIT_API = old_api
+
+    return {
+        'seconds': seconds / args.images,
+        'images_per_second': args.images / seconds,
+        'mb_per_second': max(n_bytes) / 1e6 / seconds,
+        'requests': server.n_requests,
+    }
+
+
+def bench_listing(args, root):
+    """RedditListingWrapper end to end: fetch the listing pages and download
+    args.images images from the fake server."""
+    def collect_images(directory, cache):
+        return list(directory.collect_many(
+            'r/fake/hot', args.images, workers=args.workers, cache=cache,
+            pages=None))
+
+    return _bench_listing(args, root, 'listing', collect_images)
+
+
+def bench_listing_async(args, root):
+    """bench_listing() through collect.aio on one event loop."""
+    async def collect_async(directory, cache):
+        return [image async for image in AsyncCollect(directory).collect_many(
+            'r/fake/hot', args.images, cache=cache, pages=None,
+            workers=args.workers)]
+
+    def collect_images(directory, cache):
+        return asyncio.run(collect_async(directory, cache))
+
+    return _bench_listing(args, root, 'listing-async', collect_images)
+
+
+def bench_random_index(args, root, n_files):
+    """Collect.random() through the Index in a flat folder."""
+    directory = _scratch(root, 'random')
+    make_tree(directory, n_files, n_files)
+    start = time.perf_counter()
+    directory.index.refresh()
+    build_seconds = time.perf_counter() - start
+    number = 1000
+    seconds = min(timeit.repeat(
+        directory.random, number=number, repeat=args.repeat)) / number
+    return {'seconds': seconds, 'index_build_seconds': build_seconds}
+
+
+def bench_random_scan(args, root, n_files):
+    """Collect.scan_random() in a flat folder."""
+    directory = _scratch(root, 'scan')
+    make_tree(directory, n_files, n_files)
+    number = max(1, 100000 // n_files)
+    seconds = min(timeit.repeat(
+        directory.scan_random, number=number, repeat=args.repeat)) / number
+    return {'seconds': seconds}
+
+
+def bench_tree(args, root, n_files):
+    """Path.tree over a nested folder, per path."""
+    directory = _scratch(root, 'tree')
+    make_tree(directory, n_files, 100)
+    n_paths = sum(1 for _ in directory.tree)
+    seconds = best_of(args.repeat, lambda: sum(1 for _ in directory.tree))
+    return {'seconds': seconds / n_paths, 'paths': n_paths}
+
+
+def _bench_removal(args, root, n_files, name, remove):
+    timings = []
+
+    for _ in range(args.repeat):
+        directory = _scratch(root, name)
+        make_tree(directory, n_files, 100)
+        start = time.perf_counter()
+        remove(directory)
+        timings.append(time.perf_counter() - start)
+
+    return {'seconds': min(timings) / n_files}
+
+
+def bench_remove_contents(args, root, n_files):
+    """Path.remove_contents() of a nested folder, per file."""
+    return _bench_removal(
+        args, root, n_files, 'remove', lambda directory:
+        Path.remove_contents(directory))
+
+
+def bench_clear(args, root, n_files):
+    """Collect.remove_contents(wait=True) of a nested folder, per file."""
+    return _bench_removal(
+        args, root, n_files, 'clear', lambda directory:
+        directory.remove_contents(wait=True))
+
+
+def bench_clear_return(args, root, n_files):
+    """Time until Collect.remove_contents() returns, per file. The files are
+    deleted afterwards in the background."""
+    return _bench_removal(
+        args, root, n_files, 'clear-return', lambda directory:
+        directory.remove_contents())
+
+
+def bench_path(args, root):
+    """Path construction and joining."""
+    number = 100000
+    namespace = {
+        'Path': Path,
+        'parent': Path('/home/user/.cache/collect'),
+    }
+    results = {}
+
+    for name, statement in [
+        ('str', "Path('/home/user/.cache/collect/image.jpg')"),
+        ('join', "parent.join('image.jpg')"),
+    ]:
+        results[name] = min(timeit.repeat(
+            statement, globals=namespace, number=number,
+            repeat=args.repeat)) / number
+
+    return {'seconds': results['str'], 'join_seconds': results['join']}
+
+
+def _sized(func):
+    name = func.__name__[len('bench_'):]
+    return lambda sizes: [
+        ('%s/%d' % (name, n_files), functools.partial(func, n_files=n_files))
+        for n_files in sizes
+    ]
+
+
+# Each entry returns [(case name, case function)] for the folder sizes.
+CASES = [
+    lambda sizes: [('listing', bench_listing)],
+    lambda sizes: [('listing/async', bench_listing_async)],
+    _sized(bench_random_index),
+    _sized(bench_random_scan),
+    _sized(bench_tree),
+    _sized(bench_remove_contents),
+    _sized(bench_clear),
+    _sized(bench_clear_return),
+    lambda sizes: [('path', bench_path)],
+]
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL, universal_newlines=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    """Run the cases matching args.only and return the results document."""
+    Logger.setLevel('ERROR')
+    results = {}
+
+    # Folders cleared in the background may still be going when it ends.
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as root:
+        for case in CASES:
+            for name, func in case(args.sizes):
+                if args.only and not any(
+                    fnmatch.fnmatch(name, pattern) for pattern in args.only
+                ):
+                    continue
+
+                result = results[name] = func(args, root)
+                print('%-28s %12.3f us' % (name, result['seconds'] * 1e6),
+                      flush=True)
+
+    return {
+        'commit': _commit(),
+        'time': time.time(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'options': {
+            key: value for key, value in vars(args).items()
+            if key not in ('output', 'compare')
+        },
+        'results': results,
+    }
+
+
+def compare(old, new, threshold):
+    """Print how each case common to two results documents changed. Return
+    the number of cases that got slower by more than threshold."""
+    n_slower = 0
+
+    for name in sorted(old['results'].keys() & new['results'].keys()):
+        ratio = (new['results'][name]['seconds']
+                 / old['results'][name]['seconds'])
+        slower = ratio > 1 + threshold
+        n_slower += slower
+        print('%-28s %7.2fx %s' % (
+            name, ratio,
+            'SLOWER' if slower else 'faster' if ratio < 1 - threshold else ''))
+
+    return n_slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--sizes', type=int, nargs='+', default=[1000, 100000],
+        help='Numbers of files in the synthetic folders. '
+             'Default 1000 100000')
+    parser.add_argument(
+        '--only', metavar='PATTERN', action='append',
+        help='Only run cases whose names match the glob pattern.')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', '-o', metavar='FILE')
+    parser.add_argument(
+        '--compare', nargs=2, metavar=('OLD', 'NEW'),
+        help='Compare two result files instead of running the cases.')
+    parser.add_argument(
+        '--threshold', type=float, default=0.1,
+        help='Share by which a case may get slower. Default 0.1')
+
+    server = parser.add_argument_group('fake server')
+    server.add_argument('--images', type=int, default=40)
+    server.add_argument('--workers', type=int, default=config.WORKERS)
+    server.add_argument('--latency', type=float, default=0.005)
+    server.add_argument('--error-rate', type=float, default=0)
+    server.add_argument('--gif-ratio', type=float, default=0.1)
+    server.add_argument('--image-size', type=int, default=256 * 1024)
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        documents = []
+
+        for file_name in args.compare:
+            with open(file_name) as file:
+                documents.append(json.load(file))
+
+        return int(compare(*documents, args.threshold) > 0)
+
+    document = run(args)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(document, file, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,78 @@
+"""Compare Path.tree against the recursive os.listdir walker it replaced on a
+synthetic directory tree."""
+import argparse
+import os
+import tempfile
+import time
+
+from collect.path import Path
+
+
+def listdir_tree(path):
+    """Path.tree as it was before Path.walk."""
+    yield path
+
+    for item in map(path.join, os.listdir(path)):
+        if item.is_dir() and not item.is_link():
+            try:
+                yield from listdir_tree(item)
+            except PermissionError:
+                pass
+        else:
+            yield item
+
+
+def make_tree(root, n_files, per_dir, fanout=10):
+    """Fill root with n_files empty files, per_dir files to a directory. The
+    k-th directory is nested by the base fanout digits of k."""
+    for n_dir in range(0, -(-n_files // per_dir)):
+        digits = []
+
+        while n_dir:
+            n_dir, digit = divmod(n_dir, fanout)
+            digits.append('d%d' % digit)
+
+        directory = os.path.join(root, *reversed(digits))
+        os.makedirs(directory, exist_ok=True)
+
+        for n_file in range(per_dir):
+            open(os.path.join(directory, 'f%d.jpg' % n_file), 'wb').close()
+
+
+def best_of(repeat, func):
+    """Return the fastest of repeat timings of func()."""
+    timings = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    return min(timings)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--files', type=int, default=100000)
+    parser.add_argument('--per-dir', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as root:
+        make_tree(root, args.files, args.per_dir)
+        path = Path(root)
+        n_paths = sum(1 for _ in path.tree)
+
+        for name, func in [
+            ('listdir_tree', lambda: sum(1 for _ in listdir_tree(path))),
+            ('Path.tree', lambda: sum(1 for _ in path.tree)),
+            ('Path.walk(entries=True)',
+             lambda: sum(1 for _ in path.walk(entries=True))),
+        ]:
+            seconds = best_of(args.repeat, func)
+            print('%-24s %8.3fs %10.0f paths/s'
+                  % (name, seconds, n_paths / seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,39 +1,122 @@
 """Entry point for command line script."""
 import argparse
+import collections.abc
 import contextlib
 import shlex
-import subprocess
 import sys
 import time
 
+from . import background
 from . import collect
 from . import config
+from .index import EVICTION_POLICIES
+from .layout import LAYOUTS
 from .logger import Logger
+from .metrics import Metrics
+from . import probe
 from . import __doc__
 
+try:
+    from . import daemon
+except ImportError:
+    daemon = None
+
 __all__ = ['CollectParser', 'main']
 
 
-def wait_for_connection(n_tries=10, seconds_wait=5, ip_address='8.8.8.8'):
-    """Return whether or not a test ping was successful."""
-    count_flag = '-n' if config.WINDOWS else '-c'
-
-    for n_try in range(n_tries):
-        ping = subprocess.Popen(
-            ['ping', count_flag, str(1), '-w', str(1), ip_address],
-            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-        )
-        ping.communicate()
-        if ping.wait():
-            Logger.warning('Connection not found')
-            time.sleep(seconds_wait)
-        elif n_try:
-            Logger.warning('Connection found')
-            return True
-        else:
-            return True
-    else:  # no break; really no internet connection
-        return False
+def weighted_url(value):
+    """Parse a URL[#WEIGHT] command line argument into (url, weight)."""
+    url, sep, weight = value.rpartition('#')
+
+    if not sep:
+        return value, 1
+
+    try:
+        weight = float(weight)
+    except ValueError:
+        raise argparse.ArgumentTypeError('invalid weight: %r' % weight)
+
+    if weight < 0:
+        raise argparse.ArgumentTypeError('negative weight: %r' % weight)
+
+    return url, weight
+
+
+def positive_int(value):
+    """Parse a command line argument that must be a whole number of at least
+    1."""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError('invalid number: %r' % value)
+
+    if number < 1:
+        raise argparse.ArgumentTypeError('must be at least 1: %r' % value)
+
+    return number
+
+
+_SIZE_UNITS = {'': 1, 'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+
+
+def byte_size(value):
+    """Parse a SIZE[K|M|G|T] command line argument into a number of bytes."""
+    number = value.upper().rstrip('B')
+    unit = number[-1:] if number[-1:] in _SIZE_UNITS else ''
+
+    try:
+        size = float(number[:len(number) - len(unit)])
+    except ValueError:
+        raise argparse.ArgumentTypeError('invalid size: %r' % value)
+
+    if size < 0:
+        raise argparse.ArgumentTypeError('negative size: %r' % value)
+
+    return int(size * _SIZE_UNITS[unit])
+
+
+def add_listing_arguments(parser):
+    """Add the arguments of the subcommands that download from listings."""
+    parser.add_argument(
+        '--url', '-u', metavar='URL[#WEIGHT]', dest='reddit_url',
+        action='append', type=weighted_url,
+        help='Set the URL for the Reddit API listing. Repeat to draw '
+             'from several listings, each WEIGHT times as often as '
+             'others (default 1). Default %s' % config.REDDIT_URL)
+    parser.add_argument(
+        '--jobs', '-j', metavar='N', dest='workers', type=positive_int,
+        default=config.WORKERS,
+        help='Set the number of images to download at once. '
+             'Default %d' % config.WORKERS)
+    parser.add_argument(
+        '--pages', '-p', metavar='N', dest='pages', type=int,
+        default=config.LISTING_PAGES,
+        help='Walk up to N pages of each listing, fetching each page only '
+             'when needed. Default %d' % config.LISTING_PAGES)
+    parser.add_argument(
+        '--cache-ttl', metavar='SECONDS', dest='cache_ttl', type=float,
+        default=config.LISTING_TTL,
+        help='Reuse a fetched listing for this long. '
+             'Default %d' % config.LISTING_TTL)
+    parser.add_argument(
+        '--max-size', metavar='SIZE', dest='max_size', type=byte_size,
+        default=config.MAX_SIZE,
+        help='Evict images once the folder holds more than SIZE bytes '
+             '(K, M, G and T suffixes are accepted).')
+    parser.add_argument(
+        '--max-files', metavar='N', dest='max_files', type=int,
+        default=config.MAX_FILES,
+        help='Evict images once the folder holds more than N of them.')
+    parser.add_argument(
+        '--evict', dest='eviction', choices=EVICTION_POLICIES,
+        default=config.EVICTION,
+        help='Evict the least recently served (lru), least often served '
+             '(lfu) or first added (oldest) images first. '
+             'Default %s' % config.EVICTION)
+    parser.add_argument(
+        '--no-probe', action='store_false', dest='probe',
+        help='Skip the connection check and fail on the first request '
+             'instead.')
 
 
 @contextlib.contextmanager
@@ -57,8 +140,12 @@ class CollectParser(argparse.ArgumentParser):
         super().__init__(*args, description=description, **kwargs)
         self.subcommands = {
             'reddit': self.reddit,
+            'prefetch': self.prefetch,
             'random': self.random,
-            'clear': self.clear}
+            'clear': self.clear,
+            'dedupe': self.dedupe,
+            'migrate': self.migrate,
+            'daemon': self.daemon}
         commands = super().add_subparsers(
             title='Subcommands', dest='subcommand',
             parser_class=argparse.ArgumentParser)
@@ -77,37 +164,120 @@ class CollectParser(argparse.ArgumentParser):
             '--no-repeat', '-r', action='store_true', dest='no_repeat',
             help='Fail if each URL in the listing has been downloaded.')
         reddit.add_argument(
-            '--url', '-u', metavar='URL', dest='reddit_url',
-            default=config.REDDIT_URL,
-            help='Set the URL for the Reddit API listing. '
-                 'Default %s' % config.REDDIT_URL)
+            '--count', '-c', metavar='N', dest='count', type=positive_int,
+            default=1,
+            help='Collect up to N new images, printing each path as soon as '
+                 'it is saved.')
+        reddit.add_argument(
+            '--no-spool', action='store_false', dest='spool',
+            help='Download an image now even if collect prefetch has some '
+                 'ready.')
+        add_listing_arguments(reddit)
+
+        prefetch = commands.add_parser(
+            'prefetch',
+            description='Download images ahead of time so that collect '
+                        'reddit can print one at once. Run it from cron or '
+                        'a timer; collect reddit also starts it in the '
+                        'background once it has used up a prefetched image.')
+        prefetch.add_argument(
+            '--spool', '-k', metavar='N', dest='spool_size', type=int,
+            default=config.SPOOL_SIZE,
+            help='Keep N images ready. Default %d' % config.SPOOL_SIZE)
+        add_listing_arguments(prefetch)
 
         commands.add_parser(
             'random',
             description='Print out a random image path in the collection '
                         'folder.')
 
-        commands.add_parser(
+        clear = commands.add_parser(
             'clear',
             description='Clear the image directory.')
+        clear.add_argument(
+            '--wait', '-w', action='store_true', dest='wait',
+            help='Delete the old images before returning instead of in the '
+                 'background.')
+
+        dedupe = commands.add_parser(
+            'dedupe',
+            description='Store images with the same contents once by hard '
+                        'linking their file names to one copy.')
+        dedupe.add_argument(
+            '--jobs', '-j', metavar='N', dest='workers', type=positive_int,
+            default=config.WORKERS,
+            help='Set the number of files to hash at once. '
+                 'Default %d' % config.WORKERS)
+
+        migrate = commands.add_parser(
+            'migrate',
+            description='Move the images into another layout while collect '
+                        'goes on using the folder. Run it again to finish a '
+                        'migration that was interrupted.')
+        migrate.add_argument(
+            '--layout', '-l', dest='layout', choices=LAYOUTS,
+            default='sharded',
+            help='Keep the images directly in the folder (flat) or spread '
+                 'over 256 folders named after a hash of their file names '
+                 '(sharded). Default sharded')
+
+        commands.add_parser(
+            'daemon',
+            description='Keep collect loaded and answer the reddit, random '
+                        'and clear subcommands over a Unix socket in the '
+                        'collection folder.')
 
         super().add_argument(
             '--dir', metavar='PATH', dest='collector',
             default=config.DIRECTORY, type=collect.Collect,
             help='Set the download location. Default %s' % config.DIRECTORY)
+        super().add_argument(
+            '--no-daemon', action='store_false', dest='use_daemon',
+            help='Run in this process even if a daemon is running.')
+        super().add_argument(
+            '--metrics', metavar='FILE', dest='metrics',
+            help='Write the time spent in each phase of the run and counts '
+                 'of what happened in it to FILE as JSON. The command runs '
+                 'in this process.')
+        super().add_argument(
+            '--prometheus', metavar='FILE', dest='prometheus',
+            help='Write the same metrics to FILE for the Prometheus node '
+                 'exporter\'s textfile collector. The command runs in this '
+                 'process.')
+        super().add_argument(
+            '--profile', action='store_true', dest='profile',
+            help='Write a CPU profile of the command in pstats and callgrind '
+                 'formats to the .collect/profiles folder of the collection '
+                 'folder. The command runs in this process.')
+        super().add_argument(
+            '--profile-memory', metavar='N', dest='profile_memory', type=int,
+            default=0,
+            help='Also write the N lines that allocated the most memory '
+                 'still held at the end of the command there.')
         super().add_argument(
             '-v', action='count',
             help='Set verbosity level.')
         super().set_defaults(exit=0)
 
-    def parse_args(self, argv=None, *args, **kwargs):
+    @staticmethod
+    def split_argv(argv=None):
+        """Return argv as a list, defaulting to the script's arguments."""
         if argv is None:
-            argv = sys.argv[1:]
+            return sys.argv[1:]
         elif isinstance(argv, str):
-            argv = shlex.split(argv)
+            return shlex.split(argv)
+        else:
+            return list(argv)
 
-        args = super().parse_args(argv, *args, **kwargs)
+    def parse_command(self, argv=None, *args, **kwargs):
+        """Parse the arguments without running the subcommand."""
+        return super().parse_args(self.split_argv(argv), *args, **kwargs)
 
+    def parse_args(self, argv=None, *args, **kwargs):
+        return self.run(self.parse_command(argv, *args, **kwargs))
+
+    def run(self, args):
+        """Run the subcommand named by parsed arguments."""
         if isinstance(args.v, int):
             if args.v > 2:
                 args.v = 2
@@ -129,16 +299,51 @@ class CollectParser(argparse.ArgumentParser):
                 super().print_help(file=sys.stderr)
             else:
                 super().print_usage(file=sys.stderr)
+        elif args.profile or args.profile_memory:
+            from . import profiling
+
+            with profiling.profiled(
+                args.collector, args.subcommand, cpu=args.profile,
+                memory_top=args.profile_memory,
+            ):
+                self.run_subcommand(args, subcommand_func)
         else:
-            args.collector.mkdir(exist_ok=True)
-            path = subcommand_func(args)
+            self.run_subcommand(args, subcommand_func)
+
+        return args
+
+    def run_subcommand(self, args, subcommand_func):
+        """Run the subcommand and print the paths it returns."""
+        Metrics.reset()
+        args.collector.mkdir(exist_ok=True)
+        path = subcommand_func(args)
+
+        if isinstance(path, collections.abc.Iterator):
+            n_paths = 0
 
-            if path is not None:
-                print(path)
-            elif args.subcommand != 'clear':
+            for n_paths, path in enumerate(path, 1):
+                print(path, flush=True)
+
+            if not n_paths:
                 args.exit = 1
+        elif path is not None:
+            print(path)
+        elif args.subcommand not in (
+            'prefetch', 'clear', 'dedupe', 'migrate', 'daemon'
+        ):
+            args.exit = 1
 
-        return args
+        self.write_metrics(args)
+
+    def write_metrics(self, args):
+        """Write the metrics of the run where the arguments ask for them."""
+        try:
+            if args.metrics:
+                Metrics.write_json(args.metrics)
+            if args.prometheus:
+                Metrics.write_prometheus(args.prometheus)
+        except OSError as error:
+            Logger.error('Could not write metrics: %s', error)
 
     def reddit(self, args):
         flags = collect.NO_REPEAT if args.no_repeat else collect.FAIL
@@ -149,30 +354,206 @@ class CollectParser(argparse.ArgumentParser):
         if args.new:
             flags |= collect.NEW
 
-        if not wait_for_connection():
-            Logger.error('Could not connect to the internet')
-            if args.all:
-                return self.random(args)
-            else:
-                args.exit = 1
-                return
+        listings = dict(args.reddit_url or [(config.REDDIT_URL, 1)])
+        spooled = self.unspool(args, listings) if args.spool else []
+
+        if len(spooled) == args.count:
+            return spooled[0] if args.count == 1 else iter(spooled)
+        elif spooled:
+            return self.reddit_after_spool(args, flags, listings, spooled)
+        else:
+            return self.reddit_now(args, flags, listings)
 
-        listing = args.collector.reddit_listing(args.reddit_url)
+    def reddit_now(self, args, flags, listings):
+        """Collect from the listings over the network."""
+        if not self.connected(args):
+            return self.offline(args, 'Connection check failed')
+
+        try:
+            cache = args.collector.listing_cache(ttl=args.cache_ttl)
+            listing = args.collector.reddit_listing(
+                listings, cache, args.pages, max_size=args.max_size,
+                max_files=args.max_files, eviction=args.eviction)
+        except ConnectionError as error:
+            return self.offline(args, error)
+
+        if args.count > 1:
+            return self.reddit_many(args, listing, flags)
 
         with log_exceptions(args, FileNotFoundError, RuntimeError):
-            return listing.flags_next_recover(flags)
+            return listing.flags_next_recover(flags, args.workers)
+
+    def reddit_many(self, args, listing, flags):
+        """Generate up to args.count image paths and log the throughput."""
+        start = time.perf_counter()
+        n_images = n_bytes = 0
+
+        with log_exceptions(args, FileNotFoundError, RuntimeError):
+            for image_path, post in listing.flags_iter_recover(
+                flags, args.count, args.workers
+            ):
+                if post is not None and post.size is not None:
+                    n_images += 1
+                    n_bytes += post.size
+
+                yield image_path
+
+        seconds = time.perf_counter() - start
+        Logger.info(
+            'Downloaded %d images (%.1f MB) in %.1fs: %.2f images/s, '
+            '%.2f MB/s', n_images, n_bytes / 1e6, seconds,
+            n_images / seconds, n_bytes / 1e6 / seconds)
+
+    def reddit_after_spool(self, args, flags, listings, spooled):
+        """Generate the spooled image paths, then collect the rest of
+        args.count over the network."""
+        yield from spooled
+        args.count -= len(spooled)
+        paths = self.reddit_now(args, flags, listings)
+
+        if isinstance(paths, collections.abc.Iterator):
+            yield from paths
+        elif paths is not None:
+            yield paths
+
+        args.exit = 0
+
+    def unspool(self, args, listings):
+        """Return the paths of up to args.count images that collect prefetch
+        has ready, and refill the spool in the background if it runs
+        low."""
+        paths = []
+
+        while len(paths) < args.count:
+            image_path = args.collector.unspool(
+                listings, args.max_size, args.max_files, args.eviction)
+
+            if image_path is None:
+                break
+
+            paths.append(image_path)
+
+        self.refill(args, listings)
+        return paths
+
+    def refill(self, args, listings):
+        """Start collect prefetch in the background with the same options if
+        the spool holds fewer images than it last kept."""
+        index = args.collector.index
+        spool_size = index.spool_size
+
+        if (not spool_size
+                or sum(index.spool_counts(listings).values()) >= spool_size):
+            return
+
+        argv = ['--dir', args.collector, '--no-daemon', 'prefetch',
+                '--spool', str(spool_size), '--jobs', str(args.workers),
+                '--cache-ttl', str(args.cache_ttl), '--evict', args.eviction]
+
+        for url, weight in listings.items():
+            argv += ['--url', '%s#%s' % (url, weight)]
+
+        if args.pages is not None:
+            argv += ['--pages', str(args.pages)]
+        if args.max_size is not None:
+            argv += ['--max-size', str(args.max_size)]
+        if args.max_files is not None:
+            argv += ['--max-files', str(args.max_files)]
+        if not args.probe:
+            argv.append('--no-probe')
+
+        Logger.debug('Refilling the spool in the background')
+        background.start(__package__, *argv)
+
+    def prefetch(self, args):
+        listings = dict(args.reddit_url or [(config.REDDIT_URL, 1)])
+
+        if not self.connected(args):
+            Logger.error('Could not connect to the internet (%s)',
+                         'Connection check failed')
+            args.exit = 1
+            return
+
+        try:
+            n_spooled = args.collector.prefetch(
+                listings, args.spool_size, args.workers,
+                args.collector.listing_cache(ttl=args.cache_ttl),
+                args.pages, max_size=args.max_size,
+                max_files=args.max_files, eviction=args.eviction)
+        except ConnectionError as error:
+            Logger.error('Could not connect to the internet (%s)', error)
+            args.exit = 1
+            return
+
+        Logger.info('Spooled %d images', n_spooled)
+
+    def connected(self, args):
+        """Return whether the connection check passed, or True if
+        args.probe is off."""
+        if not args.probe:
+            return True
+
+        cache_path = args.collector / config.STATE_DIRNAME / 'probe.json'
+
+        with Metrics.phase('probe'):
+            return probe.connected(cache_path)
+
+    def offline(self, args, reason):
+        """Fall back to self.random() if --all was given."""
+        Logger.error('Could not connect to the internet (%s)', reason)
+
+        if args.all:
+            return self.random(args)
+        else:
+            args.exit = 1
 
     def random(self, args):
         with log_exceptions(args, FileNotFoundError):
             return args.collector.random()
 
     def clear(self, args):
-        args.collector.remove_contents()
+        args.collector.remove_contents(wait=args.wait)
+
+    def dedupe(self, args):
+        n_linked, n_bytes = args.collector.dedupe(args.workers)
+        Logger.info('Linked %d duplicate files, freeing %.1f MB',
+                    n_linked, n_bytes / 1e6)
+
+    def migrate(self, args):
+        with log_exceptions(args, ValueError):
+            args.collector.migrate(args.layout)
+
+    def daemon(self, args):
+        if daemon is None:
+            Logger.error('The daemon needs Unix domain sockets')
+            args.exit = 1
+            return
+
+        with contextlib.suppress(KeyboardInterrupt):
+            daemon.DaemonServer(self, args.collector).serve_forever()
+
+
+def forward(args, argv):
+    """Send the command to a daemon running for args.collector. Return its exit
+    status, or None if the command should run in this process."""
+    if (daemon is None or not args.use_daemon or args.metrics
+            or args.prometheus or args.profile or args.profile_memory
+            or args.subcommand not in daemon.SUBCOMMANDS):
+        return None
+
+    return daemon.request(daemon.socket_path(args.collector), argv)
 
 
 def main(argv=None):
+    parser = CollectParser(prog='collect')
+
     try:
-        exit = CollectParser(prog='collect').parse_args(argv).exit
+        argv = parser.split_argv(argv)
+        args = parser.parse_command(argv)
+        exit = forward(args, argv)
+
+        if exit is None:
+            exit = parser.run(args).exit
     except Exception as error:
         Logger.critical('%s: %s', error.__class__.__name__, error)
         raise
@@ -0,0 +1,342 @@
+"""asyncio counterparts of Collect, RedditListingWrapper and
+RedditSubmissionWrapper
+
+Listings and images are fetched by the same ListingCache, requests Session
+and Partial files as the rest of collect, so proxies, connection reuse,
+retries, the Scheduler and resumable downloads all work the same way. Their
+blocking calls, along with disk and SQLite work, are handed to the loop's
+default executor so that the loop itself never waits on them."""
+import asyncio
+import contextlib
+import functools
+import os
+import random
+import threading
+
+from . import config
+from .collect import (
+    Collect, RedditSubmissionWrapper, Submission, _listing_weights,
+    _resolve_post)
+from .flags import ALL, NEW, NO_REPEAT, FAIL
+from .listing import page_url
+from .logger import Logger
+from .metrics import Metrics
+from .partial import collect_garbage
+from .scheduler import Scheduler
+
+__all__ = ['AsyncCollect', 'AsyncListing', 'AsyncSubmission']
+
+
+def _in_executor(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+
+class AsyncSubmission(RedditSubmissionWrapper):
+    """RedditSubmissionWrapper whose download() is a coroutine."""
+
+    async def download(self, max_size=config.MAX_IMAGE_SIZE):
+        """Save a picture to this path as RedditSubmissionWrapper.download()
+        does, in the loop's executor. Cancelling the task stops the download
+        at its next chunk, keeping the partial file if it can be resumed,
+        and waits for it to stop."""
+        cancel = threading.Event()
+        future = _in_executor(super().download, cancel, max_size)
+
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            cancel.set()
+            await asyncio.gather(future, return_exceptions=True)
+            raise
+
+
+class _Pages:
+    """The posts left in the current page of one listing."""
+
+    def __init__(self, api_url, weight, entry):
+        self.api_url = api_url
+        self.weight = weight
+        self.entry = entry
+        self.n_pages = 1
+        self.posts = random.sample(entry['posts'], len(entry['posts']))
+
+
+class AsyncListing:
+    """RedditListingWrapper for asyncio. Make one with
+    AsyncCollect.reddit_listing() or await AsyncListing.open().
+
+    Candidates are downloaded concurrently by tasks, at most workers at a
+    time through a semaphore, and flags work as in RedditListingWrapper."""
+
+    def __init__(self, path, api_url, cache=None, pages=config.LISTING_PAGES,
+                 workers=config.WORKERS, max_size=config.MAX_SIZE,
+                 max_files=config.MAX_FILES, eviction=config.EVICTION):
+        self.path = AsyncCollect(path)
+        self.url = api_url
+        self.weights = _listing_weights(api_url)
+        self.cache = self.path.collect.listing_cache() if cache is None \
+            else cache
+        self.pages = pages
+        self.semaphore = asyncio.Semaphore(workers)
+        self.workers = workers
+        self.max_size = max_size
+        self.max_files = max_files
+        self.eviction = eviction
+        self.index = self.path.collect.index
+        self.existing_paths = {}
+        Scheduler.share(self.path.collect)
+        self._listings = []
+
+    @classmethod
+    async def open(cls, *args, **kwargs):
+        """Return a new AsyncListing once its listings are fetched."""
+        self = cls(*args, **kwargs)
+        await self.fetch()
+        return self
+
+    async def fetch(self):
+        """Fetch the first page of every listing at once. Raises
+        ConnectionError if none could be fetched."""
+        await _in_executor(self.index.refresh)
+        await _in_executor(collect_garbage, self.path.collect)
+
+        with Metrics.phase('listing'):
+            entries = await asyncio.gather(
+                *(_in_executor(self.cache.get_entry, api_url)
+                  for api_url in self.weights),
+                return_exceptions=True)
+
+        for (api_url, weight), entry in zip(self.weights.items(), entries):
+            if isinstance(entry, ConnectionError):
+                Logger.warning('Skipping listing: %s', entry)
+            elif isinstance(entry, BaseException):
+                raise entry
+            elif weight > 0:
+                self._listings.append(_Pages(api_url, weight, entry))
+
+        if not any(isinstance(entry, dict) for entry in entries):
+            raise ConnectionError('Could not fetch any listing: %s'
+                                  % ', '.join(self.weights))
+
+    async def _next_page(self, listing):
+        """Load the next page of listing. Return whether there was one."""
+        after = listing.entry.get('after')
+
+        if not after or (self.pages is not None
+                         and listing.n_pages >= self.pages):
+            return False
+
+        try:
+            entry = await _in_executor(
+                self.cache.get_entry, page_url(listing.api_url, after))
+        except ConnectionError as error:
+            Logger.warning('Stopping at page %d: %s', listing.n_pages, error)
+            return False
+
+        listing.entry = entry
+        listing.n_pages += 1
+        listing.posts = random.sample(entry['posts'], len(entry['posts']))
+        return True
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        """Return the next submission as RedditListingWrapper.__next__()
+        does."""
+        while self._listings:
+            i, = random.choices(
+                range(len(self._listings)),
+                weights=[listing.weight for listing in self._listings])
+            listing = self._listings[i]
+
+            if not listing.posts and not await self._next_page(listing):
+                del self._listings[i]
+                continue
+
+            data = Submission(**listing.posts.pop())
+            post = AsyncSubmission(self.path.collect, data, listing.api_url)
+
+            if self.path.collect == post.path:
+                continue
+
+            if _resolve_post(self.index, self.path.collect, post):
+                Logger.debug('Already downloaded: %s' % post.url)
+                Metrics.count('already_collected')
+                self.existing_paths[post.path] = post
+
+            return post
+
+        raise StopAsyncIteration
+
+    async def _download(self, post):
+        async with self.semaphore:
+            return await post.download()
+
+    async def iter_download(self, no_repeat=False):
+        """Generate the submissions that RedditListingWrapper.iter_download()
+        would, downloading candidates as tasks and yielding each as soon as
+        its image is saved. Closing the generator cancels the downloads
+        still running."""
+        import requests
+
+        pending = {}
+        exhausted = False
+
+        try:
+            while True:
+                while not exhausted and len(pending) < self.workers:
+                    try:
+                        post = await self.__anext__()
+                    except StopAsyncIteration:
+                        exhausted = True
+                        break
+
+                    if post.path in self.existing_paths:
+                        if not no_repeat:
+                            yield post
+                        continue
+
+                    if post.path in pending.values():
+                        continue
+
+                    task = asyncio.ensure_future(self._download(post))
+                    pending[task] = post.path
+
+                if not pending:
+                    return
+
+                done, _ = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    del pending[task]
+
+                    try:
+                        yield task.result()
+                    except (ValueError, requests.RequestException) as error:
+                        Logger.debug('Skipping candidate: %s', error)
+        finally:
+            for task in pending:
+                task.cancel()
+
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def _served(self, image_path):
+        await _in_executor(self.index.touch, image_path.basename)
+        await _in_executor(
+            self.path.collect.evict, self.max_size, self.max_files,
+            self.eviction, keep=(image_path.basename, ))
+
+    async def _flags_handle_stop(self, flags):
+        if flags & NEW and self.existing_paths:
+            Logger.debug('Falling back on image from new')
+            image_path = random.choice(list(self.existing_paths))
+            await self._served(image_path)
+            return image_path, self.existing_paths[image_path]
+
+        if flags & ALL:
+            Logger.debug('Falling back on image from all')
+            image_path = await self.path.random()
+            return image_path, self.existing_paths.get(image_path)
+
+        raise RuntimeError('Collection failed: %s' % self.url)
+
+    async def flags_next_recover(self, flags=FAIL):
+        """Return the path of the next image, handling collection errors
+        according to the flags as RedditListingWrapper.flags_next_recover()
+        does."""
+        async with contextlib.aclosing(
+                self._iter_recover(flags, 1, False)) as images:
+            async for image_path, post in images:
+                return image_path
+
+    async def flags_iter_recover(self, flags=FAIL, count=1):
+        """Generate (image_path, post) for up to count new images as
+        RedditListingWrapper.flags_iter_recover() does."""
+        async with contextlib.aclosing(
+                self._iter_recover(flags, count, True)) as images:
+            async for image_path, post in images:
+                yield image_path, post
+
+    async def _iter_recover(self, flags, count, new_only):
+        """Generate (image_path, post) for up to count images, only new ones
+        if new_only or NO_REPEAT is set, then the fallback if there were
+        none."""
+        downloads = self.iter_download(new_only or bool(flags & NO_REPEAT))
+        n_images = 0
+
+        try:
+            async for post in downloads:
+                await self._served(post.path)
+                post.log()
+                Logger.info('File: %s', post.path)
+                yield post.path, post
+                n_images += 1
+
+                if n_images >= count:
+                    return
+        finally:
+            await downloads.aclose()
+
+        if not n_images:
+            if new_only and not flags & NO_REPEAT:
+                flags |= NEW
+
+            image_path, post = await self._flags_handle_stop(flags)
+            Logger.info('File: %s', image_path)
+            yield image_path, post
+
+    def __repr__(self):
+        cls = self.__class__
+        module = cls.__module__
+        name = cls.__name__
+        args = self.path.collect, self.url
+        args_str = ', '.join(map(repr, args))
+        return '%s.%s(%s)' % (module, name, args_str)
+
+
+class AsyncCollect:
+    """Collect for asyncio. The blocking operations of the Collect at path,
+    available as collect, are run in the loop's default executor."""
+
+    def __init__(self, path=config.DIRECTORY):
+        self.collect = path if isinstance(path, Collect) else Collect(path)
+
+    async def reddit_listing(self, api_url, cache=None, **kwargs):
+        """Return a new AsyncListing at this path once its listings are
+        fetched. kwargs are as for AsyncListing."""
+        return await AsyncListing.open(self.collect, api_url, cache, **kwargs)
+
+    async def collect_many(self, api_url, count, flags=FAIL, **kwargs):
+        """Generate the paths of up to count images from the listing as
+        Collect.collect_many() does."""
+        listing = await self.reddit_listing(api_url, **kwargs)
+
+        async with contextlib.aclosing(
+                listing.flags_iter_recover(flags, count)) as images:
+            async for image_path, post in images:
+                yield image_path
+
+    async def random(self):
+        """Return a random image within this directory as Collect.random()
+        does."""
+        return await _in_executor(self.collect.random)
+
+    async def remove_contents(self, wait=False):
+        """Empty this directory as Collect.remove_contents() does."""
+        await _in_executor(self.collect.remove_contents, wait)
+
+    async def dedupe(self, workers=config.WORKERS):
+        """Link duplicate images as Collect.dedupe() does."""
+        return await _in_executor(self.collect.dedupe, workers)
+
+    def __fspath__(self):
+        return os.fspath(self.collect)
+
+    def __repr__(self):
+        cls = self.__class__
+        module = cls.__module__
+        name = cls.__name__
+        return '%s.%s(%r)' % (module, name, str(self.collect))
@@ -0,0 +1,30 @@
+"""Processes that outlive the command that started them"""
+import os
+import subprocess
+import sys
+
+from . import config
+
+__all__ = ['start']
+
+
+def start(module, *args):
+    """Start a detached process running python -m module with args and
+    return its subprocess.Popen at once. The process outlives this one and
+    its output is discarded."""
+    package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        filter(None, (package_dir, env.get('PYTHONPATH'))))
+    kwargs = {}
+
+    if config.WINDOWS:
+        kwargs['creationflags'] = (subprocess.DETACHED_PROCESS
+                                   | subprocess.CREATE_NEW_PROCESS_GROUP)
+    else:
+        kwargs['start_new_session'] = True
+
+    return subprocess.Popen(
+        [sys.executable, '-m', module, *map(os.fspath, args)],
+        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL, env=env, **kwargs)
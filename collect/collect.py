@@ -1,12 +1,22 @@
 """Provides functions for downloading images"""
-import functools
+import collections
+import collections.abc
+import concurrent.futures
+import contextlib
+import hashlib
+import itertools
+import os
 import random
-
-import praw
-import requests
+import threading
+import time
 
 from . import config
+from . import layout as _layout
 from .logger import Logger
+from .index import Index
+from .listing import ListingCache, page_url
+from .metrics import Metrics
+from .partial import Partial, collect_garbage
 from . import path as _path
 from .flags import *
 from .flags import __all__ as _flags_all
@@ -14,11 +24,43 @@ from .flags import __all__ as _flags_all
 __all__ = ['RedditSubmissionWrapper', 'RedditListingWrapper', 'Collect']
 __all__.extend(_flags_all)
 
-_reddit = praw.Reddit()
+Submission = collections.namedtuple('Submission', 'url title permalink')
+
+
+def _get_session():
+    """Return the shared HTTP session, importing requests on first use."""
+    from .session import get_session
+    return get_session()
+
+
+def _share_host_limits(directory):
+    """Share the Scheduler's host rate limits with the other collect
+    processes using directory."""
+    from .scheduler import Scheduler
+    Scheduler.share(directory)
+
+
+@contextlib.contextmanager
+def _state_lock(directory, name):
+    """Context manager taking the lock file name in the state folder of
+    directory. Gives whether the lock was free; it is always free where file
+    locks are not supported."""
+    if config.WINDOWS:
+        yield True
+        return
 
-_get = functools.partial(requests.get, headers={
-    'User-Agent': 'collect/%s' % config.VERSION
-})
+    import fcntl
+
+    state_dir = os.path.join(directory, config.STATE_DIRNAME)
+    os.makedirs(state_dir, exist_ok=True)
+
+    with open(os.path.join(state_dir, name), 'w') as file:
+        try:
+            fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+        else:
+            yield True
 
 
 def _randomized(list_):
@@ -26,9 +68,69 @@ def _randomized(list_):
     yield from random.sample(list_, len(list_))
 
 
-def _verify_image_response(res):
+def _weighted_interleave(weighted_iterables):
+    """Yield values of several (weight, iterable) pairs. Each value is taken
+    from an iterable chosen at random with probability proportional to its
+    weight among the iterables that still have values."""
+    iterators = [[weight, iter(iterable)]
+                 for weight, iterable in weighted_iterables if weight > 0]
+
+    while iterators:
+        i, = random.choices(
+            range(len(iterators)),
+            weights=[weight for weight, _ in iterators])
+
+        try:
+            yield next(iterators[i][1])
+        except StopIteration:
+            del iterators[i]
+
+
+def _listing_weights(api_urls):
+    """Return {api_url: weight} for one listing URL, a sequence of them, or a
+    mapping of them to weights."""
+    if isinstance(api_urls, str):
+        return {api_urls: 1}
+    elif isinstance(api_urls, collections.abc.Mapping):
+        return dict(api_urls)
+    else:
+        return dict.fromkeys(api_urls, 1)
+
+
+def _unique_fname(fname, url):
+    """Return a file name for the image at url that does not clash with a
+    different image already saved as fname."""
+    root, ext = os.path.splitext(fname)
+    return '%s-%s%s' % (root, hashlib.sha1(url.encode()).hexdigest()[:8], ext)
+
+
+def _hardlink(source, path):
+    """Atomically make path a hard link to the file at source."""
+    head, tail = os.path.split(os.fspath(path))
+    link_path = os.path.join(head, '.%s.%d.link' % (tail, os.getpid()))
+    os.link(source, link_path)
+
+    try:
+        os.replace(link_path, path)
+    except BaseException:
+        os.remove(link_path)
+        raise
+
+
+def _reject(error_msg, url):
+    """Log and raise the reason why url is not a suitable image."""
+    strerr = '%s: %s' % (error_msg, url)
+    Logger.debug(strerr)
+    Metrics.count('rejected', reason=error_msg.partition(' (')[0])
+    raise ValueError(strerr)
+
+
+def _verify_image_response(res, max_size=config.MAX_IMAGE_SIZE):
+    """Raise ValueError if the response headers show that the body is not a
+    suitable image. The body itself is not read."""
     error_msg = None
-    content_type = res.headers['content-type']
+    content_type = res.headers.get('content-type', '')
+    content_length = res.headers.get('content-length', '')
 
     if 'removed' in res.url:
         error_msg = 'Appears to be removed (%s)' % res.url
@@ -36,39 +138,245 @@ def _verify_image_response(res):
         error_msg = 'Not an image (%s)' % content_type
     if 'gif' in content_type:
         error_msg = 'Is a .gif (%s)' % content_type
+    if content_length.isdigit() and int(content_length) > max_size:
+        error_msg = 'Too large (%s bytes)' % content_length
 
     if error_msg is not None:
-        strerr = '%s: %s' % (error_msg, res.url)
-        Logger.debug(strerr)
-        raise ValueError(strerr)
+        _reject(error_msg, res.url)
 
 
-def _get_image(url):
-    res = _get(url)
-    _verify_image_response(res)
+_IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+    (b'BM', 'bmp'),
+    (b'II*\x00', 'tiff'),
+    (b'MM\x00*', 'tiff'),
+)
+
+
+def _sniff_image_type(chunk):
+    """Return the image type named by the magic bytes at the start of chunk,
+    or None if they are not recognized."""
+    if chunk[:4] == b'RIFF' and chunk[8:12] == b'WEBP':
+        return 'webp'
+
+    for signature, image_type in _IMAGE_SIGNATURES:
+        if chunk.startswith(signature):
+            return image_type
+
+
+def _verify_image_chunk(chunk, url):
+    """Raise ValueError if the first chunk of a body is not a suitable
+    image."""
+    image_type = _sniff_image_type(chunk)
+
+    if image_type is None:
+        _reject('Not an image (unknown magic bytes)', url)
+    if image_type == 'gif':
+        _reject('Is a .gif (magic bytes)', url)
+
+
+def _get_image(url, partial=None):
+    """Return a streaming response for url whose headers passed
+    _verify_image_response(). Only the rest of the image is asked for if a
+    Partial holds its start. Raises requests.HTTPError for an error status,
+    which says nothing about the image, rather than ValueError."""
+    import requests
+
+    headers = {} if partial is None else partial.range_headers()
+    res = _get_session().get(url, headers=headers, stream=True)
+
+    if res.status_code == 416 and headers:
+        # The partial file is longer than the image now is.
+        res.close()
+        partial.reset()
+        res = _get_session().get(url, stream=True)
+
+    try:
+        res.raise_for_status()
+        _verify_image_response(res)
+    except (ValueError, requests.HTTPError):
+        res.close()
+        raise
+
     return res
 
 
+def _resolve_post(index, directory, post):
+    """Point post.path at the file in directory already holding its URL, or
+    at a name of its own if a different image took its URL's file name.
+    Return whether the image was already collected."""
+    fname = index.find_url(post.url)
+
+    if fname is not None:
+        post.path = directory.image_path(fname)
+        return True
+
+    record = index.get(post.path.basename)
+
+    if record is None:
+        return False
+    elif record['url'] is None:
+        # Found on disk rather than downloaded, so assume it is the same.
+        return True
+
+    post.path = directory.image_path(
+        _unique_fname(post.path.basename, post.url))
+    return post.path.basename in index
+
+
 class RedditSubmissionWrapper:
     """Wrapper for Reddit submission objects to facilitate logging and URL
     downloading."""
 
-    def __init__(self, parent_path, data):
+    def __init__(self, parent_path, data, listing=None):
         self.data = data
         self.url = self.data.url
+        self.listing = listing
+        self.parent = parent_path
         self.path = parent_path.url_fname(self.url)
+        self.size = None
 
-    def download(self):
+    def download(self, cancel=None, max_size=config.MAX_IMAGE_SIZE):
         """Save a picture to this path. Raises ValueError if the HTTP response
-        indicates that we did not receive an image."""
-        res = _get_image(self.url)
+        indicates that we did not receive an image, or
+        requests.RequestException if it could not be fetched. Raises
+        concurrent.futures.CancelledError if the threading.Event cancel was
+        set before the image was saved.
+
+        The body is streamed into a Partial file which is renamed onto this
+        path once complete, so this path never holds a partial image. If the
+        transfer breaks off and the server can resume it, the rest is asked
+        for, here or by a later download of the same URL. If the directory
+        already holds an image with the same contents, this path becomes a
+        hard link to it instead. The new file is then recorded in the
+        directory's Index."""
+        Metrics.count('candidates')
+        start = time.perf_counter()
+        phase = 'download_failed'
 
-        with open(self.path, 'wb') as file:
-            file.write(res.content)
+        try:
+            self._save(cancel, max_size)
+            phase = 'download'
+        except concurrent.futures.CancelledError:
+            phase = 'download_cancelled'
+            raise
+        finally:
+            Metrics.add_time(phase, time.perf_counter() - start)
 
         Logger.debug('Collected new image: %s', self.url)
         return self
 
+    def _save(self, cancel, max_size):
+        import requests
+
+        partial = Partial.open(self.parent, self.url)
+
+        try:
+            for n_try in range(config.RETRIES + 1):
+                try:
+                    mime = self._fetch(partial, cancel, max_size)
+                    break
+                except requests.RequestException as error:
+                    # The session already retried error statuses.
+                    if (n_try == config.RETRIES or not partial.resumable
+                            or isinstance(error, requests.HTTPError)):
+                        raise
+                    Logger.debug('Resuming %s: %s', self.url, error)
+                    Metrics.count('download_retries')
+
+            # A download that lost the race after its last chunk came in
+            # must not write its file either.
+            if cancel is not None and cancel.is_set():
+                raise concurrent.futures.CancelledError(self.url)
+
+            hash = partial.digest.hexdigest()
+            self.size = partial.size
+            start = time.perf_counter()
+            partial.complete(self._store)
+            Metrics.add_time('write', time.perf_counter() - start)
+        except ValueError:
+            partial.discard()
+            raise
+        except BaseException:
+            partial.abandon()
+            raise
+
+        Metrics.count('bytes_saved', self.size)
+        self._record(mime, hash)
+
+    def _fetch(self, partial, cancel, max_size):
+        """Write the image to partial, or the rest of it if the server can
+        resume it, from one response. Return the image's MIME type."""
+        received = 0
+        write_seconds = 0
+
+        with _get_image(self.url, partial) as res:
+            kept = partial.begin(res.status_code, res.headers)
+
+            if kept:
+                Logger.debug('Resuming at %d bytes: %s', kept, self.url)
+                Metrics.count('bytes_resumed', kept)
+
+            chunks = res.iter_content(config.CHUNK_SIZE)
+            first_chunk = next(chunks, b'')
+            _verify_image_chunk(partial.head + first_chunk, res.url)
+
+            try:
+                for chunk in itertools.chain([first_chunk], chunks):
+                    if cancel is not None and cancel.is_set():
+                        raise concurrent.futures.CancelledError(self.url)
+
+                    received += len(chunk)
+                    if partial.size + len(chunk) > max_size:
+                        _reject('Too large (over %d bytes)' % max_size,
+                                res.url)
+
+                    start = time.perf_counter()
+                    partial.write(chunk)
+                    write_seconds += time.perf_counter() - start
+            finally:
+                Metrics.count('bytes_received', received)
+                Metrics.add_time('write', write_seconds)
+
+            return res.headers['content-type'].split(';')[0].strip()
+
+    def _store(self, temp_path, hash):
+        """Move the complete image at temp_path onto this path, or make this
+        path a hard link to an indexed image with the same hash and delete
+        temp_path."""
+        original = Index.open(self.parent).find_hash(hash, self.size)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        if (original is not None
+                and original != self.path.basename
+                and self._link_to(original)):
+            os.remove(temp_path)
+        else:
+            os.replace(temp_path, self.path)
+
+    def _record(self, mime, hash):
+        """Record the image just saved to this path in the Index."""
+        Index.open(self.parent).add(
+            self.path.basename, url=self.url, mime=mime, hash=hash,
+            listing=self.listing)
+
+    def _link_to(self, fname):
+        """Try to make this path a hard link to fname in the same directory.
+        Return whether it worked."""
+        try:
+            _hardlink(self.parent.image_path(fname), self.path)
+        except OSError as error:
+            Logger.debug('Could not link %s to %s: %s',
+                         self.path.basename, fname, error)
+            return False
+
+        Logger.debug('Linked duplicate of %s: %s', fname, self.url)
+        Metrics.count('linked_duplicates')
+        return True
+
     def log(self):
         """Log the submission's title, comment URL, and link URL."""
         Logger.info('Title: %s', self.data.title)
@@ -78,15 +386,96 @@ class RedditSubmissionWrapper:
 
 class RedditListingWrapper:
     """Wrapper for Reddit listing generators to facilitate image downloading
-    and handling certain behaviors."""
+    and handling certain behaviors.
+
+    api_url may also be a sequence of listing URLs or a mapping of them to
+    weights. The listings are fetched at once and merged into one random
+    stream in which each listing is drawn from in proportion to its
+    weight.
+
+    After each image is served, files are evicted from the directory as
+    Collect.evict() does until it is within max_size bytes and max_files
+    files."""
 
-    def __init__(self, path, api_url):
+    def __init__(self, path, api_url, cache=None, pages=config.LISTING_PAGES,
+                 max_size=config.MAX_SIZE, max_files=config.MAX_FILES,
+                 eviction=config.EVICTION):
         self.path = Collect(path)
         self.url = api_url
-        self.listing = _reddit.get(api_url)
-        self.posts = _randomized(list(self.listing))
+        self.weights = _listing_weights(api_url)
+        self.pages = pages
+        self.max_size = max_size
+        self.max_files = max_files
+        self.eviction = eviction
+        self.index = self.path.index
+        self.index.refresh()
+        _share_host_limits(self.path)
+        collect_garbage(self.path)
+
+        if cache is None:
+            cache = self.path.listing_cache()
+
+        self.cache = cache
+
+        with Metrics.phase('listing'):
+            listings = self._fetch_listings()
+
+        self.posts = _weighted_interleave(
+            (self.weights[api_url], self._iter_listing(api_url, entry))
+            for api_url, entry in listings.items())
         self.existing_paths = {}
 
+    def _fetch_listings(self):
+        """Return {api_url: cache entry} with the first page of every listing
+        that could be fetched. Raises ConnectionError if none could."""
+        if len(self.weights) == 1:
+            api_url, = self.weights
+            return {api_url: self.cache.get_entry(api_url)}
+
+        listings = {}
+
+        with concurrent.futures.ThreadPoolExecutor(len(self.weights)) as pool:
+            futures = {
+                pool.submit(self.cache.get_entry, api_url): api_url
+                for api_url in self.weights
+            }
+
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    listings[futures[future]] = future.result()
+                except ConnectionError as error:
+                    Logger.warning('Skipping listing: %s', error)
+
+        if not listings:
+            raise ConnectionError('Could not fetch any listing: %s'
+                                  % ', '.join(self.weights))
+
+        return listings
+
+    def _iter_listing(self, api_url, entry):
+        """Generate (api_url, Submission) for the posts of a listing, starting
+        from the cache entry of its first page. Each page is shuffled on its
+        own, and the next one is fetched only once the previous one is used
+        up, up to self.pages pages (or all of them if None)."""
+        n_pages = 1
+
+        while True:
+            for post in _randomized(entry['posts']):
+                yield api_url, Submission(**post)
+
+            after = entry.get('after')
+
+            if not after or self.pages is not None and n_pages >= self.pages:
+                return
+
+            try:
+                entry = self.cache.get_entry(page_url(api_url, after))
+            except ConnectionError as error:
+                Logger.warning('Stopping at page %d: %s', n_pages, error)
+                return
+
+            n_pages += 1
+
     def __iter__(self):
         """Allow self to be used as an iterator."""
         return self
@@ -94,55 +483,127 @@ class RedditListingWrapper:
     def __next__(self):
         """Return the next submission in the listing in a random order while
         noting if the submission's corresponding already exists."""
-        post = RedditSubmissionWrapper(self.path, next(self.posts))
+        while True:
+            api_url, data = next(self.posts)
+            post = RedditSubmissionWrapper(self.path, data, api_url)
 
-        if self.path == post.path:
-            return next(self)
+            if self.path == post.path:
+                continue
 
-        if post.path.exists():
-            Logger.debug('Already downloaded: %s' % post.url)
-            self.existing_paths[post.path] = post
-            return post
+            if _resolve_post(self.index, self.path, post):
+                Logger.debug('Already downloaded: %s' % post.url)
+                Metrics.count('already_collected')
+                self.existing_paths[post.path] = post
 
-        return post
+            return post
 
     def next_download(self):
-        """next(self) while downloading the submission's image."""
-        post = next(self)
+        """next(self) while downloading the submission's image. A submission
+        whose image is rejected or cannot be fetched is skipped."""
+        import requests
 
-        if post.path in self.existing_paths:
-            return post
+        while True:
+            post = next(self)
 
-        try:
-            post.download()
-        except ValueError as error:
-            return self.next_download()
-        else:
-            return post
+            if post.path in self.existing_paths:
+                return post
+
+            try:
+                post.download()
+            except (ValueError, requests.RequestException) as error:
+                Logger.debug('Skipping candidate: %s', error)
+                continue
+            else:
+                return post
 
     def next_no_repeat(self):
         """next(self) while skipping submissions that have already been
         collected."""
-        post = next(self)
+        while True:
+            post = next(self)
 
-        if post.path in self.existing_paths:
-            return self.next_no_repeat()
-        else:
-            return post
+            if post.path not in self.existing_paths:
+                return post
 
     def next_no_repeat_download(self):
         """self.next_no_repeat() while downloading the submisson's image."""
-        post = self.next_download()
+        while True:
+            post = self.next_download()
 
-        if post.path in self.existing_paths:
-            return self.next_no_repeat_download()
-        else:
-            return post
+            if post.path not in self.existing_paths:
+                return post
 
-    def flags_next_download(self, flags):
+    def iter_download(self, no_repeat=False, workers=config.WORKERS):
+        """Generate the submissions that self.next_download() (or
+        self.next_no_repeat_download() if no_repeat) would return one after
+        another, downloading up to workers of them at once and yielding each
+        as soon as its image is saved. A submission whose image is rejected
+        or cannot be fetched is skipped. Closing the generator cancels the
+        downloads still running."""
+        import requests
+
+        cancel = threading.Event()
+        executor = concurrent.futures.ThreadPoolExecutor(workers)
+        pending = {}
+        exhausted = False
+
+        try:
+            while True:
+                while not exhausted and len(pending) < workers:
+                    try:
+                        post = next(self)
+                    except StopIteration:
+                        exhausted = True
+                        break
+
+                    if post.path in self.existing_paths:
+                        if not no_repeat:
+                            yield post
+                        continue
+
+                    if post.path in pending.values():
+                        continue
+
+                    future = executor.submit(post.download, cancel)
+                    pending[future] = post.path
+
+                if not pending:
+                    return
+
+                done, _ = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED)
+
+                for future in done:
+                    del pending[future]
+                    try:
+                        yield future.result()
+                    except (ValueError, requests.RequestException) as error:
+                        Logger.debug('Skipping candidate: %s', error)
+        finally:
+            cancel.set()
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def next_download_concurrent(self, no_repeat=False,
+                                 workers=config.WORKERS):
+        """self.next_download() (or self.next_no_repeat_download() if
+        no_repeat) while downloading up to workers submissions at once. The
+        first verified image wins and the other downloads are discarded."""
+        downloads = self.iter_download(no_repeat, workers)
+
+        try:
+            return next(downloads)
+        finally:
+            downloads.close()
+
+    def flags_next_download(self, flags, workers=config.WORKERS):
         """Download the next submission's image according to the specified
-        flags."""
-        if flags & NO_REPEAT:
+        flags, verifying up to workers submissions at once."""
+        if workers > 1:
+            return self.next_download_concurrent(
+                no_repeat=bool(flags & NO_REPEAT), workers=workers)
+        elif flags & NO_REPEAT:
             return self.next_no_repeat_download()
         else:
             return self.next_download()
@@ -152,15 +613,24 @@ class RedditListingWrapper:
         post = self.existing_paths.get(image_path)
         return image_path, post
 
+    def _served(self, image_path):
+        """Record that image_path was served and make room for it."""
+        self.index.touch(image_path.basename)
+        self.path.evict(self.max_size, self.max_files, self.eviction,
+                        keep=(image_path.basename, ))
+
     def _flags_handle_stop(self, flags):
         if flags & NEW:
             Logger.debug('Falling back on image from new')
             try:
-                return next(_randomized(
-                    self.existing_paths.items()
+                image_path, post = next(_randomized(
+                    list(self.existing_paths.items())
                 ))
             except StopIteration:
                 pass
+            else:
+                self._served(image_path)
+                return image_path, post
 
         if flags & ALL:
             Logger.debug('Falling back on image from all')
@@ -168,13 +638,15 @@ class RedditListingWrapper:
 
         raise RuntimeError('Collection failed: %s' % self.url)
 
-    def flags_next_recover(self, flags):
+    def flags_next_recover(self, flags, workers=config.WORKERS):
         """Download the next submission's image but handle collection errors
         according to the flags."""
         try:
-            post = self.flags_next_download(flags)
+            post = self.flags_next_download(flags, workers)
         except StopIteration:
             image_path, post = self._flags_handle_stop(flags)
+        else:
+            self._served(post.path)
 
         if post is not None:
             post.log()
@@ -183,6 +655,37 @@ class RedditListingWrapper:
         Logger.info('File: %s', image_path)
         return image_path
 
+    def flags_iter_recover(self, flags, count, workers=config.WORKERS):
+        """Generate (image_path, post) for up to count new images downloaded
+        as self.iter_download(no_repeat=True) does. If none could be
+        collected, generate a single fallback: an image of the listing that
+        was collected before unless NO_REPEAT is set, as flags_next_recover()
+        would give, and otherwise the one that the flags call for. post is
+        None if the image was not downloaded by this listing."""
+        downloads = self.iter_download(True, workers)
+        n_images = 0
+
+        try:
+            for post in downloads:
+                self._served(post.path)
+                post.log()
+                Logger.info('File: %s', post.path)
+                yield post.path, post
+                n_images += 1
+
+                if n_images >= count:
+                    return
+        finally:
+            downloads.close()
+
+        if not n_images:
+            if not flags & NO_REPEAT:
+                flags |= NEW
+
+            image_path, post = self._flags_handle_stop(flags)
+            Logger.info('File: %s', image_path)
+            yield image_path, post
+
     def __repr__(self):
         cls = self.__class__
         module = cls.__module__
@@ -194,19 +697,364 @@ class RedditListingWrapper:
 
 class Collect(_path.Path):
     """Perform image collection operations on a path."""
+    __slots__ = ()
+
+    @property
+    def index(self):
+        """The Index of the images in this directory. Call its refresh()
+        method before relying on it to reflect changes made outside of
+        collect."""
+        return Index.open(self)
+
+    def image_path(self, fname):
+        """Return the path of the image named fname in this directory, as
+        placed by the layout that the Index records."""
+        return self / self.index.relpath(fname)
+
+    def url_fname(self, url):
+        """Return the path of the image named after the filename part of a
+        url in this directory."""
+        fname = _path.PathBase.url_fname(url)
+        return self.image_path(fname) if fname else self / fname
+
+    def images(self, layouts=None):
+        """Generate the paths of the images in this directory in any of
+        layouts, by default the ones that the Index finds images in. Entry
+        types come from the directory listings, so regular files cost no
+        extra stat calls."""
+        if layouts is None:
+            layouts = self.index.layouts
 
-    def reddit_listing(self, api_url):
+        for layout in layouts:
+            for entry in _layout.scan(self, layout):
+                yield _path.Path(entry.path)
+
+    def listing_cache(self, **kwargs):
+        """Return a ListingCache stored in this directory."""
+        return ListingCache(
+            os.path.join(self, config.STATE_DIRNAME, 'listings'), **kwargs)
+
+    def reddit_listing(self, api_url, cache=None, pages=config.LISTING_PAGES,
+                       **limits):
         """Helper for new RedditListingWrapper at this path."""
-        return RedditListingWrapper(self, api_url)
+        return RedditListingWrapper(self, api_url, cache, pages, **limits)
+
+    def collect_many(self, api_url, count, flags=FAIL, workers=config.WORKERS,
+                     cache=None, pages=config.LISTING_PAGES, **limits):
+        """Generate the paths of up to count images from the listing as soon
+        as each one is saved, downloading up to workers at once. flags work
+        as in RedditListingWrapper.flags_iter_recover()."""
+        listing = self.reddit_listing(api_url, cache, pages, **limits)
+
+        for image_path, post in listing.flags_iter_recover(
+            flags, count, workers
+        ):
+            yield image_path
+
+    def prefetch(self, api_url, size=config.SPOOL_SIZE,
+                 workers=config.WORKERS, cache=None,
+                 pages=config.LISTING_PAGES, **limits):
+        """Download new images from the listing until size of them are
+        spooled, ready for unspool() to hand out without waiting on the
+        network, and remember size as the Index's spool_size. Only one
+        prefetch runs at a time in this directory; the others return at
+        once. Return the number of images added to the spool."""
+        index = self.index
+        index.spool_size = size
+
+        with _state_lock(self, 'prefetch.lock') as locked:
+            if not locked:
+                Logger.info('Already prefetching into %s', self)
+                return 0
+
+            weights = _listing_weights(api_url)
+            missing = size - sum(index.spool_counts(weights).values())
+
+            if missing <= 0:
+                return 0
+
+            listing = self.reddit_listing(api_url, cache, pages, **limits)
+            downloads = listing.iter_download(True, workers)
+            n_spooled = 0
+
+            try:
+                for post in downloads:
+                    index.spool(post.path.basename, post.listing,
+                                post.data.title, post.data.permalink)
+                    n_spooled += 1
+
+                    if n_spooled >= missing:
+                        break
+            finally:
+                downloads.close()
+
+            self.evict(listing.max_size, listing.max_files, listing.eviction)
+
+        Metrics.count('spooled', n_spooled)
+        return n_spooled
+
+    def unspool(self, api_url, max_size=config.MAX_SIZE,
+                max_files=config.MAX_FILES, eviction=config.EVICTION):
+        """Take an image that prefetch() spooled from the listing, drawing
+        from several listings by weight as RedditListingWrapper does, and
+        serve it as RedditListingWrapper.flags_next_recover() would. Return
+        its path, or None if none of the listings has an image spooled."""
+        weights = _listing_weights(api_url)
+        index = self.index
+
+        while True:
+            counts = {
+                listing: weights[listing]
+                for listing in index.spool_counts(weights)
+                if weights[listing] > 0
+            }
+
+            if not counts:
+                return None
+
+            listing, = random.choices(list(counts), list(counts.values()))
+            record = index.unspool(listing)
+
+            if record is None:
+                continue
+
+            image_path = self.image_path(record['fname'])
+
+            if not image_path.is_file():
+                continue
+
+            index.touch(record['fname'])
+            self.evict(max_size, max_files, eviction,
+                       keep=(record['fname'], ))
+            Metrics.count('unspooled')
+            Logger.info('Title: %s', record['title'])
+            Logger.info('Post: %s', record['permalink'])
+            Logger.info('URL: %s', index.get(record['fname'])['url'])
+            Logger.info('File: %s', image_path)
+            return image_path
+
+    def dedupe(self, workers=config.WORKERS):
+        """Replace the images in this directory that have the same contents
+        by hard links to one copy, hashing up to workers files at once.
+        Return the number of files linked and the number of bytes freed."""
+        index = self.index
+        index.refresh()
+        index.hash_missing(workers)
+        n_linked = n_bytes = 0
+
+        for hash, fnames in index.duplicates():
+            original = self.image_path(fnames[0])
+
+            try:
+                original_stat = os.stat(original)
+            except FileNotFoundError:
+                continue
+
+            for fname in fnames[1:]:
+                path = self.image_path(fname)
+
+                try:
+                    stat = os.stat(path)
+
+                    if os.path.samestat(stat, original_stat):
+                        continue
+
+                    _hardlink(original, path)
+                except OSError as error:
+                    Logger.warning('Could not link %s to %s: %s',
+                                   fname, fnames[0], error)
+                    continue
+
+                index.add(fname, hash=hash)
+                n_linked += 1
+
+                if stat.st_nlink == 1:
+                    n_bytes += stat.st_size
+
+        return n_linked, n_bytes
+
+    def migrate(self, layout, progress=config.MIGRATE_PROGRESS):
+        """Move the images in this directory into layout, one of
+        layout.LAYOUTS, while they can still be collected and served: new
+        images go into layout at once and the others are found in either
+        place until all of them are moved. A migration that was interrupted
+        carries on where it stopped when called again. The number of images
+        moved is logged every progress images. Raises ValueError if another
+        migration is running here. Return the number of images moved."""
+        index = self.index
+
+        with _state_lock(self, 'migrate.lock') as locked:
+            if not locked:
+                raise ValueError('Already migrating %s' % self)
+
+            index.refresh()
+            source = index.begin_migration(layout)
+
+            if source is None:
+                Logger.info('%s already uses the %s layout', self, layout)
+                return 0
+
+            fnames = [entry.name for entry in _layout.scan(self, source)]
+            Logger.info('Moving %d images from the %s to the %s layout',
+                        len(fnames), source, layout)
+            n_moved = n_failed = 0
+
+            for fname in fnames:
+                source_path = os.path.join(
+                    self, _layout.relpath(fname, source))
+                path = os.path.join(self, _layout.relpath(fname, layout))
+
+                if os.path.lexists(path):
+                    Logger.warning('Could not move %s: %s exists',
+                                   fname, path)
+                    n_failed += 1
+                    continue
+
+                try:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    os.rename(source_path, path)
+                except FileNotFoundError:
+                    # Evicted or cleared meanwhile
+                    continue
+                except OSError as error:
+                    Logger.warning('Could not move %s: %s', fname, error)
+                    n_failed += 1
+                    continue
+
+                n_moved += 1
+
+                if n_moved % progress == 0:
+                    Logger.info('Moved %d of %d images', n_moved, len(fnames))
+
+            if n_failed:
+                Logger.warning('%d images were left in the %s layout; '
+                               'migrate again to retry', n_failed, source)
+            else:
+                index.end_migration()
+
+                if source == 'sharded':
+                    for shard in reversed(_layout.shards(self)):
+                        with contextlib.suppress(OSError):
+                            os.rmdir(shard)
+
+            index.refresh(force=True)
+
+        Logger.info('Moved %d images to the %s layout', n_moved, layout)
+        Metrics.count('migrated', n_moved)
+        return n_moved
+
+    def evict(self, max_size=config.MAX_SIZE, max_files=config.MAX_FILES,
+              policy=config.EVICTION, keep=()):
+        """Remove images until this directory holds at most max_size bytes
+        and max_files files (either may be None for no limit). Images go in
+        the order of the eviction policy, one of index.EVICTION_POLICIES,
+        and the names in keep are never removed. Only the images removed
+        are looked at, so this is cheap to call after every download. Return
+        the list of names removed."""
+        index = self.index
+        keep = set(keep)
+        evicted = []
+
+        while (max_files is not None and len(index) > max_files
+               or max_size is not None and index.total_size() > max_size):
+            fname = index.victim(policy, exclude=keep)
+
+            if fname is None:
+                break
+
+            try:
+                os.remove(self.image_path(fname))
+            except FileNotFoundError:
+                pass
+            except OSError as error:
+                Logger.warning('Could not evict %s: %s', fname, error)
+                keep.add(fname)
+                continue
+
+            index.remove(fname)
+            evicted.append(fname)
+            Logger.debug('Evicted %s', fname)
+
+        if evicted:
+            Logger.info('Evicted %d files from %s', len(evicted), self)
+            Metrics.count('evicted', len(evicted))
+
+        return evicted
 
     def random(self):
-        """Return a random file within this directory. Raises FileNotFoundError
+        """Return a random image within this directory using the Index, or
+        scan_random() if the Index cannot be used. Raises FileNotFoundError if
+        no suitable file was found."""
+        import sqlite3
+
+        try:
+            return self.index_random()
+        except (sqlite3.Error, OSError) as error:
+            if isinstance(error, FileNotFoundError):
+                raise
+            Logger.debug('Index unavailable (%s), scanning %s', error, self)
+            return self.scan_random()
+
+    def index_random(self):
+        """Return a random image within this directory from the Index. Raises
+        FileNotFoundError if no suitable file was found."""
+        index = self.index
+
+        for force in (False, True):
+            index.refresh(force=force)
+            fname = index.random()
+
+            if fname is None:
+                break
+
+            path = self.image_path(fname)
+
+            if path.is_file():
+                index.touch(fname)
+                return path
+
+        raise FileNotFoundError('No suitable files: %s' % self)
+
+    def scan_random(self):
+        """Return a random image within this directory after one pass of
+        images() with reservoir sampling. The layouts that the Index records
+        are scanned, or both if it is unavailable. Raises FileNotFoundError
         if no suitable file was found."""
+        import sqlite3
+
+        choice = None
+        n_files = 0
+
         try:
-            return next(
-                path
-                for path in _randomized(list(self))
-                if path.is_file()
-            )
-        except StopIteration:
+            layouts = self.index.layouts
+        except (sqlite3.Error, OSError) as error:
+            Logger.debug('Scanning both layouts of %s: %s', self, error)
+            layouts = _layout.LAYOUTS
+
+        for n_files, path in enumerate(self.images(layouts), 1):
+            if random.randrange(n_files) == 0:
+                choice = path
+
+        if choice is None:
             raise FileNotFoundError('No suitable files: %s' % self)
+
+        return choice
+
+    def remove_contents(self, wait=False):
+        """Remove everything within this directory but collect's own files.
+        The directory is emptied at once as trash.empty() does, and the old
+        contents, along with any left over from earlier calls, are deleted
+        by a background process, or before returning if wait."""
+        from . import trash
+
+        old_contents = trash.empty(self)
+        self.index.clear()
+        paths = [old_contents]
+        paths.extend(
+            path for path in trash.leftovers(self) if path != old_contents)
+
+        if wait:
+            for path in paths:
+                trash.delete_tree(path)
+        else:
+            trash.delete_in_background(*paths)
@@ -3,11 +3,89 @@ import os
 
 from . import path
 
-__all__ = ['DIRECTORY', 'REDDIT_URL', 'WINDOWS']
+__all__ = [
+    'BACKOFF', 'CHUNK_SIZE', 'DAEMON_TIMEOUT', 'DIRECTORY', 'EVICTION',
+    'HOST_BURST', 'HOST_MAX_WAIT', 'HOST_RATE', 'HOST_RATES',
+    'LISTING_EXIT_WAIT', 'LISTING_MEMORY', 'LISTING_PAGES', 'LISTING_STALE',
+    'LISTING_TTL', 'MAX_CONNECTIONS', 'MAX_FILES', 'MAX_IMAGE_SIZE',
+    'MAX_SIZE', 'MIGRATE_PROGRESS', 'PARTIAL_TTL', 'PROBE_DEADLINE',
+    'PROBE_HOSTS', 'PROBE_TTL', 'REDDIT_API', 'REDDIT_URL', 'RETRIES',
+    'SPOOL_SIZE', 'STATE_DIRNAME', 'TIMEOUT', 'WINDOWS', 'WORKERS',
+]
 
 VERSION = '1.3'
+REDDIT_API = 'https://www.reddit.com/'
 REDDIT_URL = 'r/earthporn/hot?limit=10'
 WINDOWS = os.name == 'nt'
+WORKERS = 4
+
+# Folder inside the collection directory holding collect's own files.
+STATE_DIRNAME = '.collect'
+
+# HTTP session: (connect, read) timeout in seconds, number of retries, base
+# backoff delay in seconds, and pooled connections per host.
+TIMEOUT = (5, 30)
+RETRIES = 3
+BACKOFF = 0.5
+MAX_CONNECTIONS = 4
+
+# Rate limits: requests per second to a host (None for no limit unless the
+# host asks for one), the rates of particular hosts, requests that may be sent
+# at once after a pause, and the most seconds to wait for a throttled host
+# before giving up on the request.
+HOST_RATE = None
+HOST_RATES = {'www.reddit.com': 1}
+HOST_BURST = 10
+HOST_MAX_WAIT = 60
+
+# Daemon: seconds the command line script waits for a daemon to take a
+# command, or to show that it is still running one, before running the
+# command itself.
+DAEMON_TIMEOUT = 5
+
+# Downloads: bytes read from the network at a time, and the largest image in
+# bytes that will be saved.
+CHUNK_SIZE = 64 * 1024
+MAX_IMAGE_SIZE = 32 * 1024 * 1024
+
+# Interrupted downloads: seconds a partial image is kept to be resumed.
+PARTIAL_TTL = 7 * 24 * 60 * 60
+
+# Connection check: hosts that collect talks to, seconds to wait for any of
+# them to accept a connection, and seconds a result is reused for.
+PROBE_HOSTS = (
+    ('www.reddit.com', 443),
+    ('i.redd.it', 443),
+    ('i.imgur.com', 443),
+)
+PROBE_DEADLINE = 2
+PROBE_TTL = 30
+
+# Listing cache: seconds a listing is served without a request, further
+# seconds it is served while being revalidated in the background, seconds a
+# run waits at exit for those revalidations to finish, and listings a
+# long-running process keeps in memory.
+LISTING_TTL = 600
+LISTING_STALE = 24 * 60 * 60
+LISTING_EXIT_WAIT = 5
+LISTING_MEMORY = 64
+
+# Pages of each listing to walk through before giving up, or None for all.
+LISTING_PAGES = 1
+
+# Collection directory limits: total bytes and number of files kept (None for
+# no limit), and which files go first once over a limit: 'lru' (least
+# recently served), 'lfu' (least often served) or 'oldest' (first added).
+MAX_SIZE = None
+MAX_FILES = None
+EVICTION = 'lru'
+
+# Images that collect prefetch keeps downloaded ahead of time for collect
+# reddit to show at once.
+SPOOL_SIZE = 3
+
+# Layout migration: images moved between progress reports.
+MIGRATE_PROGRESS = 1000
 
 if WINDOWS:
     DIRECTORY = str(path.Path.home() / 'Pictures/collect')
@@ -0,0 +1,247 @@
+"""Serve collect commands from a long-running process over a Unix socket"""
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+
+from . import config
+from .logger import Logger
+
+if not hasattr(socket, 'AF_UNIX'):
+    raise ImportError('Unix domain sockets are not available')
+
+__all__ = ['SUBCOMMANDS', 'DaemonServer', 'request', 'socket_path']
+
+# Subcommands that a running daemon answers for the command line script.
+SUBCOMMANDS = frozenset({'reddit', 'random', 'clear'})
+
+
+def socket_path(directory):
+    """Return the path of the daemon socket for a collection directory."""
+    return os.path.join(os.fspath(directory), config.STATE_DIRNAME,
+                        'daemon.sock')
+
+
+def _is_listening(path):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            return False
+        else:
+            return True
+
+
+def request(path, argv, timeout=config.DAEMON_TIMEOUT, stdout=None,
+            stderr=None):
+    """Send command line arguments to the daemon listening at path, write
+    its output to stdout and stderr (by default sys.stdout and sys.stderr)
+    line by line as the command runs, and return its exit status. Return
+    None if no daemon is listening, or if it does not take the command or
+    stops sending the heartbeats of a running command for timeout seconds
+    before any output. A daemon that stops answering after that fails the
+    command."""
+    streams = {
+        'stdout': sys.stdout if stdout is None else stdout,
+        'stderr': sys.stderr if stderr is None else stderr,
+    }
+    started = False
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+
+        try:
+            sock.connect(path)
+            sock.sendall(json.dumps({'argv': argv}).encode() + b'\n')
+
+            with sock.makefile('rb') as file:
+                for line in file:
+                    message = json.loads(line.decode())
+
+                    if 'exit' in message:
+                        return message['exit']
+
+                    for name, text in message.items():
+                        streams[name].write(text)
+                        streams[name].flush()
+                        started = True
+        except (FileNotFoundError, ConnectionRefusedError, PermissionError):
+            return None
+        except socket.timeout:
+            Logger.warning('The daemon at %s did not answer for %s seconds',
+                           path, timeout)
+        except (OSError, ValueError) as error:
+            Logger.debug('Could not talk to the daemon at %s: %s',
+                         path, error)
+        else:
+            Logger.debug('Daemon closed the connection: %s', path)
+
+    return 1 if started else None
+
+
+class _Channel:
+    """Text stream sending each complete line written to it to a client as a
+    message named name."""
+
+    def __init__(self, send, name):
+        self.send = send
+        self.name = name
+        self.buffer = ''
+
+    def write(self, string):
+        self.buffer += string
+        end = self.buffer.rfind('\n') + 1
+
+        if end:
+            self.send({self.name: self.buffer[:end]})
+            self.buffer = self.buffer[end:]
+
+        return len(string)
+
+    def flush(self):
+        if self.buffer:
+            self.send({self.name: self.buffer})
+            self.buffer = ''
+
+
+class _ThreadStream:
+    """Stand-in for sys.stdout or sys.stderr that writes to a per-thread
+    stream while one is set."""
+
+    def __init__(self, default):
+        self.default = default
+        self.local = threading.local()
+
+    @property
+    def stream(self):
+        return getattr(self.local, 'stream', None) or self.default
+
+    def write(self, string):
+        return self.stream.write(string)
+
+    def flush(self):
+        return self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.default, name)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        self.lock = threading.Lock()
+
+    def send(self, message):
+        with self.lock:
+            try:
+                self.wfile.write(json.dumps(message).encode() + b'\n')
+            except OSError as error:
+                Logger.debug('Client went away: %s', error)
+
+    def heartbeat(self, done):
+        """Tell the client that the command is still running until done is
+        set."""
+        while not done.wait(config.DAEMON_TIMEOUT / 4):
+            self.send({})
+
+    def handle(self):
+        line = self.rfile.readline()
+
+        if not line:
+            return
+
+        done = threading.Event()
+        threading.Thread(target=self.heartbeat, args=(done, ),
+                         daemon=True).start()
+
+        try:
+            exit = self.server.run(json.loads(line.decode())['argv'],
+                                   self.send)
+        finally:
+            done.set()
+
+        self.send({'exit': exit})
+
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Answer collect commands for one collection directory. The HTTP
+    session, Index and listing cache stay loaded between commands. Each
+    command runs in its own thread with its own log level, and its output
+    is sent to its client line by line as it is written."""
+    daemon_threads = True
+
+    def __init__(self, parser, collector):
+        self.parser = parser
+        self.collector = collector
+        self.path = socket_path(collector)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        if _is_listening(self.path):
+            raise OSError('A daemon is already listening on %s' % self.path)
+        elif os.path.exists(self.path):
+            os.remove(self.path)  # left behind by a daemon that died
+
+        super().__init__(self.path, _Handler)
+        os.chmod(self.path, 0o600)
+
+    def warm_up(self):
+        """Load what the commands would otherwise load on every run."""
+        from .session import get_session
+        get_session()
+        self.collector.index.refresh()
+
+    def run(self, argv, send):
+        """Run the command line arguments against this daemon's directory,
+        passing each line of its output to send() as a message for
+        request(), and return its exit status."""
+        stdout = _Channel(send, 'stdout')
+        stderr = _Channel(send, 'stderr')
+        sys.stdout.local.stream = stdout
+        sys.stderr.local.stream = stderr
+
+        try:
+            with Logger.isolated():
+                args = self.parser.parse_command(argv)
+
+                if args.subcommand not in SUBCOMMANDS:
+                    self.parser.error('the daemon does not run %r'
+                                      % args.subcommand)
+
+                args.collector = self.collector
+                exit = self.parser.run(args).exit
+        except SystemExit as error:
+            exit = error.code
+        except Exception as error:
+            Logger.critical('%s: %s', error.__class__.__name__, error)
+            exit = 1
+        finally:
+            sys.stdout.local.stream = None
+            sys.stderr.local.stream = None
+            stdout.flush()
+            stderr.flush()
+
+        return exit
+
+    def serve_forever(self, *args, **kwargs):
+        if not isinstance(sys.stdout, _ThreadStream):
+            sys.stdout = _ThreadStream(sys.stdout)
+        if not isinstance(sys.stderr, _ThreadStream):
+            sys.stderr = _ThreadStream(sys.stderr)
+
+        self.warm_up()
+        Logger.info('Listening on %s', self.path)
+
+        try:
+            super().serve_forever(*args, **kwargs)
+        finally:
+            self.server_close()
+
+    def server_close(self):
+        super().server_close()
+
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,576 @@
+"""Persistent index of the images in a collection directory"""
+import concurrent.futures
+import hashlib
+import itertools
+import json
+import mimetypes
+import os
+import random
+import threading
+import time
+
+from . import config
+from . import layout as _layout
+from .logger import Logger
+
+__all__ = ['EVICTION_POLICIES', 'Index', 'hash_file']
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS images (
+    fname TEXT PRIMARY KEY,
+    url TEXT,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    mime TEXT,
+    hash TEXT,
+    listing TEXT,
+    slot INTEGER,
+    added REAL,
+    atime REAL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS images_url ON images (url);
+CREATE INDEX IF NOT EXISTS images_hash ON images (hash);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value
+);
+
+-- Every row holds a distinct slot in 0..n-1 so that a uniformly random row
+-- can be fetched through the slot index without counting or scanning the
+-- table.
+CREATE UNIQUE INDEX IF NOT EXISTS images_slot ON images (slot);
+
+-- Eviction: the order in which each policy gives up files, backed by an
+-- index so that picking the next file is a single lookup. The total size of
+-- the files is kept up to date by triggers so that it never needs a table
+-- scan.
+CREATE INDEX IF NOT EXISTS images_atime ON images (atime);
+CREATE INDEX IF NOT EXISTS images_hits ON images (hits, atime);
+CREATE INDEX IF NOT EXISTS images_added ON images (added);
+INSERT OR IGNORE INTO meta (key, value)
+    SELECT 'total_size', coalesce(sum(size), 0) FROM images;
+CREATE TRIGGER IF NOT EXISTS images_size_insert AFTER INSERT ON images BEGIN
+    UPDATE meta SET value = value + new.size WHERE key = 'total_size';
+END;
+CREATE TRIGGER IF NOT EXISTS images_size_delete AFTER DELETE ON images BEGIN
+    UPDATE meta SET value = value - old.size WHERE key = 'total_size';
+END;
+CREATE TRIGGER IF NOT EXISTS images_size_update
+AFTER UPDATE OF size ON images BEGIN
+    UPDATE meta SET value = value - old.size + new.size
+    WHERE key = 'total_size';
+END;
+
+-- Prefetch spool: images downloaded ahead of time and not shown yet, taken
+-- oldest first from the listing they came from through the listing index. A
+-- spooled image that leaves the directory leaves the spool with it.
+CREATE TABLE IF NOT EXISTS spool (
+    fname TEXT PRIMARY KEY,
+    listing TEXT,
+    title TEXT,
+    permalink TEXT
+);
+CREATE INDEX IF NOT EXISTS spool_listing ON spool (listing);
+CREATE TRIGGER IF NOT EXISTS spool_image_delete AFTER DELETE ON images BEGIN
+    DELETE FROM spool WHERE fname = old.fname;
+END;
+'''
+
+_EVICTION_ORDER = {
+    'lru': 'atime',
+    'lfu': 'hits, atime',
+    'oldest': 'added',
+}
+EVICTION_POLICIES = tuple(_EVICTION_ORDER)
+
+_UPSERT = '''
+INSERT INTO images (
+    fname, url, size, mtime, mime, hash, listing, added, atime, slot)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?,
+        (SELECT coalesce(max(slot), -1) + 1 FROM images))
+ON CONFLICT (fname) DO UPDATE SET
+    url = coalesce(excluded.url, url),
+    size = excluded.size,
+    mtime = excluded.mtime,
+    mime = coalesce(excluded.mime, mime),
+    hash = excluded.hash,
+    listing = coalesce(excluded.listing, listing)
+'''
+
+
+def hash_file(path):
+    """Return the hex SHA-256 digest of a file's contents."""
+    digest = hashlib.sha256()
+
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(config.CHUNK_SIZE), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def _hash_or_none(path):
+    try:
+        return hash_file(path)
+    except OSError as error:
+        Logger.debug('Could not hash %s: %s', path, error)
+
+
+class Index:
+    """SQLite record of every image in a collection directory: its URL, file
+    name, size, mtime, MIME type, content hash and source listing.
+
+    The index lives in the directory's config.STATE_DIRNAME folder. Changes
+    made by collect are recorded as they happen; changes made by anything
+    else are picked up by refresh(), which compares the mtime of each folder
+    holding images with the one recorded at the last sync and rescans the
+    folders that changed. It also records the layout that the images are
+    kept in."""
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, directory):
+        import sqlite3
+
+        self.directory = os.path.abspath(directory)
+        state_dir = os.path.join(self.directory, config.STATE_DIRNAME)
+        os.makedirs(state_dir, exist_ok=True)
+        self.path = os.path.join(state_dir, 'index.sqlite3')
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode = WAL')
+        self._db.execute('PRAGMA synchronous = NORMAL')
+        self._db.executescript(_SCHEMA)
+
+    @classmethod
+    def open(cls, directory):
+        """Return the Index shared by the whole process for directory."""
+        key = os.path.abspath(directory)
+
+        with cls._instances_lock:
+            try:
+                return cls._instances[key]
+            except KeyError:
+                self = cls._instances[key] = cls(key)
+                return self
+
+    def _get_meta(self, key):
+        row = self._db.execute(
+            'SELECT value FROM meta WHERE key = ?', (key, )).fetchone()
+        return None if row is None else row[0]
+
+    def _set_meta(self, key, value):
+        self._db.execute(
+            'INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+            (key, value))
+
+    def _folder_mtimes(self, fname=None):
+        return _layout.mtimes(self.directory, self.layouts, fname)
+
+    def _synced_mtimes(self):
+        try:
+            return json.loads(self._get_meta('folder_mtimes'))
+        except (TypeError, ValueError):
+            return {}
+
+    def _max_slot(self):
+        return self._db.execute('SELECT max(slot) FROM images').fetchone()[0]
+
+    def _delete(self, fname):
+        """Delete a row and move the row in the last slot into its slot."""
+        row = self._db.execute(
+            'SELECT slot FROM images WHERE fname = ?', (fname, )).fetchone()
+
+        if row is None:
+            return
+
+        slot, = row
+        self._db.execute('DELETE FROM images WHERE fname = ?', (fname, ))
+        last_slot = self._max_slot()
+
+        if last_slot is not None and last_slot > slot:
+            self._db.execute(
+                'UPDATE images SET slot = ? WHERE slot = ?', (slot, last_slot))
+
+    def _mark_synced(self, fname=None):
+        """Record the mtimes of the folders holding the images as of the
+        last sync, only updating the ones holding fname if given."""
+        mtimes = {}
+
+        if fname is not None:
+            mtimes = self._synced_mtimes()
+
+            for layout in self.layouts:
+                for folder in _layout.folders(layout, fname):
+                    mtimes.pop(folder, None)
+
+        mtimes.update(self._folder_mtimes(fname))
+        self._set_meta('folder_mtimes', json.dumps(mtimes, sort_keys=True))
+
+    @property
+    def layout(self):
+        """The layout that images are saved in, one of layout.LAYOUTS."""
+        return self.layouts[0]
+
+    @property
+    def layouts(self):
+        """The layouts that images are found in: the layout, followed by
+        the one it replaces while a migration is under way."""
+        with self._lock:
+            meta = dict(self._db.execute(
+                "SELECT key, value FROM meta WHERE key IN "
+                "('layout', 'migrating')"))
+
+        layout = meta.get('layout') or 'flat'
+
+        if not meta.get('migrating'):
+            return (layout, )
+
+        return (layout, ) + tuple(
+            other for other in _layout.LAYOUTS if other != layout)
+
+    def relpath(self, fname):
+        """Return the path of the image fname relative to the directory:
+        where the layout puts it, unless it is still where the layout being
+        migrated from put it."""
+        layouts = self.layouts
+
+        if len(layouts) > 1:
+            for layout in layouts:
+                path = _layout.relpath(fname, layout)
+
+                if os.path.lexists(os.path.join(self.directory, path)):
+                    return path
+
+        return _layout.relpath(fname, layouts[0])
+
+    def begin_migration(self, layout):
+        """Save images in layout from now on while still finding them in
+        the current one, until end_migration(). Return the layout that the
+        images are being moved out of, or None if there is nothing to do."""
+        with self._lock, self._db:
+            layouts = self.layouts
+
+            if layouts == (layout, ):
+                return None
+
+            self._set_meta('layout', layout)
+            self._set_meta('migrating', 1)
+
+        return next(other for other in layouts if other != layout)
+
+    def end_migration(self):
+        """Stop looking for images in the layout migrated from."""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM meta WHERE key = 'migrating'")
+
+    def refresh(self, force=False):
+        """Bring the index up to date with files added, changed or removed
+        outside of collect. Nothing is scanned if the directory is unchanged
+        since the last sync. Otherwise only the folders whose mtime changed
+        are scanned, unless a migration is under way. New or changed files
+        are recorded from their stat alone, without a hash, until
+        hash_missing() is called."""
+        with self._lock, self._db:
+            layouts = self.layouts
+            mtimes = self._folder_mtimes()
+            synced = self._synced_mtimes()
+
+            if not force and mtimes == synced:
+                return
+
+            known = {
+                fname: (size, mtime)
+                for fname, size, mtime in self._db.execute(
+                    'SELECT fname, size, mtime FROM images')
+            }
+            only = None
+
+            if not force and len(layouts) == 1:
+                only = {
+                    folder for folder in mtimes.keys() | synced.keys()
+                    if mtimes.get(folder) != synced.get(folder)
+                }
+                known = {
+                    fname: stat for fname, stat in known.items()
+                    if _layout.folders(layouts[0], fname)[0] in only
+                }
+
+            changed = []
+            seen = set()
+
+            # While a migration is under way, the layout it moves images out
+            # of is scanned first so that an image moved meanwhile is found
+            # in the new one.
+            for layout in reversed(layouts):
+                for entry in _layout.scan(self.directory, layout, only):
+                    if entry.name in seen:
+                        continue
+
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+
+                    seen.add(entry.name)
+                    old = known.pop(entry.name, None)
+
+                    if old != (stat.st_size, stat.st_mtime_ns):
+                        changed.append((entry, stat))
+
+            now = time.time()
+
+            for entry, stat in changed:
+                mime, _ = mimetypes.guess_type(entry.name, strict=False)
+                self._db.execute(_UPSERT, (
+                    entry.name, None, stat.st_size, stat.st_mtime_ns, mime,
+                    None, None, now, now))
+
+            for fname in known:
+                self._delete(fname)
+
+            self._set_meta('folder_mtimes', json.dumps(mtimes, sort_keys=True))
+
+        if changed or known:
+            Logger.debug('Indexed %s: %d changed, %d removed',
+                         self.directory, len(changed), len(known))
+
+    def hash_missing(self, workers=1, size=None):
+        """Hash the indexed files that refresh() recorded without a hash,
+        only the ones of size bytes if given, up to workers at once. Return
+        the number of files hashed."""
+        query = 'SELECT fname, size, mtime FROM images WHERE hash IS NULL'
+        params = ()
+
+        if size is not None:
+            query += ' AND size = ?'
+            params = (size, )
+
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+
+        paths = [
+            os.path.join(self.directory, self.relpath(fname))
+            for fname, _, _ in rows
+        ]
+
+        if workers > 1 and len(paths) > 1:
+            with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+                hashes = list(pool.map(_hash_or_none, paths))
+        else:
+            hashes = list(map(_hash_or_none, paths))
+
+        # A file changed since it was listed keeps no hash until refresh()
+        # records its new size and mtime.
+        updates = [
+            (hash, fname, size, mtime)
+            for (fname, size, mtime), hash in zip(rows, hashes)
+            if hash is not None
+        ]
+
+        with self._lock, self._db:
+            self._db.executemany(
+                'UPDATE images SET hash = ? WHERE fname = ? AND size = ? '
+                'AND mtime = ? AND hash IS NULL', updates)
+
+        if updates:
+            Logger.debug('Hashed %d files in %s', len(updates),
+                         self.directory)
+
+        return len(updates)
+
+    def add(self, fname, url=None, mime=None, hash=None, listing=None):
+        """Record a file that collect just saved into the directory."""
+        stat = os.stat(os.path.join(self.directory, self.relpath(fname)))
+        now = time.time()
+
+        with self._lock, self._db:
+            self._db.execute(_UPSERT, (
+                fname, url, stat.st_size, stat.st_mtime_ns, mime, hash,
+                listing, now, now))
+            self._mark_synced(fname)
+
+    def touch(self, fname):
+        """Record that fname was just served, which also takes it out of the
+        spool."""
+        with self._lock, self._db:
+            self._db.execute(
+                'UPDATE images SET atime = ?, hits = hits + 1 WHERE fname = ?',
+                (time.time(), fname))
+            self._db.execute('DELETE FROM spool WHERE fname = ?', (fname, ))
+
+    def remove(self, fname):
+        """Forget a file that collect just removed from the directory."""
+        with self._lock, self._db:
+            self._delete(fname)
+            self._mark_synced(fname)
+
+    def clear(self):
+        """Forget every file after the directory was emptied."""
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM images')
+            self._mark_synced()
+
+    def get(self, fname):
+        """Return the record for fname as a dict, or None."""
+        with self._lock:
+            cursor = self._db.execute(
+                'SELECT * FROM images WHERE fname = ?', (fname, ))
+            row = cursor.fetchone()
+
+        if row is not None:
+            return dict(zip((col[0] for col in cursor.description), row))
+
+    def find_url(self, url):
+        """Return the name of a file downloaded from url, or None."""
+        with self._lock:
+            row = self._db.execute(
+                'SELECT fname FROM images WHERE url = ? LIMIT 1', (url, )
+            ).fetchone()
+
+        return None if row is None else row[0]
+
+    def find_hash(self, hash, size=None):
+        """Return the name of a file with the content hash, or None. If the
+        size of the contents is given, the files of that size that have no
+        hash yet are hashed first."""
+        if size is not None:
+            self.hash_missing(size=size)
+
+        with self._lock:
+            row = self._db.execute(
+                'SELECT fname FROM images WHERE hash = ? '
+                'ORDER BY slot LIMIT 1',
+                (hash, ),
+            ).fetchone()
+
+        return None if row is None else row[0]
+
+    def duplicates(self):
+        """Return a list of (hash, fnames) for every content hash held by
+        more than one file, the file that was indexed first coming first."""
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT hash, fname FROM images WHERE hash IN ('
+                '    SELECT hash FROM images WHERE hash IS NOT NULL'
+                '    GROUP BY hash HAVING count(*) > 1'
+                ') ORDER BY hash, slot').fetchall()
+
+        return [
+            (hash, [fname for _, fname in group])
+            for hash, group in itertools.groupby(rows, lambda row: row[0])
+        ]
+
+    def total_size(self):
+        """Return the sum of the sizes of the indexed files in bytes. Files
+        hard linked together count once for each name."""
+        with self._lock:
+            return self._get_meta('total_size')
+
+    def victim(self, policy=config.EVICTION, exclude=()):
+        """Return the indexed file name that the eviction policy, one of
+        EVICTION_POLICIES, gives up first, leaving out the names in exclude
+        and the spooled images. Return None if there is none."""
+        exclude = list(exclude)
+        query = 'SELECT fname FROM images WHERE fname NOT IN (' \
+            'SELECT fname FROM spool)'
+
+        if exclude:
+            query += ' AND fname NOT IN (%s)' % ', '.join('?' * len(exclude))
+
+        query += ' ORDER BY %s LIMIT 1' % _EVICTION_ORDER[policy]
+
+        with self._lock:
+            row = self._db.execute(query, exclude).fetchone()
+
+        return None if row is None else row[0]
+
+    def spool(self, fname, listing=None, title=None, permalink=None):
+        """Add the indexed file fname to the spool of images ready to be
+        shown, with the listing and post it came from."""
+        with self._lock, self._db:
+            self._db.execute(
+                'INSERT OR REPLACE INTO spool (fname, listing, title, '
+                'permalink) VALUES (?, ?, ?, ?)',
+                (fname, listing, title, permalink))
+
+    def unspool(self, listing):
+        """Take the image spooled first from listing out of the spool and
+        return its record as a dict with fname, listing, title and
+        permalink, or None if there is none. Another process cannot take
+        the same image."""
+        with self._lock, self._db:
+            self._db.execute('BEGIN IMMEDIATE')
+            cursor = self._db.execute(
+                'SELECT * FROM spool WHERE listing = ? ORDER BY rowid LIMIT 1',
+                (listing, ))
+            row = cursor.fetchone()
+
+            if row is None:
+                return None
+
+            record = dict(zip((col[0] for col in cursor.description), row))
+            self._db.execute(
+                'DELETE FROM spool WHERE fname = ?', (record['fname'], ))
+
+        return record
+
+    def spool_counts(self, listings):
+        """Return {listing: number of spooled images} for the listings that
+        have any."""
+        listings = list(listings)
+
+        with self._lock:
+            return dict(self._db.execute(
+                'SELECT listing, count(*) FROM spool WHERE listing IN (%s) '
+                'GROUP BY listing' % ', '.join('?' * len(listings)),
+                listings))
+
+    @property
+    def spool_size(self):
+        """The number of images that the spool is to hold, as last set by
+        Collect.prefetch()."""
+        with self._lock:
+            return self._get_meta('spool_size') or 0
+
+    @spool_size.setter
+    def spool_size(self, size):
+        with self._lock, self._db:
+            self._set_meta('spool_size', size)
+
+    def random(self):
+        """Return a random indexed file name, or None if the index is empty.
+        This is two lookups in the slot index regardless of the number of
+        files."""
+        with self._lock:
+            last_slot = self._max_slot()
+
+            if last_slot is None:
+                return None
+
+            fname, = self._db.execute(
+                'SELECT fname FROM images WHERE slot = ?',
+                (random.randint(0, last_slot), ),
+            ).fetchone()
+
+        return fname
+
+    def __contains__(self, fname):
+        with self._lock:
+            return self._db.execute(
+                'SELECT 1 FROM images WHERE fname = ?', (fname, )
+            ).fetchone() is not None
+
+    def __len__(self):
+        with self._lock:
+            last_slot = self._max_slot()
+
+        return 0 if last_slot is None else last_slot + 1
+
+    def __repr__(self):
+        cls = self.__class__
+        module = cls.__module__
+        name = cls.__name__
+        return '%s.%s(%r)' % (module, name, self.directory)
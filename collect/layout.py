@@ -0,0 +1,94 @@
+"""Where the images of a collection directory are kept
+
+In the flat layout every image is a file directly inside the directory. The
+sharded layout spreads them over 256 folders two levels down, named after the
+first two hex digits of the SHA-1 of the file name, so that no folder has to
+list more than a small share of a large collection: 'a.jpg' is kept as
+'5/6/a.jpg'. Either way an image is known by its file name alone.
+
+Each level takes one hex digit rather than two. Two would make 65536
+folders, and the Index has to stat every one of them to notice images
+added or removed outside of collect, while 256 folders already keep a
+million images to about 4000 per folder."""
+import hashlib
+import itertools
+import os
+
+__all__ = ['LAYOUTS', 'folders', 'mtimes', 'relpath', 'scan', 'shards']
+
+LAYOUTS = ('flat', 'sharded')
+_DIGITS = '0123456789abcdef'
+_DEPTH = 2
+
+
+def _digits(fname):
+    return hashlib.sha1(os.fsencode(fname)).hexdigest()[:_DEPTH]
+
+
+def relpath(fname, layout):
+    """Return the path of the image fname relative to the directory."""
+    if layout == 'flat':
+        return fname
+
+    return os.path.join(*_digits(fname), fname)
+
+
+def shards(directory):
+    """Return the shard folders of directory, parents before their
+    children."""
+    return [
+        os.path.join(directory, *prefix)
+        for depth in range(1, _DEPTH + 1)
+        for prefix in itertools.product(_DIGITS, repeat=depth)
+    ]
+
+
+def folders(layout, fname=None):
+    """Return the folders that hold the images of layout, relative to the
+    directory, or only the one holding fname."""
+    if fname is not None:
+        return [os.path.dirname(relpath(fname, layout))]
+    elif layout == 'flat':
+        return ['']
+
+    return [
+        os.path.join(*prefix)
+        for prefix in itertools.product(_DIGITS, repeat=_DEPTH)
+    ]
+
+
+def mtimes(directory, layouts, fname=None):
+    """Return {folder: mtime in nanoseconds} for the folders() of directory
+    in any of layouts, or only the ones holding fname. A folder's mtime
+    changes whenever an image is added to or removed from it. Missing
+    folders are left out."""
+    result = {}
+
+    for layout in layouts:
+        for folder in folders(layout, fname):
+            try:
+                result[folder] = os.stat(
+                    os.path.join(directory, folder)).st_mtime_ns
+            except FileNotFoundError:
+                pass
+
+    return result
+
+
+def scan(directory, layout, only=None):
+    """Generate an os.DirEntry for each image file of directory in layout,
+    or only in the folders() given. Names starting with a dot are collect's
+    own and are skipped, as are missing shard folders."""
+    for folder in folders(layout):
+        if only is not None and folder not in only:
+            continue
+
+        try:
+            entries = os.scandir(os.path.join(directory, folder))
+        except FileNotFoundError:
+            continue
+
+        with entries:
+            for entry in entries:
+                if not entry.name.startswith('.') and entry.is_file():
+                    yield entry
@@ -0,0 +1,272 @@
+"""Fetching and caching Reddit listings
+
+Listings are read from Reddit's public JSON endpoints through the shared
+HTTP session rather than through praw. praw keeps the response headers to
+itself, so it can neither send the conditional requests that revalidate a
+cached listing nor pass on the rate limit headers that the Scheduler
+follows, and it needs OAuth credentials in praw.ini although collect only
+reads public listings."""
+import atexit
+import collections
+import hashlib
+import json
+import os
+import threading
+import time
+from urllib.parse import (
+    parse_qsl, urlencode, urljoin, urlsplit, urlunsplit)
+
+from . import config
+from .logger import Logger
+from .metrics import Metrics
+
+__all__ = ['ListingCache', 'listing_url', 'page_url', 'parse_listing']
+
+
+def listing_url(api_url):
+    """Return the JSON endpoint for a listing such as
+    r/earthporn/hot?limit=10, relative to config.REDDIT_API."""
+    parts = urlsplit(urljoin(config.REDDIT_API, api_url))
+    path = parts.path.rstrip('/')
+
+    if not path.endswith('.json'):
+        path += '.json'
+
+    query = '&'.join(filter(None, (parts.query, 'raw_json=1')))
+    return urlunsplit(parts._replace(path=path, query=query))
+
+
+def page_url(api_url, after):
+    """Return the listing URL for the page that follows the post named
+    after."""
+    parts = urlsplit(api_url)
+    query = [(key, value) for key, value in parse_qsl(parts.query)
+             if key != 'after']
+    query.append(('after', after))
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def parse_listing(data):
+    """Return the posts in a decoded listing response as a list of dicts with
+    the url, title and permalink of each link submission."""
+    return [
+        {
+            'url': child['data']['url'],
+            'title': child['data']['title'],
+            'permalink': child['data']['permalink'],
+        }
+        for child in data['data']['children']
+        if child['kind'] == 't3'
+    ]
+
+
+class ListingCache:
+    """Listings stored as JSON files keyed by API URL in a directory.
+
+    A listing younger than ttl seconds is served without any request. An
+    older one is revalidated with If-None-Match/If-Modified-Since when the
+    server sent an ETag or Last-Modified. If it is no older than ttl + stale
+    seconds, it is served right away while a background thread revalidates
+    it, which the process waits for at exit as wait() does. If Reddit
+    cannot be reached, a cached listing of any age is served rather than
+    failing.
+
+    The config.LISTING_MEMORY entries loaded last are also kept in memory
+    for as long as their file is unchanged, which keeps listings warm in a
+    long-running process."""
+
+    _memory = collections.OrderedDict()
+    _memory_lock = threading.Lock()
+    _memory_size = config.LISTING_MEMORY
+    _revalidations = set()
+    _waits_at_exit = False
+
+    def __init__(self, directory, ttl=config.LISTING_TTL,
+                 stale=config.LISTING_STALE, timeout=config.TIMEOUT):
+        self.directory = directory
+        self.ttl = ttl
+        self.stale = stale
+        self.timeout = timeout
+
+    def _path(self, api_url):
+        key = hashlib.sha1(api_url.encode()).hexdigest()
+        return os.path.join(self.directory, key + '.json')
+
+    def load(self, api_url):
+        """Return the cache entry for api_url, or None."""
+        path = self._path(api_url)
+
+        try:
+            mtime = os.stat(path).st_mtime_ns
+
+            with self._memory_lock:
+                cached_mtime, entry = self._memory.get(path, (None, None))
+
+            if cached_mtime != mtime:
+                with open(path) as file:
+                    entry = json.load(file)
+        except (OSError, ValueError):
+            return None
+
+        with self._memory_lock:
+            self._memory[path] = mtime, entry
+            self._memory.move_to_end(path)
+
+            while len(self._memory) > self._memory_size:
+                self._memory.popitem(last=False)
+
+        if entry.get('url') == api_url:
+            return entry
+
+    def store(self, api_url, entry):
+        """Save the cache entry for api_url."""
+        path = self._path(api_url)
+        temp_path = '%s.%d.%d' % (path, os.getpid(), threading.get_ident())
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+
+            with open(temp_path, 'w') as file:
+                json.dump(entry, file)
+
+            os.replace(temp_path, path)
+        except OSError as error:
+            Logger.debug('Could not cache listing %s: %s', api_url, error)
+
+    def validators(self, entry):
+        """Return the headers that make a request for the listing in entry
+        conditional."""
+        headers = {}
+
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        return headers
+
+    def new_entry(self, api_url, headers, data):
+        """Return the cache entry for a decoded listing response with the
+        given headers."""
+        return {
+            'url': api_url,
+            'time': time.time(),
+            'etag': headers.get('etag'),
+            'last_modified': headers.get('last-modified'),
+            'after': data['data'].get('after'),
+            'posts': parse_listing(data),
+        }
+
+    def freshness(self, entry):
+        """Return 'fresh' if entry can be served as it is, 'stale' if it can
+        be served while it is revalidated, or None if it has to be
+        fetched."""
+        age = None if entry is None else time.time() - entry['time']
+
+        if age is not None and 0 <= age < self.ttl:
+            return 'fresh'
+        elif age is not None and 0 <= age < self.ttl + self.stale:
+            return 'stale'
+
+    def fetch(self, api_url, entry=None):
+        """Request the listing, conditionally if entry has validators, and
+        return the new entry. Raises ConnectionError if Reddit could not be
+        reached or did not answer with a listing, for example for a private
+        or banned subreddit."""
+        import requests
+        from .session import get_session
+
+        try:
+            with Metrics.phase('listing_fetch'):
+                res = get_session().get(
+                    listing_url(api_url), headers=self.validators(entry),
+                    timeout=self.timeout)
+        except requests.RequestException as error:
+            raise ConnectionError('Could not fetch %s: %s' % (api_url, error))
+
+        with res:
+            if res.status_code == 304 and entry is not None:
+                Logger.debug('Listing not modified: %s', api_url)
+                Metrics.count('listing_cache', result='not_modified')
+                entry = dict(entry, time=time.time())
+            elif res.status_code >= 400:
+                raise ConnectionError('Could not fetch %s: HTTP %d'
+                                      % (api_url, res.status_code))
+            else:
+                try:
+                    Metrics.count('bytes_received', len(res.content))
+                    entry = self.new_entry(api_url, res.headers, res.json())
+                except (requests.RequestException, AttributeError,
+                        KeyError, TypeError, ValueError) as error:
+                    raise ConnectionError('Bad listing %s: %s'
+                                          % (api_url, error))
+
+        self.store(api_url, entry)
+        return entry
+
+    def _revalidate_quietly(self, api_url, entry):
+        try:
+            self.fetch(api_url, entry)
+        except Exception as error:
+            Logger.debug('Background revalidation failed: %s', error)
+        finally:
+            self._revalidations.discard(threading.current_thread())
+
+    def _revalidate_in_background(self, api_url, entry):
+        # A daemon thread that the process waits for at exit for a while
+        # only, so that a slow revalidation does not hold up the run.
+        thread = threading.Thread(
+            target=self._revalidate_quietly, args=(api_url, entry),
+            daemon=True)
+
+        if not ListingCache._waits_at_exit:
+            ListingCache._waits_at_exit = True
+            atexit.register(ListingCache.wait)
+
+        self._revalidations.add(thread)
+        thread.start()
+
+    @classmethod
+    def wait(cls, timeout=config.LISTING_EXIT_WAIT):
+        """Wait up to timeout seconds in all for the background
+        revalidations still running to finish."""
+        deadline = time.monotonic() + timeout
+
+        for thread in list(cls._revalidations):
+            thread.join(max(deadline - time.monotonic(), 0))
+
+    def get(self, api_url):
+        """Return the posts of the listing at api_url as parse_listing()
+        does, from the cache when possible."""
+        return self.get_entry(api_url)['posts']
+
+    def get_entry(self, api_url):
+        """Return the cache entry of the listing at api_url, from the cache
+        when possible. Its posts are as parse_listing() returns them, and
+        after names the last post for page_url(), or is None on the last
+        page."""
+        entry = self.load(api_url)
+        freshness = self.freshness(entry)
+
+        if freshness == 'fresh':
+            Logger.debug('Listing cache hit: %s', api_url)
+            Metrics.count('listing_cache', result='hit')
+            return entry
+
+        if freshness == 'stale':
+            Logger.debug('Listing cache stale, revalidating: %s', api_url)
+            Metrics.count('listing_cache', result='stale')
+            self._revalidate_in_background(api_url, entry)
+            return entry
+
+        Metrics.count('listing_cache', result='miss')
+
+        try:
+            return self.fetch(api_url, entry)
+        except ConnectionError as error:
+            if entry is None:
+                raise
+            Logger.warning('Serving cached listing: %s', error)
+            Metrics.count('listing_cache', result='offline')
+            return entry
@@ -1,5 +1,7 @@
+import contextlib
 import logging
 import sys
+import threading
 
 
 class StdErrHandler(logging.Handler):
@@ -29,6 +31,38 @@ class Logger(logging.Logger):
         super().__init__(__name__)
         self.handler = StdErrHandler()
         super().addHandler(self.handler)
+        self.local = threading.local()
+
+    def setLevel(self, level):
+        if getattr(self.local, 'isolated', False):
+            if isinstance(level, str):
+                level = logging.getLevelName(level)
+            self.local.level = level
+            return
+
+        super().setLevel(level)
+        # not registered with the logging manager, which would clear this
+        self._cache.clear()
+
+    def isEnabledFor(self, level):
+        thread_level = getattr(self.local, 'level', None)
+
+        if thread_level is None:
+            return super().isEnabledFor(level)
+
+        return level >= thread_level
+
+    @contextlib.contextmanager
+    def isolated(self):
+        """Context manager in which setLevel() only sets the level of the
+        calling thread."""
+        self.local.isolated = True
+
+        try:
+            yield
+        finally:
+            self.local.isolated = False
+            self.local.level = None
 
     def exit(self, *args, **kwargs):
         """Log the error and exit with status code 1."""
@@ -0,0 +1,153 @@
+"""Timings and counters for a collect run, with JSON and Prometheus export"""
+import contextlib
+import json
+import os
+import threading
+import time
+
+from .logger import _instantiate
+
+__all__ = ['Metrics']
+
+
+def _write_atomic(path, text):
+    temp_path = '%s.%d.tmp' % (path, os.getpid())
+
+    with open(temp_path, 'w') as file:
+        file.write(text)
+
+    os.replace(temp_path, path)
+
+
+def _prometheus_name(name):
+    return ''.join(char if char.isalnum() else '_' for char in name)
+
+
+def _prometheus_label(value):
+    return (str(value).replace('\\', r'\\').replace('"', r'\"')
+            .replace('\n', r'\n'))
+
+
+@_instantiate
+class Metrics:
+    """Time spent in each phase of the current run and counts of what
+    happened in it, shared by every thread of the process.
+
+    A phase may be entered many times and from several threads at once, so
+    its seconds add up the time of every entry rather than wall time. A
+    counter may be split by one label, such as the reason a candidate image
+    was rejected."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget everything recorded so far and start a new run."""
+        with self._lock:
+            self.start = time.time()
+            self._phases = {}
+            self._counters = {}
+            self._label_names = {}
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Context manager adding the time spent within to phase name."""
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name, seconds):
+        """Add one entry of seconds to phase name."""
+        with self._lock:
+            phase = self._phases.setdefault(name, [0.0, 0])
+            phase[0] += seconds
+            phase[1] += 1
+
+    def count(self, name, n=1, **label):
+        """Add n to counter name, under the value of label if one is given as
+        a keyword argument."""
+        with self._lock:
+            if not label:
+                self._counters[name] = self._counters.get(name, 0) + n
+                return
+
+            (label_name, value), = label.items()
+            self._label_names[name] = label_name
+            values = self._counters.setdefault(name, {})
+            values[value] = values.get(value, 0) + n
+
+    def snapshot(self):
+        """Return the metrics recorded so far as a dict."""
+        with self._lock:
+            return {
+                'start': self.start,
+                'seconds': time.time() - self.start,
+                'phases': {
+                    name: {'seconds': seconds, 'count': count}
+                    for name, (seconds, count) in self._phases.items()
+                },
+                'counters': {
+                    name: dict(value) if isinstance(value, dict) else value
+                    for name, value in self._counters.items()
+                },
+            }
+
+    def write_json(self, path):
+        """Write snapshot() to path as JSON."""
+        _write_atomic(path, json.dumps(self.snapshot(), indent=2,
+                                       sort_keys=True) + '\n')
+
+    def prometheus(self, prefix='collect'):
+        """Return snapshot() in the Prometheus text exposition format. Every
+        value describes the last run, so all of them are gauges."""
+        snapshot = self.snapshot()
+        lines = []
+
+        def gauge(name, help, samples):
+            name = '%s_%s' % (prefix, _prometheus_name(name))
+            lines.append('# HELP %s %s' % (name, help))
+            lines.append('# TYPE %s gauge' % name)
+
+            for labels, value in samples:
+                label_str = ','.join(
+                    '%s="%s"' % (key, _prometheus_label(label))
+                    for key, label in labels)
+                lines.append('%s%s %s' % (
+                    name, '{%s}' % label_str if label_str else '', value))
+
+        gauge('last_run_timestamp_seconds', 'Time the last run started.',
+              [((), snapshot['start'])])
+        gauge('last_run_seconds', 'Duration of the last run.',
+              [((), snapshot['seconds'])])
+        gauge('phase_seconds', 'Time spent in each phase of the last run.', [
+            ((('phase', name), ), phase['seconds'])
+            for name, phase in sorted(snapshot['phases'].items())
+        ])
+        gauge('phase_count', 'Times each phase was entered in the last run.', [
+            ((('phase', name), ), phase['count'])
+            for name, phase in sorted(snapshot['phases'].items())
+        ])
+
+        for name, value in sorted(snapshot['counters'].items()):
+            if isinstance(value, dict):
+                label_name = self._label_names[name]
+                samples = [
+                    (((label_name, label), ), count)
+                    for label, count in sorted(value.items())
+                ]
+            else:
+                samples = [((), value)]
+
+            gauge(name, 'Value of the %s counter in the last run.' % name,
+                  samples)
+
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path, prefix='collect'):
+        """Write prometheus() to path, such as a file for the node exporter's
+        textfile collector."""
+        _write_atomic(path, self.prometheus(prefix))
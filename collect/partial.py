@@ -0,0 +1,271 @@
+"""Downloads in progress that can be resumed after an interruption"""
+import hashlib
+import json
+import os
+import time
+
+from . import config
+from .logger import Logger
+
+if not config.WINDOWS:
+    import fcntl
+
+__all__ = ['Partial', 'collect_garbage']
+
+_PARTIAL_DIRNAME = 'partial'
+# Bytes read from the start of a partial file to check its magic bytes.
+_HEAD_SIZE = 16
+
+
+def _partial_dir(directory):
+    return os.path.join(directory, config.STATE_DIRNAME, _PARTIAL_DIRNAME)
+
+
+def _validator(etag, last_modified):
+    """Return the value for an If-Range header, or None. Weak ETags cannot be
+    used for ranges."""
+    if etag and not etag.startswith('W/'):
+        return etag
+
+    return last_modified or None
+
+
+def _lock(file):
+    """Lock file for this process. Return whether it was free."""
+    if config.WINDOWS:
+        return True
+
+    try:
+        fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+
+    return True
+
+
+class Partial:
+    """The .part file of an image being downloaded from url into directory,
+    kept in the partial folder of its state folder with the ETag and
+    Last-Modified of the response it came from.
+
+    A download that fails partway keeps its file if the server named a
+    validator, and the next attempt, in this run or a later one, asks for
+    the rest with a Range request. If-Range makes the server send the whole
+    image again if it changed in between. Open it with Partial.open()."""
+
+    def __init__(self, directory, url):
+        key = hashlib.sha1(url.encode()).hexdigest()
+        base = os.path.join(_partial_dir(directory), key)
+        self.url = url
+        self.path = base + '.part'
+        self.meta_path = base + '.json'
+        self.file = None
+        self.digest = hashlib.sha256()
+        self.head = b''
+        self.size = 0
+        self.validator = None
+
+    @classmethod
+    def open(cls, directory, url):
+        """Return the Partial for url in directory, locked for this process.
+        Raises ValueError if another process is downloading it."""
+        self = cls(directory, url)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        while True:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+            self.file = open(fd, 'r+b')
+
+            if not _lock(self.file):
+                self.file.close()
+                raise ValueError('Being downloaded by another process: %s'
+                                 % url)
+
+            # collect_garbage() may have deleted it before it was locked.
+            if os.path.exists(self.path) and os.path.samestat(
+                os.fstat(fd), os.stat(self.path)
+            ):
+                break
+
+            self.file.close()
+
+        try:
+            with open(self.meta_path) as file:
+                meta = json.load(file)
+        except (OSError, ValueError):
+            meta = {}
+
+        if meta.get('url') == url and meta.get('validator'):
+            self.validator = meta['validator']
+            self.head = self.file.read(_HEAD_SIZE)
+            self.file.seek(0)
+
+            for chunk in iter(lambda: self.file.read(config.CHUNK_SIZE), b''):
+                self.digest.update(chunk)
+
+            self.size = self.file.tell()
+        else:
+            self.reset()
+
+        return self
+
+    def range_headers(self):
+        """Return the headers asking for the rest of the image."""
+        if not self.size or self.validator is None:
+            return {}
+
+        return {'Range': 'bytes=%d-' % self.size, 'If-Range': self.validator}
+
+    def begin(self, status, headers):
+        """Prepare to write the body of a response with the given status and
+        headers, looked up by lowercase name. Return the number of bytes
+        kept from before, or 0 if the image starts over."""
+        content_range = headers.get('content-range', '')
+        start = content_range.partition(' ')[2].partition('-')[0]
+
+        if not (status == 206 and start.isdigit()
+                and int(start) == self.size):
+            self.reset()
+
+        self.validator = _validator(headers.get('etag'),
+                                    headers.get('last-modified'))
+        self._write_meta()
+        return self.size
+
+    def write(self, chunk):
+        """Append chunk to the file."""
+        self.file.write(chunk)
+        self.digest.update(chunk)
+        self.size += len(chunk)
+
+        if len(self.head) < _HEAD_SIZE:
+            self.head += chunk[:_HEAD_SIZE - len(self.head)]
+
+    def reset(self):
+        """Forget the bytes written so far."""
+        self.file.seek(0)
+        self.file.truncate()
+        self.digest = hashlib.sha256()
+        self.head = b''
+        self.size = 0
+
+    @property
+    def resumable(self):
+        """Whether the bytes written so far can be resumed from."""
+        return bool(self.size) and self.validator is not None
+
+    def complete(self, store):
+        """Hand the complete image to store(path, hash), which moves or
+        deletes the file at path, and forget it. The file stays locked
+        meanwhile where open files can be renamed."""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+        if config.WINDOWS:
+            self.file.close()
+
+        store(self.path, self.digest.hexdigest())
+        self._remove(self.meta_path)
+        self.close()
+
+    def abandon(self):
+        """Keep the file for a later attempt if it is resumable, otherwise
+        delete it. Does nothing once the Partial is closed."""
+        if self.file is None or self.file.closed:
+            return
+
+        self.file.flush()
+
+        if not self.resumable:
+            self.discard()
+            return
+
+        Logger.debug('Keeping %d bytes to resume: %s', self.size, self.url)
+        self.close()
+
+    def discard(self):
+        """Delete the file and its metadata."""
+        self._remove(self.path)
+        self._remove(self.meta_path)
+        self.close()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+    def _write_meta(self):
+        temp_path = '%s.%d.tmp' % (self.meta_path, os.getpid())
+
+        try:
+            with open(temp_path, 'w') as file:
+                json.dump({'url': self.url, 'validator': self.validator},
+                          file)
+
+            os.replace(temp_path, self.meta_path)
+        except OSError as error:
+            Logger.debug('Could not record partial %s: %s', self.url, error)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def collect_garbage(directory, max_age=config.PARTIAL_TTL):
+    """Delete the partial downloads of directory that were not written to
+    for max_age seconds, or whose metadata is gone. Return the number of
+    bytes freed."""
+    partial_dir = _partial_dir(directory)
+    now = time.time()
+    n_bytes = 0
+
+    try:
+        entries = list(os.scandir(partial_dir))
+    except FileNotFoundError:
+        return 0
+
+    names = {entry.name for entry in entries}
+
+    for entry in entries:
+        root, ext = os.path.splitext(entry.name)
+
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+
+        if ext == '.part':
+            stale = (now - stat.st_mtime > max_age
+                     or root + '.json' not in names)
+        else:
+            stale = root + '.part' not in names and now - stat.st_mtime > 60
+
+        if not stale:
+            continue
+
+        try:
+            with open(entry.path, 'rb') as file:
+                if not _lock(file):
+                    continue
+
+                os.remove(entry.path)
+        except OSError as error:
+            Logger.debug('Could not delete partial %s: %s', entry.name, error)
+            continue
+
+        if ext == '.part':
+            Partial._remove(os.path.join(partial_dir, root + '.json'))
+            n_bytes += stat.st_size
+
+    if n_bytes:
+        Logger.debug('Deleted %d bytes of stale partial downloads', n_bytes)
+
+    return n_bytes
@@ -1,6 +1,7 @@
 import functools
 import mimetypes
 import os
+import re
 from urllib.parse import urlparse
 import shutil
 
@@ -75,29 +76,60 @@ class PathMeta(_ApplyDecorators):
     CastCls = _Decorate(cast_one_arg)
 
 
+def _split_parts(path):
+    """Split a normalized path into the tuple used for Path.parts."""
+    parts = path.split(os.sep)
+
+    if os.path.isabs(path):
+        if config.WINDOWS:
+            if not parts[0]:
+                parts[0] = os.getenv('HOMEDRIVE')
+
+            parts.insert(0, os.sep)
+        else:
+            parts[0] = os.sep
+
+    if not parts[-1]:
+        parts.pop()
+
+    return tuple(parts)
+
+
+# Characters that make a name more than one plain path component. config is
+# still being imported at this point, so check for Windows directly.
+_SEPARATORS = re.compile('[%s]' % re.escape(
+    os.sep + (os.altsep or '') + (':' if os.name == 'nt' else '')))
+
+
+def _is_child_name(name):
+    """Check if joining name onto a normalized path leaves it normalized."""
+    return (
+        type(name) is str
+        and name not in ('', '.', '..')
+        and _SEPARATORS.search(name) is None
+    )
+
+
 class PathBase(metaclass=PathMeta):
     """Provides general functionality for all Path types."""
+    __slots__ = ('__path', '__parts', '__hash')
+
     def __new__(cls, path=None):
-        self = object.__new__(cls)
         if path is None:
             path = '.'
+        elif isinstance(path, PathBase):
+            return cls._from_normal(path.__path)
 
-        self.__path = os.path.normpath(os.path.expanduser(path))
-        parts = self.__path.split(os.sep)
-
-        if os.path.isabs(self.__path):
-            if config.WINDOWS:
-                if not parts[0]:
-                    parts[0] = os.getenv('HOMEDRIVE')
+        return cls._from_normal(os.path.normpath(os.path.expanduser(path)))
 
-                parts.insert(0, os.sep)
-            else:
-                parts[0] = os.sep
-
-        if not parts[-1]:
-            parts.pop()
-
-        self.__parts = tuple(parts)
+    @classmethod
+    def _from_normal(cls, path):
+        """Make a new instance from a str path that is already expanded and
+        normalized."""
+        self = object.__new__(cls)
+        self.__path = path
+        self.__parts = None
+        self.__hash = None
         return self
 
     def __init__(self, path=None):
@@ -106,12 +138,15 @@ class PathBase(metaclass=PathMeta):
     @property
     def parts(self):
         """Split the path by the OS path slash separator."""
+        if self.__parts is None:
+            self.__parts = _split_parts(self.__path)
+
         return self.__parts
 
     @property
     def basename(self):
         """The final element in the path."""
-        return self.__parts[-1]
+        return self.__path.rpartition(os.sep)[2] or self.parts[-1]
 
     @property
     def split(self):
@@ -155,6 +190,9 @@ class PathBase(metaclass=PathMeta):
         return self.__path
 
     def __eq__(self, other):
+        if isinstance(other, PathBase):
+            return self.__path == other.__path
+
         try:
             return os.fspath(self) == os.fspath(other)
         except TypeError:
@@ -170,16 +208,35 @@ class PathBase(metaclass=PathMeta):
         return '%s.%s(%r)' % (module, name, str(self))
 
     def __hash__(self):
-        return hash(str(self))
+        if self.__hash is None:
+            self.__hash = hash(self.__path)
+
+        return self.__hash
 
 
 class Path(PathBase):
     """Provides high level and cross platform file system manipulations on
     paths."""
-    @PathBase.CastCls
+    __slots__ = ()
+
     def join(self, *others):
         """Connect one or more file names onto this path."""
-        return os.path.join(self, *others)
+        self_path = os.fspath(self)
+        path = os.path.join(self_path, *others)
+
+        if self_path != '.' and all(map(_is_child_name, others)):
+            return Path._from_normal(path)
+
+        return Path(path)
+
+    def _join_one(self, other):
+        self_path = os.fspath(self)
+        path = os.path.join(self_path, other)
+
+        if self_path != '.' and _is_child_name(other):
+            return Path._from_normal(path)
+
+        return Path(path)
 
     @PathBase.CastCls
     def realpath(self):
@@ -195,14 +252,13 @@ class Path(PathBase):
 
         return os.path.relpath(self, start)
 
-    @PathBase.CastCls
     def abspath(self):
         """Return the absolute path."""
-        return os.path.abspath(self)
+        return Path._from_normal(os.path.abspath(self))
 
     def __truediv__(self, other):
         """Perform self / other to join paths."""
-        return self.join(other)
+        return self._join_one(other)
 
     def url_fname(self, url):
         """Join the filename part of a url to this path."""
@@ -237,9 +293,13 @@ class Path(PathBase):
 
     def __contains__(self, other):
         """Check recursively if other is inside self (a directory)."""
-        self = self.abspath()
-        other = Path(other).abspath()
-        return self._first_diff_part(other) < 0
+        self_path = os.path.abspath(self)
+        other_path = os.path.abspath(Path(other))
+
+        if not self_path.endswith(os.sep):
+            self_path += os.sep
+
+        return other_path.startswith(self_path) and other_path != self_path
 
     def contains_toplevel(self, other):
         """Check if other is at the top level of self (a directory)."""
@@ -270,9 +330,13 @@ class Path(PathBase):
             raise ValueError('%r is not a file or directory' % self)
 
     def remove_contents(self):
-        """Remove each file within a directory."""
-        for file in self:
-            file.remove()
+        """Remove everything within a directory, including the contents of
+        the directories inside it."""
+        for entry in self.walk(max_depth=1, entries=True):
+            if entry.is_dir(follow_symlinks=False):
+                shutil.rmtree(entry.path)
+            else:
+                os.remove(entry.path)
 
     def mkdir(self, mode=0o777, *, exist_ok=False, dir_fd=None):
         """Make a directory exist under this path."""
@@ -285,6 +349,11 @@ class Path(PathBase):
     @property
     def parent(self):
         """Move up one directory."""
+        head, tail = os.path.split(os.fspath(self))
+
+        if tail and tail not in ('.', '..'):
+            return Path._from_normal(head or '.')
+
         return self / '..'
 
     @property
@@ -302,20 +371,61 @@ class Path(PathBase):
 
         return mime_type
 
-    @property
-    def tree(self):
-        """Generate all of the paths in this directory path."""
-        yield self
+    def walk(self, filter=None, max_depth=None, follow_links=False,
+             entries=False):
+        """Generate the paths below this directory path, depth first.
+
+        The walk uses os.scandir() and an explicit stack, so directory types
+        come from the listing and deep trees do not recurse. filter is called
+        with each os.DirEntry and decides whether it is yielded; directories
+        are descended into either way. max_depth limits how many levels
+        below this path are visited. Symbolic links to directories are only
+        descended into if follow_links, and each directory at most once. If
+        entries, yield the os.DirEntry objects instead of Path objects.
+        Directories that cannot be read are skipped."""
+        visited = set()
+        stack = [(os.scandir(self), 1)]
+
+        try:
+            while stack:
+                scan, depth = stack[-1]
+                entry = next(scan, None)
+
+                if entry is None:
+                    scan.close()
+                    stack.pop()
+                    continue
+
+                if filter is None or filter(entry):
+                    yield entry if entries else Path(entry.path)
+
+                if max_depth is not None and depth >= max_depth:
+                    continue
 
-        for item in self:
-            if item.is_dir() and not item.is_link():
                 try:
-                    yield from item.tree
+                    if not entry.is_dir(follow_symlinks=follow_links):
+                        continue
+
+                    if follow_links:
+                        stat = entry.stat()
+                        key = stat.st_dev, stat.st_ino
+                        if key in visited:
+                            continue
+                        visited.add(key)
+
+                    stack.append((os.scandir(entry.path), depth + 1))
                 except PermissionError:
                     pass
-            else:
-                yield item
+        finally:
+            for scan, _ in stack:
+                scan.close()
+
+    @property
+    def tree(self):
+        """Generate all of the paths in this directory path."""
+        yield self
+        yield from self.walk()
 
     def __iter__(self):
         """Iterate over the paths within this path."""
-        yield from map(self.join, os.listdir(self))
+        yield from self.walk(max_depth=1)
@@ -0,0 +1,156 @@
+"""Fast in-process check for a working internet connection"""
+import errno
+import json
+import os
+import queue
+import selectors
+import socket
+import threading
+import time
+
+from . import config
+from .logger import Logger
+
+__all__ = ['probe', 'connected']
+
+_IN_PROGRESS = frozenset(filter(None, (
+    errno.EINPROGRESS,
+    errno.EWOULDBLOCK,
+    getattr(errno, 'WSAEWOULDBLOCK', None),
+)))
+
+
+def _resolve(host, port, results, waker):
+    """Put (host, first address info or OSError) on results and wake the
+    probe up through the socket waker."""
+    try:
+        result = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)[0]
+    except OSError as error:
+        result = error
+
+    results.put((host, result))
+
+    try:
+        waker.send(b'\0')
+    except OSError:
+        # The probe is over and closed it.
+        pass
+
+
+def _connect(selector, sockets, host, address_info):
+    """Start connecting to host without blocking. Return whether it
+    connected at once."""
+    family, type_, proto, _, address = address_info
+    sock = socket.socket(family, type_, proto)
+    sockets.append(sock)
+    sock.setblocking(False)
+    error = sock.connect_ex(address)
+
+    if not error:
+        return True
+    elif error in _IN_PROGRESS:
+        selector.register(sock, selectors.EVENT_WRITE, host)
+    else:
+        Logger.debug('Could not connect to %s: %s', host, os.strerror(error))
+
+    return False
+
+
+def probe(hosts=config.PROBE_HOSTS, deadline=config.PROBE_DEADLINE):
+    """Return whether a TCP connection to any of hosts, a sequence of
+    (host, port) pairs, is accepted within deadline seconds. The names are
+    resolved at once in background threads, and each connection is started
+    without blocking as soon as its host is resolved, so a resolver that
+    hangs cannot hold the probe past the deadline."""
+    end = time.monotonic() + deadline
+    selector = selectors.DefaultSelector()
+    results = queue.Queue()
+    wakeup, waker = socket.socketpair()
+    sockets = [wakeup, waker]
+    selector.register(wakeup, selectors.EVENT_READ)
+    n_resolving = 0
+
+    try:
+        for host, port in hosts:
+            threading.Thread(
+                target=_resolve, args=(host, port, results, waker),
+                daemon=True,
+            ).start()
+            n_resolving += 1
+
+        while n_resolving or len(selector.get_map()) > 1:
+            while True:
+                try:
+                    host, result = results.get_nowait()
+                except queue.Empty:
+                    break
+
+                n_resolving -= 1
+
+                if isinstance(result, OSError):
+                    Logger.debug('Could not resolve %s: %s', host, result)
+                elif _connect(selector, sockets, host, result):
+                    return True
+
+            timeout = end - time.monotonic()
+
+            if timeout <= 0:
+                break
+
+            for key, _ in selector.select(timeout):
+                if key.fileobj is wakeup:
+                    wakeup.recv(1024)
+                    continue
+
+                error = key.fileobj.getsockopt(
+                    socket.SOL_SOCKET, socket.SO_ERROR)
+
+                if not error:
+                    return True
+
+                Logger.debug('Could not connect to %s: %s',
+                             key.data, os.strerror(error))
+                selector.unregister(key.fileobj)
+
+        return False
+    finally:
+        selector.close()
+
+        for sock in sockets:
+            sock.close()
+
+
+def connected(cache_path=None, ttl=config.PROBE_TTL, **kwargs):
+    """Return the result of probe(**kwargs). If cache_path is given, a result
+    recorded there less than ttl seconds ago is returned instead, and a new
+    result is recorded there."""
+    if cache_path is not None:
+        try:
+            with open(cache_path) as file:
+                cache = json.load(file)
+
+            fresh = 0 <= time.time() - cache['time'] < ttl
+            result = bool(cache['connected'])
+        except (OSError, ValueError, KeyError, TypeError):
+            fresh = False
+
+        if fresh:
+            Logger.debug('Using cached connection check: %s', cache_path)
+            return result
+
+    result = probe(**kwargs)
+
+    if cache_path is not None:
+        temp_path = '%s.%d' % (cache_path, os.getpid())
+
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+
+            with open(temp_path, 'w') as file:
+                json.dump({'time': time.time(), 'connected': result}, file)
+
+            os.replace(temp_path, cache_path)
+        except OSError as error:
+            Logger.debug('Could not cache connection check: %s', error)
+
+    return result
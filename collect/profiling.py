@@ -0,0 +1,117 @@
+"""CPU and memory profiles of a collect command"""
+import contextlib
+import cProfile
+import os
+import pstats
+import time
+import tracemalloc
+
+from . import config
+from .logger import Logger
+
+__all__ = ['profiled', 'write_callgrind']
+
+
+def _callgrind_name(func):
+    file_name, line, name = func
+    return file_name, '%s:%d' % (name, line)
+
+
+def write_callgrind(stats, path):
+    """Write pstats.Stats to path in the callgrind format read by
+    KCachegrind and QCachegrind. Costs are in microseconds."""
+    callees = {}
+
+    for func, (_, _, _, _, callers) in stats.stats.items():
+        for caller, caller_stats in callers.items():
+            callees.setdefault(caller, []).append((func, caller_stats))
+
+    with open(path, 'w') as file:
+        file.write('# callgrind format\nevents: Microseconds\n\n')
+
+        for func, (_, _, self_time, _, _) in stats.stats.items():
+            file_name, name = _callgrind_name(func)
+            line = func[1]
+            file.write('fl=%s\nfn=%s\n%d %d\n'
+                       % (file_name, name, line, self_time * 1e6))
+
+            for callee, (_, n_calls, _, time_in_callee) in callees.get(
+                func, ()
+            ):
+                callee_file, callee_name = _callgrind_name(callee)
+                file.write('cfl=%s\ncfn=%s\ncalls=%d %d\n%d %d\n' % (
+                    callee_file, callee_name, n_calls, callee[1], line,
+                    time_in_callee * 1e6))
+
+            file.write('\n')
+
+
+def _write_allocations(snapshot, path, top):
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    ])
+    statistics = snapshot.statistics('lineno')
+    current, peak = tracemalloc.get_traced_memory()
+
+    with open(path, 'w') as file:
+        file.write('Traced memory: %.1f KiB at exit, %.1f KiB at peak\n'
+                   % (current / 1024, peak / 1024))
+        file.write('Top %d of %d allocation sites:\n'
+                   % (min(top, len(statistics)), len(statistics)))
+
+        for n_stat, stat in enumerate(statistics[:top], 1):
+            frame = stat.traceback[0]
+            file.write('%3d. %s:%d: %.1f KiB in %d blocks\n' % (
+                n_stat, frame.filename, frame.lineno, stat.size / 1024,
+                stat.count))
+
+
+@contextlib.contextmanager
+def profiled(directory, name, cpu=True, memory_top=0):
+    """Context manager profiling the code within. The profiles are written to
+    the profiles folder of directory's state folder, named after name and
+    the time: with cpu, a .pstats file for the pstats module and a
+    .callgrind file, and with memory_top, a text file of the memory_top
+    lines that allocated the most memory that is still held.
+
+    Only the calling thread is profiled for CPU time, so work done by
+    download threads shows up as time waiting for them."""
+    profile_dir = os.path.join(directory, config.STATE_DIRNAME, 'profiles')
+    base = os.path.join(profile_dir, '%s-%s' % (
+        name, time.strftime('%Y%m%d-%H%M%S')))
+    profiler = cProfile.Profile() if cpu else None
+
+    if memory_top:
+        tracemalloc.start()
+
+    if profiler is not None:
+        profiler.enable()
+
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+
+        if memory_top:
+            snapshot = tracemalloc.take_snapshot()
+
+        try:
+            os.makedirs(profile_dir, exist_ok=True)
+
+            if profiler is not None:
+                stats = pstats.Stats(profiler)
+                stats.dump_stats(base + '.pstats')
+                write_callgrind(stats, base + '.callgrind')
+                Logger.info('CPU profile: %s.pstats', base)
+
+            if memory_top:
+                _write_allocations(snapshot, base + '-memory.txt', memory_top)
+                Logger.info('Memory profile: %s-memory.txt', base)
+        except OSError as error:
+            Logger.error('Could not write profile: %s', error)
+        finally:
+            if memory_top:
+                tracemalloc.stop()
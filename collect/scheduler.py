@@ -0,0 +1,215 @@
+"""Rate limits for the requests made to each host"""
+import contextlib
+import email.utils
+import json
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+from . import config
+from .logger import Logger, _instantiate
+from .metrics import Metrics
+
+if not config.WINDOWS:
+    import fcntl
+
+__all__ = ['Scheduler']
+
+# Seconds to wait after a 429 response that does not say how long to wait.
+THROTTLED_WAIT = 5
+# Seconds after which an idle host is forgotten.
+IDLE_TIME = 60 * 60
+
+
+def _host(url):
+    return urlsplit(url).netloc.lower()
+
+
+def _retry_after(value, now):
+    """Return the time named by a Retry-After header, or None."""
+    try:
+        return now + float(value)
+    except ValueError:
+        pass
+
+    try:
+        return email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+@_instantiate
+class Scheduler:
+    """Decides when a request to a host may be sent, shared by every thread
+    of the process.
+
+    Each host with a rate has a token bucket refilled at that many requests
+    per second and holding up to burst requests. A host that answers 429 Too
+    Many Requests, or sends Retry-After, is left alone until the time it asks
+    for, and Reddit's X-Ratelimit headers slow the rate down so that the
+    requests left last until the limit resets.
+
+    Once share() is given a collection directory, the buckets and waits are
+    kept in a state file in it, locked while in use, so that every collect
+    process using that directory keeps to the same limits. The number of
+    requests in flight to a host is not one of them: each process caps it
+    to config.MAX_CONNECTIONS through its own connection pool."""
+
+    def __init__(self):
+        self.rate = config.HOST_RATE
+        self.rates = config.HOST_RATES
+        self.burst = config.HOST_BURST
+        self.state_path = None
+        self._lock = threading.Lock()
+        self._state = {}
+
+    def share(self, directory):
+        """Keep the state in the state folder of directory from now on, or
+        only in memory if directory is None."""
+        with self._lock:
+            if directory is None or config.WINDOWS:
+                self.state_path = None
+            else:
+                self.state_path = os.path.join(
+                    directory, config.STATE_DIRNAME, 'hosts.json')
+
+    @contextlib.contextmanager
+    def _locked_state(self):
+        with self._lock:
+            if self.state_path is None:
+                yield self._state
+                return
+
+            try:
+                os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+                file = open(self.state_path, 'a+')
+            except OSError as error:
+                Logger.debug('Could not share host state: %s', error)
+                yield self._state
+                return
+
+            with file:
+                fcntl.flock(file, fcntl.LOCK_EX)
+                file.seek(0)
+                text = file.read()
+
+                try:
+                    state = json.loads(text or '{}')
+                except ValueError:
+                    state = {}
+
+                yield state
+                now = time.time()
+                state = {
+                    host: entry for host, entry in state.items()
+                    if max(entry['time'], entry['blocked_until']) + IDLE_TIME
+                    > now
+                }
+                new_text = json.dumps(state)
+
+                # Most requests go to hosts without a limit and leave the
+                # state as it was.
+                if new_text != text:
+                    file.seek(0)
+                    file.truncate()
+                    file.write(new_text)
+
+    def _entry(self, state, host, now):
+        return state.setdefault(host, {
+            'tokens': self.burst, 'time': now, 'blocked_until': 0,
+            'rate': None, 'rate_until': 0,
+        })
+
+    def _rate(self, entry, host, now):
+        """Return the requests per second allowed to host, or None."""
+        rate = self.rates.get(host, self.rate)
+
+        if entry is not None and entry['rate_until'] > now:
+            rate = entry['rate'] if rate is None else min(rate, entry['rate'])
+
+        return rate
+
+    def reserve(self, url):
+        """Take a token from the bucket of url's host and return the number
+        of seconds to wait before sending the request to url. Call refund()
+        if the request is not sent after all."""
+        host = _host(url)
+
+        with self._locked_state() as state:
+            now = time.time()
+            entry = state.get(host)
+            rate = self._rate(entry, host, now)
+            delay = 0 if entry is None \
+                else max(entry['blocked_until'] - now, 0)
+
+            # A host without a rate has nothing to record.
+            if rate is not None:
+                entry = self._entry(state, host, now)
+                tokens = min(self.burst,
+                             entry['tokens'] + (now - entry['time']) * rate)
+                # Tokens go below zero for requests already waiting their
+                # turn.
+                delay = max(delay, (1 - tokens) / rate)
+                entry['tokens'] = tokens - 1
+                entry['time'] = now
+
+        if delay:
+            Metrics.count('throttled', host=host)
+            Metrics.add_time('throttled', delay)
+
+        return delay
+
+    def refund(self, url):
+        """Give back the token that reserve() took for a request to url that
+        was not sent."""
+        host = _host(url)
+
+        with self._locked_state() as state:
+            now = time.time()
+            entry = state.get(host)
+
+            if entry is not None and self._rate(entry, host, now) is not None:
+                entry['tokens'] = min(self.burst, entry['tokens'] + 1)
+
+    def update(self, url, status, headers):
+        """Adjust the limits of url's host to a response with the given
+        status and headers, which are looked up by lowercase name."""
+        now = time.time()
+        blocked_until = rate = rate_until = None
+        retry_after = headers.get('retry-after')
+
+        if retry_after is not None and status in (429, 503):
+            blocked_until = _retry_after(retry_after, now)
+
+        try:
+            remaining = float(headers['x-ratelimit-remaining'])
+            reset = float(headers['x-ratelimit-reset'])
+        except (KeyError, TypeError, ValueError):
+            pass
+        else:
+            if remaining < 1:
+                blocked_until = max(blocked_until or 0, now + reset)
+            elif reset > 0:
+                rate = remaining / reset
+                rate_until = now + reset
+
+        if status == 429 and blocked_until is None:
+            blocked_until = now + THROTTLED_WAIT
+
+        if blocked_until is None and rate is None:
+            return
+
+        host = _host(url)
+
+        with self._locked_state() as state:
+            entry = self._entry(state, host, now)
+
+            if blocked_until is not None:
+                Logger.debug('Waiting %.1f seconds for %s',
+                             blocked_until - now, host)
+                entry['blocked_until'] = max(entry['blocked_until'],
+                                             blocked_until)
+            if rate is not None:
+                entry['rate'] = rate
+                entry['rate_until'] = rate_until
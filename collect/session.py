@@ -0,0 +1,97 @@
+"""Pooled HTTP sessions with timeouts and retries"""
+import random
+import threading
+import time
+
+import requests
+import requests.adapters
+
+from . import config
+from .logger import Logger
+from .metrics import Metrics
+from .scheduler import Scheduler
+
+__all__ = ['Session', 'get_session']
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class Session(requests.Session):
+    """requests.Session that keeps up to max_connections connections alive
+    per host, applies a default timeout to every request, and retries
+    connection errors, 429 and 5xx responses with exponential backoff.
+
+    Requests are sent when the Scheduler allows, and a host that makes them
+    wait more than max_wait seconds fails them with
+    requests.exceptions.RetryError."""
+
+    def __init__(self, timeout=config.TIMEOUT, retries=config.RETRIES,
+                 backoff=config.BACKOFF,
+                 max_connections=config.MAX_CONNECTIONS,
+                 max_wait=config.HOST_MAX_WAIT):
+        super().__init__()
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_wait = max_wait
+        self.headers['User-Agent'] = 'collect/%s' % config.VERSION
+
+        adapter = requests.adapters.HTTPAdapter(
+            pool_maxsize=max_connections, pool_block=True)
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+
+    def delay(self, n_try):
+        """Return the number of seconds to wait before retry number n_try
+        (counting from 0), with full jitter."""
+        return random.uniform(0, self.backoff * 2 ** n_try)
+
+    def wait(self, url):
+        """Sleep until the Scheduler allows a request to url."""
+        delay = Scheduler.reserve(url)
+
+        if delay > self.max_wait:
+            Scheduler.refund(url)
+            raise requests.exceptions.RetryError(
+                'Throttled for %d seconds: %s' % (delay, url))
+
+        time.sleep(delay)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+
+        for n_try in range(self.retries + 1):
+            last_try = n_try == self.retries
+            self.wait(url)
+
+            try:
+                res = super().request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as error:
+                if last_try:
+                    raise
+                Logger.debug('Retrying %s: %s', url, error)
+            else:
+                Scheduler.update(url, res.status_code, res.headers)
+
+                if last_try or res.status_code not in RETRY_STATUSES:
+                    return res
+                Logger.debug('Retrying %s: HTTP %d', url, res.status_code)
+                res.close()
+
+            Metrics.count('http_retries')
+            time.sleep(self.delay(n_try))
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Return the Session shared by the whole process."""
+    global _session
+
+    with _session_lock:
+        if _session is None:
+            _session = Session()
+
+        return _session
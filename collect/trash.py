@@ -0,0 +1,161 @@
+"""Emptying directories at once and deleting their old contents later"""
+import concurrent.futures
+import glob
+import os
+import sys
+import time
+
+from . import background
+from . import config
+from .logger import Logger
+from . import path as _path
+
+__all__ = ['delete_in_background', 'delete_tree', 'empty', 'leftovers']
+
+# Number of files handed to a worker thread at a time.
+_BATCH_SIZE = 512
+
+_TRASH_DIRNAME = 'trash'
+
+
+def _aside_path(directory):
+    head, tail = os.path.split(directory)
+    return os.path.join(head, '.%s.%d-%d.trash' % (
+        tail, os.getpid(), time.time_ns()))
+
+
+def _swap(directory, keep):
+    """Rename directory aside, make an empty one in its place and move the
+    names in keep back into it. Return the renamed directory."""
+    aside = _aside_path(directory)
+    mode = os.stat(directory).st_mode
+    os.rename(directory, aside)
+
+    try:
+        os.mkdir(directory, mode & 0o7777)
+    except BaseException:
+        os.rename(aside, directory)
+        raise
+
+    for name in keep:
+        try:
+            os.rename(os.path.join(aside, name), os.path.join(directory, name))
+        except FileNotFoundError:
+            pass
+
+    return aside
+
+
+def _move_contents(directory, keep):
+    """Move everything in directory but the names in keep into a new folder
+    in the state folder. Return that folder."""
+    trash = os.path.join(directory, config.STATE_DIRNAME, _TRASH_DIRNAME,
+                         '%d-%d' % (os.getpid(), time.time_ns()))
+    os.makedirs(trash)
+
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name not in keep:
+                os.rename(entry.path, os.path.join(trash, entry.name))
+
+    return trash
+
+
+def empty(directory, keep=(config.STATE_DIRNAME, )):
+    """Empty directory except for the names in keep without deleting
+    anything, and return the path of a folder holding the old contents for
+    delete_tree() or delete_in_background().
+
+    The directory is renamed aside and an empty one takes its place, which
+    takes the same time however many files it holds. Where that is not
+    possible, such as for the current working directory or a mount point,
+    each entry is moved into the state folder instead. If directory is a
+    symbolic link, the folder it points to is emptied and the link is
+    kept."""
+    directory = os.path.realpath(directory)
+
+    if not os.path.samefile(directory, os.getcwd()):
+        try:
+            return _swap(directory, keep)
+        except OSError as error:
+            Logger.debug('Could not swap out %s: %s', directory, error)
+
+    return _move_contents(directory, keep)
+
+
+def leftovers(directory):
+    """Return the folders left by empty() for directory that still exist,
+    such as after a background deletion was interrupted."""
+    directory = os.path.realpath(directory)
+    head, tail = os.path.split(directory)
+    return (
+        glob.glob(os.path.join(glob.escape(head),
+                               '.%s.*.trash' % glob.escape(tail)))
+        + glob.glob(os.path.join(glob.escape(directory), config.STATE_DIRNAME,
+                                 _TRASH_DIRNAME, '*'))
+    )
+
+
+def _unlink_all(paths):
+    for path in paths:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        except OSError as error:
+            Logger.warning('Could not delete %s: %s', path, error)
+
+
+def delete_tree(path, workers=config.WORKERS):
+    """Delete path and everything below it. The tree is listed with
+    os.scandir() and its files are unlinked in batches by up to workers
+    threads while the listing goes on. Symbolic links are deleted, never
+    followed."""
+    if os.path.islink(path) or not os.path.isdir(path):
+        _unlink_all([path])
+        return
+
+    directories = [path]
+    batch = []
+
+    with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+        for entry in _path.Path(path).walk(entries=True):
+            if entry.is_dir(follow_symlinks=False):
+                directories.append(entry.path)
+                continue
+
+            batch.append(entry.path)
+
+            if len(batch) >= _BATCH_SIZE:
+                pool.submit(_unlink_all, batch)
+                batch = []
+
+        if batch:
+            pool.submit(_unlink_all, batch)
+
+    # walk() lists each directory before the ones inside it.
+    for directory in reversed(directories):
+        try:
+            os.rmdir(directory)
+        except FileNotFoundError:
+            pass
+        except OSError as error:
+            Logger.warning('Could not delete %s: %s', directory, error)
+
+
+def delete_in_background(*paths):
+    """Start a detached process that runs delete_tree() on each path and
+    return at once. The process outlives this one."""
+    return background.start(__name__, *paths)
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+
+    for path in argv:
+        delete_tree(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -5,7 +5,8 @@ setuptools.setup(
     name='collect',
     version=config.VERSION,
     packages=['collect'],
-    install_requires=['requests', 'praw'],
+    python_requires='>=3.10',
+    install_requires=['requests>=2.32'],
     extras_require={
         'magic': ['python-magic'],
     },
@@ -0,0 +1,2 @@
+"""Tests for collect, run from the repository root with make test or
+python -m unittest. They only talk to servers listening on localhost."""
@@ -0,0 +1,92 @@
+"""Helpers shared by the tests"""
+import collections
+import http.server
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+__all__ = ['DROP', 'HANG', 'Response', 'ScriptedServer', 'Slow',
+           'TempDirTestCase']
+
+Response = collections.namedtuple('Response', 'status headers body')
+Response.__new__.__defaults__ = ({}, b'')
+
+# Scripted in place of a Response to close the connection without answering,
+# or to leave it open without answering for a second.
+DROP = object()
+HANG = object()
+# Scripted in place of a Response to send it after a delay in seconds.
+Slow = collections.namedtuple('Slow', 'seconds response')
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server.scripted
+
+        with server.lock:
+            server.requests.append((self.path, dict(self.headers)))
+            script = server.script
+
+            if len(script) > 1:
+                response = script.popleft()
+            else:
+                response = script[0]
+
+        if response is HANG:
+            time.sleep(1)
+        elif isinstance(response, Slow):
+            time.sleep(response.seconds)
+            response = response.response
+
+        if response in (DROP, HANG):
+            self.close_connection = True
+            return
+
+        self.send_response(response.status)
+        self.send_header('Content-Length', str(len(response.body)))
+
+        for name, value in response.headers.items():
+            self.send_header(name, value)
+
+        self.end_headers()
+        self.wfile.write(response.body)
+
+
+class ScriptedServer:
+    """HTTP server on localhost answering GET requests with the responses
+    given, in order, the last one for every request after it. The path and
+    headers of each request are kept in requests."""
+
+    def __init__(self, *responses):
+        self.script = collections.deque(responses)
+        self.requests = []
+        self.lock = threading.Lock()
+        self.httpd = http.server.ThreadingHTTPServer(
+            ('127.0.0.1', 0), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.scripted = self
+        self.url = 'http://127.0.0.1:%d' % self.httpd.server_port
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, args=(0.05, ),
+                         daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class TempDirTestCase(unittest.TestCase):
+    """TestCase with a fresh temporary directory in self.directory."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='collect-test-')
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
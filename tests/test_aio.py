@@ -0,0 +1,144 @@
+import asyncio
+import concurrent.futures
+import os
+import threading
+import unittest
+from unittest import mock
+
+from benchmarks.server import FakeReddit
+from collect import aio, config
+from collect.collect import Collect, RedditSubmissionWrapper, Submission
+from collect.scheduler import Scheduler
+from .support import Response, ScriptedServer, TempDirTestCase
+from .test_collect import _JPEG
+from .test_listing import _listing
+
+
+def _run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def _collect_many(path, count, **kwargs):
+    return [image_path async for image_path in
+            aio.AsyncCollect(path).collect_many('r/fake', count, **kwargs)]
+
+
+class AsyncSubmissionTest(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        Scheduler.share(None)
+        self.collect = Collect(self.directory)
+
+    def post(self, server):
+        data = Submission(server.url + '/a.jpg', 'a', '/r/test/')
+        return aio.AsyncSubmission(self.collect, data)
+
+    def test_downloads_an_image(self):
+        with ScriptedServer(Response(200, {'Content-Type': 'image/jpeg'},
+                                     _JPEG)) as server:
+            post = _run(self.post(server).download())
+
+        with open(post.path, 'rb') as file:
+            self.assertEqual(file.read(), _JPEG)
+        self.assertIn('a.jpg', self.collect.index)
+
+    def test_cancelling_waits_for_the_download_to_stop(self):
+        started = threading.Event()
+        stopped = threading.Event()
+
+        def fetch(post, partial, cancel, max_size):
+            started.set()
+            cancel.wait(5)
+            stopped.set()
+            raise concurrent.futures.CancelledError(post.url)
+
+        async def cancel_download(post):
+            task = asyncio.ensure_future(post.download())
+            await asyncio.get_running_loop().run_in_executor(
+                None, started.wait, 5)
+            task.cancel()
+
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+            self.assertTrue(stopped.is_set())
+
+        with ScriptedServer(Response(404)) as server, \
+                mock.patch.object(RedditSubmissionWrapper, '_fetch', fetch):
+            post = self.post(server)
+            _run(cancel_download(post))
+
+        self.assertFalse(post.path.exists())
+
+
+class AsyncListingTest(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        Scheduler.share(None)
+
+    def serve(self, *responses):
+        server = ScriptedServer(*responses)
+        patch = mock.patch.object(config, 'REDDIT_API', server.url + '/')
+        patch.start()
+        self.addCleanup(patch.stop)
+        return server
+
+    def open(self):
+        return _run(aio.AsyncListing.open(self.directory, 'r/test'))
+
+    def test_refused_listing_is_a_connection_error(self):
+        with self.serve(Response(403)):
+            with self.assertRaises(ConnectionError):
+                self.open()
+
+    def test_bad_listing_is_a_connection_error(self):
+        with self.serve(Response(200, body=b'{"data": []}')):
+            with self.assertRaises(ConnectionError):
+                self.open()
+
+    def test_serves_cached_listing_when_refused(self):
+        with self.serve(Response(200, body=_listing('a', 'b')),
+                        Response(403)):
+            self.open()
+
+            cache = Collect(self.directory).listing_cache(ttl=0, stale=0)
+            listing = _run(aio.AsyncListing.open(self.directory, 'r/test',
+                                                 cache))
+
+        posts = listing._listings[0].posts
+        self.assertEqual(sorted(post['title'] for post in posts), ['a', 'b'])
+
+
+class AsyncCollectTest(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        Scheduler.share(None)
+        self.server = FakeReddit(per_page=6, pages=1, gif_ratio=0,
+                                 image_size=1000).start()
+        self.addCleanup(self.server.stop)
+        patch = mock.patch.object(config, 'REDDIT_API', self.server.url)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_collects_new_images(self):
+        first = _run(_collect_many(self.directory, 4, workers=1))
+        self.assertEqual(len(set(first)), 4)
+
+        for image_path in first:
+            self.assertTrue(os.path.isfile(image_path))
+
+        second = _run(_collect_many(self.directory, 4, workers=1))
+        self.assertEqual(len(second), 2)
+        self.assertFalse(set(first) & set(second))
+
+    def test_next_image(self):
+        async def next_image():
+            listing = await aio.AsyncCollect(self.directory).reddit_listing(
+                'r/fake', workers=2)
+            return await listing.flags_next_recover()
+
+        self.assertTrue(os.path.isfile(_run(next_image())))
+
+
+if __name__ == '__main__':
+    unittest.main()
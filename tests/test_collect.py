@@ -0,0 +1,160 @@
+import concurrent.futures
+import os
+import threading
+import unittest
+from unittest import mock
+
+from benchmarks.server import FakeReddit
+import requests
+
+from collect import config
+from collect.collect import Collect, RedditSubmissionWrapper, Submission
+from collect.flags import FAIL, NO_REPEAT
+from collect.partial import Partial
+from collect.scheduler import Scheduler
+from collect.session import Session
+from .support import Response, ScriptedServer, TempDirTestCase
+
+_JPEG = b'\xff\xd8\xff\xe0' + bytes(range(256)) * 4
+
+
+class CollectManyTest(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        Scheduler.share(None)
+        self.server = FakeReddit(per_page=6, pages=1, gif_ratio=0,
+                                 image_size=1000).start()
+        self.addCleanup(self.server.stop)
+        patch = mock.patch.object(config, 'REDDIT_API', self.server.url)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.collect = Collect(self.directory)
+
+    def collect_many(self, count, flags=FAIL):
+        # One worker leaves no download running when the generator stops.
+        return list(self.collect.collect_many('r/fake', count, flags,
+                                              workers=1))
+
+    def test_counts_only_new_images(self):
+        first = self.collect_many(4)
+        self.assertEqual(len(set(first)), 4)
+
+        second = self.collect_many(4)
+        self.assertEqual(len(second), 2)
+        self.assertFalse(set(first) & set(second))
+        self.assertEqual(len(os.listdir(self.directory)) - 1, 6)
+
+    def test_falls_back_on_a_collected_image(self):
+        collected = set(self.collect_many(6))
+        fallback = self.collect_many(3)
+        self.assertEqual(len(fallback), 1)
+        self.assertIn(fallback[0], collected)
+
+        with self.assertRaises(RuntimeError):
+            self.collect_many(3, NO_REPEAT)
+
+
+class DedupeTest(TempDirTestCase):
+    def test_links_identical_images(self):
+        collect = Collect(self.directory)
+
+        for fname in ('a.jpg', 'b.jpg'):
+            path = collect.image_path(fname)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+            with open(path, 'wb') as file:
+                file.write(_JPEG)
+
+        self.assertEqual(collect.dedupe(), (1, len(_JPEG)))
+        self.assertTrue(os.path.samefile(collect.image_path('a.jpg'),
+                                         collect.image_path('b.jpg')))
+
+        [(hash, fnames)] = collect.index.duplicates()
+        self.assertEqual(sorted(fnames), ['a.jpg', 'b.jpg'])
+        self.assertEqual(collect.index.get('a.jpg')['hash'], hash)
+        self.assertEqual(collect.index.get('b.jpg')['hash'], hash)
+
+
+class DownloadTest(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        Scheduler.share(None)
+        self.collect = Collect(self.directory)
+
+    def post(self, server, name='a.jpg'):
+        data = Submission('%s/%s' % (server.url, name), name, '/r/test/')
+        return RedditSubmissionWrapper(self.collect, data)
+
+    def test_cancel_after_the_last_chunk_writes_nothing(self):
+        cancel = threading.Event()
+        fetch = RedditSubmissionWrapper._fetch
+
+        def fetch_then_cancel(post, *args):
+            mime = fetch(post, *args)
+            cancel.set()
+            return mime
+
+        with ScriptedServer(Response(200, {'Content-Type': 'image/jpeg'},
+                                     _JPEG)) as server:
+            post = self.post(server)
+
+            with mock.patch.object(RedditSubmissionWrapper, '_fetch',
+                                   fetch_then_cancel):
+                with self.assertRaises(concurrent.futures.CancelledError):
+                    post.download(cancel)
+
+        self.assertFalse(post.path.exists())
+        self.assertNotIn('a.jpg', self.collect.index)
+
+    def keep_partial(self, url, size):
+        """Leave the first size bytes of _JPEG from url to be resumed."""
+        with Partial.open(self.collect, url) as partial:
+            partial.begin(200, {'etag': '"1"'})
+            partial.write(_JPEG[:size])
+            partial.abandon()
+
+    def test_resumes_with_a_range_request(self):
+        headers = {
+            'Content-Type': 'image/jpeg', 'ETag': '"1"',
+            'Content-Range': 'bytes 100-%d/%d' % (len(_JPEG) - 1, len(_JPEG)),
+        }
+
+        with ScriptedServer(Response(206, headers, _JPEG[100:])) as server:
+            post = self.post(server)
+            self.keep_partial(post.url, 100)
+            post.download()
+
+        self.assertEqual(server.requests[0][1]['Range'], 'bytes=100-')
+        self.assertEqual(server.requests[0][1]['If-Range'], '"1"')
+
+        with open(post.path, 'rb') as file:
+            self.assertEqual(file.read(), _JPEG)
+
+    def test_restarts_when_the_whole_image_is_sent(self):
+        headers = {'Content-Type': 'image/jpeg', 'ETag': '"2"'}
+
+        with ScriptedServer(Response(200, headers, _JPEG)) as server:
+            post = self.post(server)
+            self.keep_partial(post.url, 100)
+            post.download()
+
+        with open(post.path, 'rb') as file:
+            self.assertEqual(file.read(), _JPEG)
+
+    def test_server_error_keeps_the_partial(self):
+        with ScriptedServer(Response(503, {'Content-Type': 'text/html'},
+                                     b'<html>busy</html>')) as server, \
+                mock.patch.object(Session, 'delay', return_value=0):
+            post = self.post(server)
+            self.keep_partial(post.url, 100)
+
+            with self.assertRaises(requests.HTTPError):
+                post.download()
+
+        with Partial.open(self.collect, post.url) as partial:
+            self.assertEqual(partial.size, 100)
+            self.assertTrue(partial.resumable)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+import io
+import os
+import socket
+import threading
+import time
+import unittest
+from unittest import mock
+
+from collect import config, daemon
+from collect.__main__ import CollectParser
+from collect.collect import Collect
+from collect.logger import Logger
+from .support import TempDirTestCase
+
+
+class RequestTest(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.path = os.path.join(self.directory, 'daemon.sock')
+
+    def test_no_daemon(self):
+        self.assertIsNone(daemon.request(self.path, ['random']))
+
+    def test_permission_denied(self):
+        with mock.patch.object(socket.socket, 'connect',
+                               side_effect=PermissionError):
+            self.assertIsNone(daemon.request(self.path, ['random']))
+
+    def test_hung_daemon(self):
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.addCleanup(server.close)
+        server.bind(self.path)
+        server.listen()
+        start = time.monotonic()
+        self.assertIsNone(daemon.request(self.path, ['random'], timeout=0.2))
+        self.assertLess(time.monotonic() - start, 1)
+
+
+class DaemonServerTest(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        collector = Collect(self.directory)
+        open(os.path.join(self.directory, 'a.jpg'), 'wb').close()
+        self.server = daemon.DaemonServer(CollectParser(prog='collect'),
+                                          collector)
+        thread = threading.Thread(target=self.server.serve_forever,
+                                  args=(0.05, ), daemon=True)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.server.shutdown)
+
+    def request(self, argv, **kwargs):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        exit = daemon.request(self.server.path, argv, stdout=stdout,
+                              stderr=stderr, **kwargs)
+        return exit, stdout.getvalue(), stderr.getvalue()
+
+    def test_random(self):
+        exit, stdout, stderr = self.request(['random'])
+        self.assertEqual(exit, 0)
+        self.assertEqual(stdout, os.path.join(self.directory, 'a.jpg\n'))
+
+    def test_log_level_is_per_request(self):
+        level = Logger.level
+        exit, stdout, stderr = self.request(['-vv', 'random'])
+        self.assertEqual(exit, 0)
+        self.assertEqual(Logger.level, level)
+
+    def test_heartbeats_keep_slow_commands_alive(self):
+        random = self.server.parser.subcommands['random']
+
+        def slow_random(args):
+            time.sleep(0.5)
+            return random(args)
+
+        with mock.patch.object(config, 'DAEMON_TIMEOUT', 0.2), \
+                mock.patch.dict(self.server.parser.subcommands,
+                                random=slow_random):
+            exit, stdout, stderr = self.request(['random'], timeout=0.2)
+
+        self.assertEqual(exit, 0)
+
+    def test_output_is_streamed(self):
+        random = self.server.parser.subcommands['random']
+        arrived = []
+
+        class Stream(io.StringIO):
+            def write(self, string):
+                arrived.append(time.monotonic())
+                return super().write(string)
+
+        def slow_random(args):
+            print('first', flush=True)
+            time.sleep(0.3)
+            return random(args)
+
+        with mock.patch.dict(self.server.parser.subcommands,
+                             random=slow_random):
+            stdout = Stream()
+            self.assertEqual(daemon.request(self.server.path, ['random'],
+                                            stdout=stdout), 0)
+            end = time.monotonic()
+
+        self.assertTrue(stdout.getvalue().startswith('first\n'))
+        self.assertLess(arrived[0], end - 0.2)
+
+    def test_unsupported_subcommand(self):
+        exit, stdout, stderr = self.request(['dedupe'])
+        self.assertNotEqual(exit, 0)
+        self.assertIn('does not run', stderr)
+
+
+class LoggerTest(unittest.TestCase):
+    def test_isolated_level(self):
+        levels = []
+
+        def run():
+            with Logger.isolated():
+                Logger.setLevel('DEBUG')
+                levels.append(Logger.isEnabledFor(10))
+                done.wait(1)
+
+        done = threading.Event()
+        thread = threading.Thread(target=run)
+        Logger.setLevel('WARNING')
+        thread.start()
+
+        while not levels:
+            time.sleep(0.01)
+
+        self.assertEqual(levels, [True])
+        self.assertFalse(Logger.isEnabledFor(10))
+        done.set()
+        thread.join()
+        self.assertFalse(Logger.isEnabledFor(10))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import os
+import unittest
+from unittest import mock
+
+from collect import index as _index, layout
+from collect.collect import Collect
+from .support import TempDirTestCase
+
+
+class RefreshTest(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.collect = Collect(self.directory)
+
+        for name in 'abcdef':
+            self.write(name + '.jpg', 'flat')
+
+        self.collect.migrate('sharded')
+        self.index = self.collect.index
+        self.index.refresh()
+
+    def write(self, fname, layout_name='sharded'):
+        path = os.path.join(self.directory,
+                            layout.relpath(fname, layout_name))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with open(path, 'w') as file:
+            file.write(fname)
+
+        return path
+
+    def count(self, name):
+        return mock.patch.object(layout.os, name,
+                                 wraps=getattr(os, name))
+
+    def test_unchanged_folders_are_statted_once_each(self):
+        with self.count('stat') as stat, self.count('scandir') as scandir:
+            self.index.refresh()
+
+        self.assertEqual(stat.call_count, len(layout.folders('sharded')))
+        self.assertEqual(scandir.call_count, 0)
+
+    def test_only_changed_shards_are_scanned(self):
+        self.write('g.jpg')
+        os.remove(os.path.join(self.directory,
+                               layout.relpath('a.jpg', 'sharded')))
+        shards = {layout.folders('sharded', fname)[0]
+                  for fname in ('a.jpg', 'g.jpg')}
+
+        with self.count('scandir') as scandir:
+            self.index.refresh()
+
+        self.assertEqual(scandir.call_count, len(shards))
+        self.assertIsNone(self.index.get('a.jpg'))
+        self.assertIsNotNone(self.index.get('g.jpg'))
+
+        for name in 'bcdef':
+            self.assertIsNotNone(self.index.get(name + '.jpg'))
+
+    def test_images_saved_by_collect_need_no_scan(self):
+        self.write('g.jpg')
+        self.index.add('g.jpg')
+
+        with self.count('scandir') as scandir:
+            self.index.refresh()
+
+        self.assertEqual(scandir.call_count, 0)
+
+
+class HashTest(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.index = Collect(self.directory).index
+
+        for fname, contents in (('a.jpg', 'same'), ('b.jpg', 'same'),
+                                ('c.jpg', 'longer')):
+            with open(os.path.join(self.directory, fname), 'w') as file:
+                file.write(contents)
+
+    def test_refresh_does_not_hash(self):
+        with mock.patch.object(_index, 'hash_file') as hash_file:
+            self.index.refresh()
+
+        hash_file.assert_not_called()
+        self.assertIsNone(self.index.get('a.jpg')['hash'])
+
+    def test_hash_missing(self):
+        self.index.refresh()
+        self.assertEqual(self.index.hash_missing(workers=2), 3)
+        self.assertEqual(self.index.hash_missing(), 0)
+        self.assertEqual(
+            self.index.get('a.jpg')['hash'],
+            _index.hash_file(os.path.join(self.directory, 'a.jpg')))
+
+    def test_find_hash_hashes_files_of_the_same_size(self):
+        self.index.refresh()
+        hash = _index.hash_file(os.path.join(self.directory, 'a.jpg'))
+
+        self.assertIn(self.index.find_hash(hash, len('same')),
+                      ('a.jpg', 'b.jpg'))
+        self.assertIsNone(self.index.get('c.jpg')['hash'])
+
+
+class ScanRandomTest(TempDirTestCase):
+    def test_scans_only_the_recorded_layout(self):
+        with open(os.path.join(self.directory, 'a.jpg'), 'w') as file:
+            file.write('a')
+
+        collect = Collect(self.directory)
+
+        with mock.patch.object(layout.os, 'scandir',
+                               wraps=os.scandir) as scandir:
+            self.assertEqual(collect.scan_random().basename, 'a.jpg')
+
+        self.assertEqual(scandir.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
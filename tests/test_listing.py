@@ -0,0 +1,135 @@
+import collections
+import json
+import os
+import subprocess
+import sys
+import time
+import unittest
+from unittest import mock
+
+from collect import config
+from collect.listing import ListingCache
+from collect.scheduler import Scheduler
+from .support import Response, ScriptedServer, Slow, TempDirTestCase
+
+# Serve a stale listing and exit while it is revalidated.
+_STALE_RUN = """
+import sys
+from collect import config
+from collect.listing import ListingCache
+config.REDDIT_API = sys.argv[1]
+print(ListingCache(sys.argv[2]).get('r/test')[0]['title'])
+"""
+
+
+def _listing(*names, after=None):
+    return json.dumps({'data': {'after': after, 'children': [
+        {'kind': 't3', 'data': {
+            'url': 'http://images.test/%s.jpg' % name, 'title': name,
+            'permalink': '/r/test/comments/%s/' % name}}
+        for name in names
+    ]}}).encode()
+
+
+class ListingCacheTest(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        Scheduler.share(None)
+        self.cache = ListingCache(os.path.join(self.directory, 'listings'))
+
+    def serve(self, *responses):
+        server = ScriptedServer(*responses)
+        patch = mock.patch.object(config, 'REDDIT_API', server.url + '/')
+        patch.start()
+        self.addCleanup(patch.stop)
+        return server
+
+    def age(self, api_url, seconds):
+        entry = self.cache.load(api_url)
+        self.cache.store(api_url, dict(entry, time=time.time() - seconds))
+
+    def test_cache_hit_skips_the_network(self):
+        with self.serve(Response(200, body=_listing('a', 'b'))) as server:
+            posts = self.cache.get('r/test')
+            self.assertEqual(self.cache.get('r/test'), posts)
+
+        self.assertEqual([post['title'] for post in posts], ['a', 'b'])
+        self.assertEqual(len(server.requests), 1)
+        self.assertTrue(server.requests[0][0].startswith('/r/test.json?'))
+
+    def test_revalidates_conditionally(self):
+        with self.serve(Response(200, {'ETag': '"1"'}, _listing('a')),
+                        Response(304)) as server:
+            self.cache.get('r/test')
+            self.age('r/test', config.LISTING_TTL + config.LISTING_STALE)
+            posts = self.cache.get('r/test')
+
+        self.assertEqual([post['title'] for post in posts], ['a'])
+        self.assertEqual(server.requests[1][1]['If-None-Match'], '"1"')
+        self.assertEqual(self.cache.freshness(self.cache.load('r/test')),
+                         'fresh')
+
+    def test_refused_listing(self):
+        for response in (Response(404), Response(403),
+                         Response(200, {'Content-Type': 'text/html'},
+                                  b'<html>blocked</html>'),
+                         Response(200, body=b'{"error": 429}'),
+                         Response(200, body=b'{"data": []}')):
+            with self.serve(response):
+                with self.assertRaises(ConnectionError):
+                    self.cache.get('r/private')
+
+    def test_serves_a_cached_listing_when_refused(self):
+        with self.serve(Response(200, body=_listing('a')), Response(403)):
+            self.cache.get('r/test')
+            self.age('r/test', config.LISTING_TTL + config.LISTING_STALE)
+
+            posts = self.cache.get('r/test')
+
+        self.assertEqual([post['title'] for post in posts], ['a'])
+
+    def test_stale_listing_is_revalidated_in_the_background(self):
+        with self.serve(Response(200, body=_listing('a')),
+                        Slow(0.2, Response(200, body=_listing('b')))):
+            self.cache.get('r/test')
+            self.age('r/test', config.LISTING_TTL)
+
+            posts = self.cache.get('r/test')
+            ListingCache.wait()
+
+        self.assertEqual([post['title'] for post in posts], ['a'])
+        self.assertEqual(
+            [post['title'] for post in self.cache.get('r/test')], ['b'])
+
+    def test_a_run_waits_for_revalidation_at_exit(self):
+        with self.serve(Response(200, body=_listing('a')),
+                        Slow(0.5, Response(200, body=_listing('b')))) \
+                as server:
+            self.cache.get('r/test')
+            self.age('r/test', config.LISTING_TTL)
+            output = subprocess.check_output([
+                sys.executable, '-c', _STALE_RUN, server.url + '/',
+                self.cache.directory,
+            ], universal_newlines=True)
+
+        self.assertEqual(output, 'a\n')
+        self.assertEqual(
+            [post['title'] for post in self.cache.get('r/test')], ['b'])
+
+    def test_memory_is_bounded(self):
+        memory = collections.OrderedDict()
+
+        with self.serve(*[Response(200, body=_listing('a'))] * 3), \
+                mock.patch.object(ListingCache, '_memory', memory), \
+                mock.patch.object(ListingCache, '_memory_size', 2):
+            for api_url in ('r/a', 'r/b', 'r/c'):
+                self.cache.get(api_url)
+            for api_url in ('r/a', 'r/b', 'r/c', 'r/a'):
+                self.cache.load(api_url)
+
+        self.assertEqual([self.cache._path(api_url) for api_url in
+                          ('r/c', 'r/a')], list(memory))
+
+
+if __name__ == '__main__':
+    unittest.main()
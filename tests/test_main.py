@@ -0,0 +1,93 @@
+import io
+import os
+import unittest
+from unittest import mock
+
+from benchmarks.server import FakeReddit
+
+from collect import background, config
+from collect.__main__ import CollectParser
+from collect.scheduler import Scheduler
+from .support import TempDirTestCase
+
+
+class ArgumentsTest(unittest.TestCase):
+    def parse(self, *argv):
+        return CollectParser(prog='collect').parse_command(list(argv))
+
+    def test_jobs_and_count(self):
+        args = self.parse('reddit', '--jobs', '2', '--count', '3')
+        self.assertEqual((args.workers, args.count), (2, 3))
+
+    def test_jobs_and_count_must_be_positive(self):
+        for argv in (('reddit', '--jobs', '0'), ('reddit', '--count', '0'),
+                     ('reddit', '-c', '-2'), ('prefetch', '-j', '0'),
+                     ('dedupe', '-j', 'two')):
+            with self.subTest(argv=argv), \
+                    mock.patch('sys.stderr', io.StringIO()) as stderr:
+                with self.assertRaises(SystemExit) as context:
+                    self.parse(*argv)
+
+            self.assertEqual(context.exception.code, 2)
+            self.assertIn('argument', stderr.getvalue())
+
+
+
+class SpoolTest(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        Scheduler.share(None)
+        self.server = FakeReddit(per_page=6, pages=1, gif_ratio=0,
+                                 image_size=1000).start()
+        self.addCleanup(self.server.stop)
+
+        for patch in (mock.patch.object(config, 'REDDIT_API',
+                                         self.server.url),
+                      mock.patch.object(background, 'start')):
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def run_collect(self, *argv):
+        """Run collect in this process and return the printed lines and the
+        parsed arguments."""
+        argv = ['--dir', self.directory, '--no-daemon', *argv,
+                '--url', 'r/fake', '--jobs', '1', '--no-probe']
+
+        with mock.patch('sys.stdout', io.StringIO()) as stdout:
+            args = CollectParser(prog='collect').parse_args(argv)
+
+        return stdout.getvalue().splitlines(), args
+
+    def spooled(self, args):
+        return args.collector.index.spool_counts(['r/fake']).get('r/fake', 0)
+
+    def test_reddit_serves_a_prefetched_image(self):
+        _, args = self.run_collect('prefetch', '--spool', '2')
+        self.assertEqual(self.spooled(args), 2)
+        n_requests = self.server.n_requests
+
+        paths, args = self.run_collect('reddit')
+
+        self.assertEqual(args.exit, 0)
+        self.assertEqual(len(paths), 1)
+        self.assertTrue(os.path.isfile(paths[0]))
+        self.assertEqual(self.server.n_requests, n_requests)
+        self.assertEqual(self.spooled(args), 1)
+        background.start.assert_called_once()
+
+    def test_no_spool_downloads_now(self):
+        self.run_collect('prefetch', '--spool', '2')
+        n_requests = self.server.n_requests
+
+        # --no-repeat leaves only new images to serve.
+        paths, args = self.run_collect('reddit', '--no-spool', '--no-repeat')
+
+        self.assertEqual(args.exit, 0)
+        self.assertEqual(len(paths), 1)
+        self.assertGreater(self.server.n_requests, n_requests)
+        self.assertEqual(self.spooled(args), 2)
+        background.start.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
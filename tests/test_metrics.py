@@ -0,0 +1,85 @@
+import io
+import json
+import os
+import unittest
+from unittest import mock
+
+from collect.__main__ import CollectParser
+from collect.metrics import Metrics
+from .support import TempDirTestCase
+
+
+class MetricsTest(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        Metrics.reset()
+        self.addCleanup(Metrics.reset)
+
+    def record(self):
+        with Metrics.phase('download'):
+            pass
+        with Metrics.phase('download'):
+            pass
+
+        Metrics.count('downloads')
+        Metrics.count('rejected', 2, reason='gif')
+        Metrics.count('rejected', reason='say "hi"\n')
+
+    def test_json(self):
+        self.record()
+        path = os.path.join(self.directory, 'metrics.json')
+        Metrics.write_json(path)
+
+        with open(path) as file:
+            snapshot = json.load(file)
+
+        self.assertEqual(set(snapshot),
+                         {'start', 'seconds', 'phases', 'counters'})
+        self.assertEqual(list(snapshot['phases']), ['download'])
+        self.assertEqual(snapshot['phases']['download']['count'], 2)
+        self.assertGreaterEqual(snapshot['phases']['download']['seconds'], 0)
+        self.assertEqual(snapshot['counters'], {
+            'downloads': 1, 'rejected': {'gif': 2, 'say "hi"\n': 1}})
+
+    def test_prometheus(self):
+        self.record()
+        path = os.path.join(self.directory, 'collect.prom')
+        Metrics.write_prometheus(path)
+
+        with open(path) as file:
+            text = file.read()
+
+        lines = text.splitlines()
+        self.assertTrue(text.endswith('\n'))
+        self.assertIn('# TYPE collect_last_run_seconds gauge', lines)
+        self.assertIn('collect_phase_count{phase="download"} 2', lines)
+        self.assertIn('collect_downloads 1', lines)
+        self.assertIn('collect_rejected{reason="gif"} 2', lines)
+        self.assertIn(r'collect_rejected{reason="say \"hi\"\n"} 1', lines)
+
+        for line in lines:
+            if not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                self.assertTrue(name.startswith('collect_'))
+                float(value)
+
+    def test_command_line(self):
+        json_path = os.path.join(self.directory, 'metrics.json')
+        prometheus_path = os.path.join(self.directory, 'collect.prom')
+
+        with mock.patch('sys.stdout', io.StringIO()):
+            CollectParser(prog='collect').parse_args([
+                '--dir', self.directory, '--no-daemon',
+                '--metrics', json_path, '--prometheus', prometheus_path,
+                'random'])
+
+        with open(json_path) as file:
+            self.assertIn('phases', json.load(file))
+
+        with open(prometheus_path) as file:
+            self.assertIn('# TYPE collect_last_run_seconds gauge\n',
+                          file.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+import os
+import sys
+import unittest
+
+from collect.path import Path
+from .support import TempDirTestCase
+
+
+def _listdir_tree(path):
+    """Generate the paths in path the way Path.tree did with os.listdir."""
+    yield path
+
+    for name in os.listdir(path):
+        item = os.path.join(path, name)
+
+        if os.path.isdir(item) and not os.path.islink(item):
+            yield from _listdir_tree(item)
+        else:
+            yield item
+
+
+class PathTest(unittest.TestCase):
+    def test_equality_and_hash_of_unnormalized_paths(self):
+        for path, normal in (('a//b/./c/../d', 'a/b/d'), ('a/b/', 'a/b'),
+                             ('./a', 'a'), ('', '.'), (None, '.'),
+                             ('/x/../y', '/y'), (Path('a//b'), 'a/b')):
+            with self.subTest(path=path):
+                self.assertEqual(Path(path), Path(normal))
+                self.assertEqual(Path(path), normal)
+                self.assertEqual(str(Path(path)), normal)
+                self.assertEqual(hash(Path(path)), hash(normal))
+                self.assertIn(Path(path), {Path(normal)})
+
+        self.assertEqual(Path('~/a'), os.path.expanduser('~/a'))
+        self.assertNotEqual(Path('a'), Path('b'))
+        self.assertNotEqual(Path('a'), 1)
+
+    def test_join_matches_normalizing_the_joined_path(self):
+        for base in ('.', 'a', 'a/b', '/', '/a'):
+            for name in ('c', 'c.jpg', '.c', '', '.', '..', 'c/d', 'c/',
+                         '/c', 'c/../d'):
+                joined = Path(os.path.join(base, name))
+
+                with self.subTest(base=base, name=name):
+                    for path in (Path(base) / name, Path(base).join(name)):
+                        self.assertEqual(str(path), str(joined))
+                        self.assertEqual(path.parts, joined.parts)
+                        self.assertEqual(path.basename, joined.basename)
+
+        self.assertEqual(Path('a').join('b', 'c'), Path('a/b/c'))
+        self.assertEqual(Path('a').join('b', '../c'), Path('a/c'))
+
+    def test_parent(self):
+        for path, parent in (('a/b', 'a'), ('a', '.'), ('.', '..'),
+                             ('..', '../..'), ('/a', '/'), ('/', '/')):
+            with self.subTest(path=path):
+                self.assertEqual(str(Path(path).parent), parent)
+                self.assertEqual(Path(path).parent,
+                                 Path(os.path.join(path, '..')))
+
+    def test_parts_are_split_when_first_used(self):
+        path = Path('/a/b.c')
+        self.assertIsNone(path._PathBase__parts)
+
+        self.assertEqual(path.parts, ('/', 'a', 'b.c'))
+        self.assertIs(path.parts, path._PathBase__parts)
+        self.assertEqual(path.basename, 'b.c')
+        self.assertEqual(path.split, ('b', 'c'))
+        self.assertEqual(Path('a/b').parts, ('a', 'b'))
+        self.assertEqual(Path('/').parts, ('/', ))
+        self.assertEqual(Path('/').basename, '/')
+
+    def test_hash_is_cached(self):
+        path = Path('a/b')
+        self.assertIsNone(path._PathBase__hash)
+
+        self.assertEqual(hash(path), hash('a/b'))
+        self.assertEqual(path._PathBase__hash, hash('a/b'))
+
+    def test_no_instance_dict(self):
+        with self.assertRaises(AttributeError):
+            Path('a').__dict__
+
+
+class WalkTest(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+
+        for name in ('a/b/c', 'd'):
+            os.makedirs(os.path.join(self.directory, name))
+        for name in ('x.jpg', 'a/y.jpg', 'a/b/z.jpg', 'a/b/c/w'):
+            open(os.path.join(self.directory, name), 'w').close()
+
+        os.symlink('a', os.path.join(self.directory, 'link'))
+        os.symlink('..', os.path.join(self.directory, 'a/b/up'))
+        self.path = Path(self.directory)
+
+    def test_tree_matches_listdir_order(self):
+        self.assertEqual([str(path) for path in self.path.tree],
+                         list(_listdir_tree(self.directory)))
+
+    def test_iter_matches_listdir_order(self):
+        self.assertEqual(list(self.path), [
+            os.path.join(self.directory, name)
+            for name in os.listdir(self.directory)])
+
+    def test_filter_and_max_depth(self):
+        files = self.path.walk(lambda entry: entry.is_file())
+        self.assertEqual(
+            sorted(os.path.relpath(path, self.directory) for path in files),
+            ['a/b/c/w', 'a/b/z.jpg', 'a/y.jpg', 'x.jpg'])
+
+        shallow = self.path.walk(max_depth=2, entries=True)
+        self.assertEqual(
+            sorted(os.path.relpath(entry.path, self.directory)
+                   for entry in shallow),
+            ['a', 'a/b', 'a/y.jpg', 'd', 'link', 'x.jpg'])
+
+    def test_follows_links_to_each_directory_once(self):
+        paths = [os.path.relpath(path, self.directory)
+                 for path in self.path.walk(follow_links=True)]
+        names = [os.path.basename(path) for path in paths]
+
+        self.assertEqual(len(paths), len(set(paths)))
+        self.assertIn('link/b/up', paths)
+        self.assertEqual(sorted(name for name in names if '.' in name),
+                         ['x.jpg', 'y.jpg', 'z.jpg'])
+
+    def test_deeper_than_the_recursion_limit(self):
+        deep = root = os.path.join(self.directory, 'deep')
+        os.mkdir(root)
+        dirs = []
+
+        for _ in range(sys.getrecursionlimit() + 10):
+            deep = os.path.join(deep, 'd')
+            os.mkdir(deep)
+            dirs.append(deep)
+
+        def remove():
+            # shutil.rmtree() recurses too.
+            for path in reversed(dirs):
+                os.rmdir(path)
+
+        self.addCleanup(remove)
+
+        self.assertEqual(list(Path(root).walk()), dirs)
+        self.assertEqual(list(Path(root).tree), [root] + dirs)
+
+if __name__ == '__main__':
+    unittest.main()
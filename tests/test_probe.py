@@ -0,0 +1,85 @@
+import json
+import os
+import socket
+import time
+import unittest
+from unittest import mock
+
+from collect import probe
+from .support import TempDirTestCase
+
+
+def _closed_port():
+    """Return a localhost port that nothing listens on."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class ProbeTest(unittest.TestCase):
+    def setUp(self):
+        self.server = socket.socket()
+        self.addCleanup(self.server.close)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen()
+        self.port = self.server.getsockname()[1]
+
+    def test_listening_socket(self):
+        self.assertTrue(probe.probe([('127.0.0.1', self.port)], deadline=2))
+
+    def test_any_host_will_do(self):
+        hosts = [('127.0.0.1', _closed_port()), ('127.0.0.1', self.port)]
+        self.assertTrue(probe.probe(hosts, deadline=2))
+
+    def test_refused(self):
+        self.assertFalse(probe.probe([('127.0.0.1', _closed_port())],
+                                     deadline=2))
+
+    def test_unresolvable(self):
+        self.assertFalse(probe.probe([('host.invalid', 443)], deadline=1))
+
+    def test_hung_resolver_keeps_the_deadline(self):
+        def getaddrinfo(*args, **kwargs):
+            time.sleep(5)
+            raise socket.gaierror('timed out')
+
+        with mock.patch.object(socket, 'getaddrinfo', getaddrinfo):
+            start = time.monotonic()
+            result = probe.probe([('example.com', 443)], deadline=0.2)
+            elapsed = time.monotonic() - start
+
+        self.assertFalse(result)
+        self.assertLess(elapsed, 1)
+
+
+class ConnectedTest(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cache_path = os.path.join(self.directory, 'probe.json')
+
+    def test_caches_the_result(self):
+        with mock.patch.object(probe, 'probe', return_value=False) as probe_:
+            self.assertFalse(probe.connected(self.cache_path))
+            self.assertFalse(probe.connected(self.cache_path))
+
+        self.assertEqual(probe_.call_count, 1)
+
+        with mock.patch.object(probe, 'probe', return_value=True) as probe_:
+            self.assertTrue(probe.connected(self.cache_path, ttl=0))
+
+        self.assertEqual(probe_.call_count, 1)
+
+    def test_malformed_cache(self):
+        for contents in ('not json', '[]', '{}', '{"time": "soon"}'):
+            with open(self.cache_path, 'w') as file:
+                file.write(contents)
+
+            with mock.patch.object(probe, 'probe', return_value=True):
+                self.assertTrue(probe.connected(self.cache_path))
+
+            with open(self.cache_path) as file:
+                self.assertTrue(json.load(file)['connected'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import io
+import os
+import pstats
+import unittest
+from unittest import mock
+
+from collect import config
+from collect.__main__ import CollectParser
+from .support import TempDirTestCase
+
+
+class ProfileTest(TempDirTestCase):
+    def profile(self, *argv):
+        """Run collect random with argv and return the paths of the profiles
+        written, by their file extension."""
+        with mock.patch('sys.stdout', io.StringIO()):
+            CollectParser(prog='collect').parse_args([
+                '--dir', self.directory, '--no-daemon', *argv, 'random'])
+
+        profile_dir = os.path.join(self.directory, config.STATE_DIRNAME,
+                                   'profiles')
+        paths = {}
+
+        for name in os.listdir(profile_dir):
+            self.assertTrue(name.startswith('random-'))
+            paths[os.path.splitext(name)[1]] = os.path.join(profile_dir, name)
+
+        return paths
+
+    def test_cpu_profile(self):
+        paths = self.profile('--profile')
+
+        self.assertEqual(set(paths), {'.pstats', '.callgrind'})
+        self.assertEqual(paths['.pstats'][:-len('.pstats')],
+                         paths['.callgrind'][:-len('.callgrind')])
+        self.assertTrue(pstats.Stats(paths['.pstats']).stats)
+
+        with open(paths['.callgrind']) as file:
+            text = file.read()
+
+        self.assertTrue(text.startswith('# callgrind format\n'))
+        self.assertIn('\nfn=', text)
+
+    def test_memory_profile(self):
+        paths = self.profile('--profile-memory', '5')
+
+        self.assertEqual(list(paths), ['.txt'])
+        self.assertTrue(paths['.txt'].endswith('-memory.txt'))
+
+        with open(paths['.txt']) as file:
+            lines = file.read().splitlines()
+
+        self.assertTrue(lines[0].startswith('Traced memory: '))
+        self.assertTrue(lines[1].startswith('Top '))
+        self.assertLessEqual(len(lines[2:]), 5)
+        self.assertTrue(lines[2].startswith('  1. '))
+
+    def test_both_profiles(self):
+        paths = self.profile('--profile', '--profile-memory', '3')
+        self.assertEqual(set(paths), {'.pstats', '.callgrind', '.txt'})
+
+
+if __name__ == '__main__':
+    unittest.main()
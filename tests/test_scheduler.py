@@ -0,0 +1,58 @@
+import os
+import unittest
+from unittest import mock
+
+import requests
+
+from collect import config
+from collect.scheduler import Scheduler
+from collect.session import Session
+from .support import TempDirTestCase
+
+
+class SchedulerTest(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        Scheduler.share(self.directory)
+        self.addCleanup(Scheduler.share, None)
+        self.state_path = os.path.join(self.directory, config.STATE_DIRNAME,
+                                       'hosts.json')
+
+        for name, value in (('rates', {'slow.test': 0.001}), ('burst', 1)):
+            patch = mock.patch.object(Scheduler, name, value)
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_unlimited_hosts_leave_the_state_file_alone(self):
+        self.assertEqual(Scheduler.reserve('http://fast.test/a'), 0)
+        mtime = os.stat(self.state_path).st_mtime_ns
+
+        with mock.patch('time.time', return_value=1e10):
+            self.assertEqual(Scheduler.reserve('http://fast.test/b'), 0)
+
+        self.assertEqual(os.stat(self.state_path).st_mtime_ns, mtime)
+
+        with open(self.state_path) as file:
+            self.assertEqual(file.read(), '{}')
+
+    def test_refund(self):
+        self.assertEqual(Scheduler.reserve('http://slow.test/a'), 0)
+        delay = Scheduler.reserve('http://slow.test/b')
+        self.assertAlmostEqual(delay, 1000, delta=1)
+
+        Scheduler.refund('http://slow.test/b')
+        self.assertAlmostEqual(Scheduler.reserve('http://slow.test/b'),
+                               delay, delta=1)
+
+    def test_session_refunds_a_request_it_gives_up_on(self):
+        Scheduler.reserve('http://slow.test/a')
+
+        with self.assertRaises(requests.exceptions.RetryError):
+            Session(max_wait=1).get('http://slow.test/b')
+
+        self.assertAlmostEqual(Scheduler.reserve('http://slow.test/b'),
+                               1000, delta=1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import time
+import unittest
+
+import requests
+
+from collect.scheduler import Scheduler
+from collect.session import Session
+from .support import DROP, HANG, Response, ScriptedServer
+
+
+class SessionTest(unittest.TestCase):
+    def setUp(self):
+        Scheduler.share(None)
+
+    def test_retries_server_errors(self):
+        with ScriptedServer(Response(503), Response(502),
+                            Response(200, body=b'ok')) as server:
+            res = Session(retries=3, backoff=0).get(server.url)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.content, b'ok')
+        self.assertEqual(len(server.requests), 3)
+
+    def test_retries_dropped_connections(self):
+        with ScriptedServer(DROP, Response(200, body=b'ok')) as server:
+            res = Session(retries=3, backoff=0).get(server.url)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(server.requests), 2)
+
+    def test_gives_up_after_retries(self):
+        with ScriptedServer(Response(500)) as server:
+            res = Session(retries=2, backoff=0).get(server.url)
+
+        self.assertEqual(res.status_code, 500)
+        self.assertEqual(len(server.requests), 3)
+
+        with ScriptedServer(DROP) as server:
+            with self.assertRaises(requests.ConnectionError):
+                Session(retries=2, backoff=0).get(server.url)
+
+        self.assertEqual(len(server.requests), 3)
+
+    def test_does_not_retry_client_errors(self):
+        with ScriptedServer(Response(404)) as server:
+            res = Session(retries=3, backoff=0).get(server.url)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(len(server.requests), 1)
+
+    def test_waits_for_retry_after(self):
+        with ScriptedServer(Response(503, {'Retry-After': '1'}),
+                            Response(200)) as server:
+            start = time.monotonic()
+            res = Session(retries=1, backoff=0).get(server.url)
+            elapsed = time.monotonic() - start
+
+        self.assertEqual(res.status_code, 200)
+        self.assertGreaterEqual(elapsed, 0.9)
+
+    def test_gives_up_on_long_retry_after(self):
+        with ScriptedServer(Response(429, {'Retry-After': '60'}),
+                            Response(200)) as server:
+            with self.assertRaises(requests.exceptions.RetryError):
+                Session(retries=1, backoff=0, max_wait=1).get(server.url)
+
+        self.assertEqual(len(server.requests), 1)
+
+    def test_times_out_hung_hosts(self):
+        with ScriptedServer(HANG, Response(200)) as server:
+            res = Session(timeout=0.2, retries=1, backoff=0).get(server.url)
+
+        self.assertEqual(res.status_code, 200)
+
+        with ScriptedServer(HANG) as server:
+            with self.assertRaises(requests.Timeout):
+                Session(timeout=0.2, retries=0).get(server.url)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+import unittest
+
+from benchmarks.startup import NETWORK_MODULES, run_importtime, spool_image
+from .support import TempDirTestCase
+
+# Modules that only the subcommands doing the work should load.
+HEAVY_MODULES = frozenset({'requests', 'sqlite3', 'asyncio'})
+
+
+class StartupTest(TempDirTestCase):
+    def imported(self, *argv):
+        _, _, modules = run_importtime(list(argv))
+        return modules
+
+    def test_help_imports_nothing_heavy(self):
+        for argv in (['--help'], ['reddit', '--help'], ['random', '-h']):
+            with self.subTest(argv=argv):
+                self.assertFalse(self.imported(*argv) & HEAVY_MODULES)
+
+    def test_offline_subcommands_import_no_network_modules(self):
+        spool_image(self.directory, 'r/spooled')
+
+        for argv in (['reddit', '--url', 'r/spooled'], ['random'],
+                     ['clear']):
+            with self.subTest(argv=argv):
+                modules = self.imported('--dir', self.directory,
+                                        '--no-daemon', *argv)
+                self.assertIn('collect', modules)
+                self.assertFalse(modules & NETWORK_MODULES)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import os
+import unittest
+
+from collect import config, trash
+from collect.collect import Collect
+from .support import TempDirTestCase
+
+
+class EmptyTest(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.folder = os.path.join(self.directory, 'folder')
+        os.makedirs(os.path.join(self.folder, config.STATE_DIRNAME))
+        os.makedirs(os.path.join(self.folder, 'sub', 'deeper'))
+
+        for name in ('a.jpg', 'b.jpg', os.path.join('sub', 'deeper', 'c')):
+            with open(os.path.join(self.folder, name), 'w') as file:
+                file.write(name)
+
+    def contents(self, path):
+        return sorted(os.listdir(path))
+
+    def test_empties_nested_folders(self):
+        old = trash.empty(self.folder)
+        self.assertEqual(self.contents(self.folder), [config.STATE_DIRNAME])
+        self.assertEqual(self.contents(old), ['a.jpg', 'b.jpg', 'sub'])
+        trash.delete_tree(old)
+        self.assertFalse(os.path.exists(old))
+
+    def test_clear_through_a_symbolic_link(self):
+        link = os.path.join(self.directory, 'link')
+        os.symlink(self.folder, link)
+        Collect(link).remove_contents(wait=True)
+
+        self.assertTrue(os.path.islink(link))
+        self.assertEqual(os.readlink(link), self.folder)
+        self.assertEqual(self.contents(self.folder), [config.STATE_DIRNAME])
+        self.assertEqual(self.contents(self.directory), ['folder', 'link'])
+        self.assertEqual(trash.leftovers(link), [])
+
+
+if __name__ == '__main__':
+    unittest.main()